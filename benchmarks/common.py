@@ -0,0 +1,91 @@
+import datetime
+import json
+import os
+import platform
+import sys
+
+# benchmark the checkout, not an installed release
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+
+
+def environment():
+    """
+    :return: dict describing where the results were measured
+    """
+    return {
+        "time": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+    }
+
+
+def save_results(path: str, results: list, metrics: dict, **meta):
+    """
+    write results as json
+    :param path: file name, "-" for stdout
+    :param results: list of dict, every dict has name and size keys
+    :param metrics: metrics compared by default, see compare
+    :param meta: extra settings of the run stored next to the environment
+    """
+    data = {"meta": dict(environment(), metrics=metrics, **meta), "results": results}
+    if path == "-":
+        json.dump(data, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+        return
+    with open(path, "w") as file:
+        json.dump(data, file, indent=2)
+
+
+def load_results(path: str):
+    """
+    :return: tuple of meta dict and results list
+    """
+    with open(path, "r") as file:
+        data = json.load(file)
+    return data["meta"], data["results"]
+
+
+def compare(results: list, baseline: list, metrics: dict, threshold: float):
+    """
+    compare results with a baseline of the same benchmark
+    :param results: list of dict of the current run
+    :param baseline: list of dict of the previous run
+    :param metrics: metric name -> True when higher is better, False when lower is better
+    :param threshold: relative change of a metric that counts as regression, e.g. 0.1 for 10%
+    :return: list of (name, size, metric, old, new, change, regressed), change is relative and
+             positive when the metric got better
+    """
+    old_results = {(result["name"], result["size"]): result for result in baseline}
+    rows = []
+    for result in results:
+        old = old_results.get((result["name"], result["size"]))
+        if old is None:
+            continue
+        for metric, higher_is_better in metrics.items():
+            old_value = old.get(metric)
+            new_value = result.get(metric)
+            if old_value is None or new_value is None:
+                continue
+            if old_value == 0:
+                change = 0.0 if new_value == 0 else (1.0 if higher_is_better else -1.0)
+            else:
+                change = (new_value - old_value if higher_is_better else old_value - new_value) / old_value
+            rows.append((result["name"], result["size"], metric, old_value, new_value, change, change < -threshold))
+    return rows
+
+
+def print_comparison(rows: list, file=sys.stderr):
+    """
+    print rows of compare as a table
+    :return: True when no metric regressed
+    """
+    passed = True
+    file.write("{:<26} {:>9} {:<18} {:>14} {:>14} {:>8}\n".format("name", "size", "metric", "baseline",
+                                                                  "current", "change"))
+    for name, size, metric, old_value, new_value, change, regressed in rows:
+        passed = passed and not regressed
+        file.write("{:<26} {:>9} {:<18} {:>14.6g} {:>14.6g} {:>+8.1%}{}\n".format(
+            name, size, metric, old_value, new_value, change, "  REGRESSION" if regressed else ""))
+    return passed
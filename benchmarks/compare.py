@@ -0,0 +1,40 @@
+"""
+compare two result files of the same benchmark script without running it, e.g. in a release check
+
+    python benchmarks/compare.py micro-baseline.json micro.json --threshold 0.1
+
+the exit code is 1 when a metric regressed more than --threshold
+"""
+import argparse
+import sys
+from common import load_results, compare, print_comparison
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="compare benchmark results with a baseline")
+    parser.add_argument("baseline", help="json file of the previous run")
+    parser.add_argument("results", help="json file of the current run")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative change that fails the comparison")
+    parser.add_argument("--metric", action="append", default=[],
+                        help="metric to compare as name:higher or name:lower, default the metrics of the results file")
+    options = parser.parse_args(argv)
+
+    _, baseline = load_results(options.baseline)
+    meta, results = load_results(options.results)
+    metrics = meta.get("metrics", {})
+    if options.metric:
+        metrics = {}
+        for item in options.metric:
+            name, _, direction = item.partition(":")
+            if direction not in ("higher", "lower"):
+                parser.error("metric must be name:higher or name:lower")
+            metrics[name] = direction == "higher"
+    rows = compare(results, baseline, metrics, options.threshold)
+    if not rows:
+        sys.stderr.write("no common results to compare\n")
+        return 1
+    return 0 if print_comparison(rows) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,251 @@
+"""
+micro benchmarks of the pure python codecs: packet checksum, buffer hash, table decoding, time conversion,
+string fields and user encoding, on synthetic tables of 1k, 100k and 1M records
+
+    python benchmarks/micro.py --output micro.json
+    python benchmarks/micro.py --baseline micro.json --threshold 0.15
+
+the metric is ns per record (fastest of --repeat runs), with --baseline the exit code is 1 when it grew
+more than --threshold
+"""
+import argparse
+import datetime
+import random
+import sys
+import timeit
+from common import save_results, load_results, compare, print_comparison
+from fpmachine.models import UserInfo, AttLog, OpLog, FPInfo
+from fpmachine.network_utils import packet, DataBuffer
+from fpmachine.utils import device_cmd, datetime_to_number, number_to_datetime, get_null_term_str
+
+ENCODING = "latin-1"
+# device data chunk size
+CHUNK_SIZE = 0xFFC0
+# templates of the fingerprint algorithms 9 and 10 are some hundred bytes to 1.6k
+TEMPLATE_SIZES = (350, 1600)
+# fingerprint tables larger than this do not fit in memory comfortably and no device holds them
+FP_SCALE_MAX = 100000
+METRICS = {"ns_per_record": False}
+
+
+class Fixtures(object):
+    def __init__(self, scale: int, seed: int = 0):
+        """
+        synthetic device tables of scale records, every table is built on first use
+        :param scale: records per table
+        :param seed: seed of the generated values
+        """
+        self.scale = scale
+        self._seed = seed
+        self._cache = {}
+
+    def _get(self, name, build):
+        if name not in self._cache:
+            self._cache[name] = build(random.Random("{}-{}".format(self._seed, name)))
+        return self._cache[name]
+
+    def _times(self, rnd):
+        # one year of punches, the device numbers have 31 days in every month so they are made from real dates
+        start = datetime.datetime(2021, 1, 1)
+        return [datetime_to_number(start + datetime.timedelta(seconds=rnd.randrange(365 * 86400)))
+                for _ in range(self.scale)]
+
+    @property
+    def user_models(self):
+        def build(rnd):
+            users = []
+            for serial in range(1, self.scale + 1):
+                user = UserInfo(ENCODING)
+                user.id = serial & 0xFFFF
+                user.name = "user {}".format(serial)
+                user.password = str(rnd.randrange(10000)) if serial % 10 == 0 else ""
+                user.card_no = rnd.randrange(1 << 24)
+                user.person_id = str(100000 + serial)
+                users.append(user)
+            return users
+        return self._get("user_models", build)
+
+    @property
+    def users(self):
+        """
+        user table, 72 byte records
+        """
+        return self._get("users", lambda _: bytes(UserInfo.to_buffer(self.user_models)))
+
+    @property
+    def att_logs(self):
+        """
+        attendance table, 40 byte records
+        """
+        def build(rnd):
+            logs = []
+            for number in self._times(rnd):
+                log = AttLog()
+                log.serial = rnd.randrange(1, 3000)
+                log.person_id = str(100000 + log.serial)
+                log.verify_mode = 1
+                log._time = number
+                log.in_out = rnd.randrange(2)
+                log.encoding = ENCODING
+                logs.append(log)
+            return bytes(AttLog.to_buffer(logs))
+        return self._get("att_logs", build)
+
+    @property
+    def op_logs(self):
+        """
+        operation log table, 16 byte records
+        """
+        def build(rnd):
+            logs = []
+            for number in self._times(rnd):
+                log = OpLog()
+                log.op_id = rnd.randrange(30)
+                log._time = number
+                log.param_1 = rnd.randrange(3000)
+                logs.append(log)
+            return bytes(OpLog.to_buffer(logs))
+        return self._get("op_logs", build)
+
+    @property
+    def fps(self):
+        """
+        fingerprint table, length prefixed records of variable size
+        """
+        def build(rnd):
+            return bytes(FPInfo.to_buffer([FPInfo(serial & 0xFFFF, serial % 10, 1,
+                                                  rnd.getrandbits(8 * size).to_bytes(size, "little"))
+                                           for serial, size in ((serial, rnd.randrange(*TEMPLATE_SIZES))
+                                                                for serial in range(1, self.scale + 1))]))
+        return self._get("fps", build)
+
+    @property
+    def times(self):
+        return self._get("times", self._times)
+
+    @property
+    def person_ids(self):
+        """
+        the null padded 24 byte person id fields of the user table
+        """
+        users = self.users
+        return self._get("person_ids", lambda _: [users[offset + 48: offset + 72]
+                                                  for offset in range(0, len(users), 72)])
+
+    @property
+    def packets(self):
+        """
+        data packets carrying the user table the way the device sends it
+        """
+        users = self.users
+        return self._get("packets", lambda _: [
+            bytes(packet(cmd=device_cmd["recv_buff_content"], serial=index & 0xFFFF, payload=users[offset: offset + CHUNK_SIZE]))
+            for index, offset in enumerate(range(0, len(users), CHUNK_SIZE))])
+
+
+def _checksum(fixtures):
+    calculate_checksum = packet.calculate_checksum
+    packets = fixtures.packets
+    return lambda: [calculate_checksum(data) for data in packets]
+
+
+def _hash(fixtures):
+    return DataBuffer(ENCODING, fixtures.att_logs).__hash__
+
+
+def _decode(table: str):
+    def setup(fixtures):
+        buffer = DataBuffer(ENCODING, getattr(fixtures, table))
+        return lambda: list(getattr(buffer, table))
+    return setup
+
+
+def _number_to_datetime(fixtures):
+    times = fixtures.times
+    return lambda: [number_to_datetime(number) for number in times]
+
+
+def _get_null_term_str(fixtures):
+    fields = fixtures.person_ids
+    return lambda: [get_null_term_str(field, ENCODING) for field in fields]
+
+
+def _user_bytes(fixtures):
+    users = fixtures.user_models
+    return lambda: [bytes(user) for user in users]
+
+
+# name -> (largest scale or None, function that takes Fixtures and returns the timed callable)
+BENCHMARKS = {
+    "packet.calculate_checksum": (None, _checksum),
+    "DataBuffer.__hash__": (None, _hash),
+    "DataBuffer.users": (None, _decode("users")),
+    "DataBuffer.att_logs": (None, _decode("att_logs")),
+    "DataBuffer.op_logs": (None, _decode("op_logs")),
+    "DataBuffer.fps": (FP_SCALE_MAX, _decode("fps")),
+    "number_to_datetime": (None, _number_to_datetime),
+    "get_null_term_str": (None, _get_null_term_str),
+    "UserInfo.__bytes__": (None, _user_bytes),
+}
+
+
+def run_benchmark(name: str, fixtures: Fixtures, repeat: int):
+    """
+    time one benchmark, the callable is looped until a run takes at least 0.2 seconds
+    :return: dict of the result
+    """
+    function = BENCHMARKS[name][1](fixtures)
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    seconds = min(timer.repeat(repeat, number)) / number
+    return {
+        "name": name,
+        "size": fixtures.scale,
+        "records": fixtures.scale,
+        "seconds": seconds,
+        "ns_per_record": seconds * 1e9 / fixtures.scale,
+    }
+
+
+def _int_list(text: str):
+    return [int(item) for item in text.split(",") if item]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="micro benchmarks of the record codecs")
+    parser.add_argument("--benchmarks", default=",".join(BENCHMARKS),
+                        help="comma separated names, default all of: " + ", ".join(BENCHMARKS))
+    parser.add_argument("--scales", type=_int_list, default=[1000, 100000, 1000000],
+                        help="records per table (default 1000,100000,1000000), fingerprint tables stop at {}".format(
+                            FP_SCALE_MAX))
+    parser.add_argument("--repeat", type=int, default=5, help="runs per benchmark, the fastest counts")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic tables")
+    parser.add_argument("--output", default="-", help="json file of the results, default stdout")
+    parser.add_argument("--baseline", help="json file of a previous run to compare with")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative growth of ns/record that fails")
+    options = parser.parse_args(argv)
+
+    names = options.benchmarks.split(",")
+    for name in names:
+        if name not in BENCHMARKS:
+            parser.error("unknown benchmark {}".format(name))
+    results = []
+    for scale in options.scales:
+        fixtures = Fixtures(scale, options.seed)
+        for name in names:
+            max_scale = BENCHMARKS[name][0]
+            if max_scale is not None and scale > max_scale:
+                continue
+            result = run_benchmark(name, fixtures, options.repeat)
+            results.append(result)
+            sys.stderr.write("{:<26} {:>8} {:>12.1f} ns/record\n".format(name, scale, result["ns_per_record"]))
+    save_results(options.output, results, METRICS, repeat=options.repeat, seed=options.seed)
+    if options.baseline:
+        _, baseline = load_results(options.baseline)
+        if not print_comparison(compare(results, baseline, METRICS, options.threshold)):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
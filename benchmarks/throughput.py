@@ -0,0 +1,186 @@
+"""
+end to end throughput of the client against the local emulator (fpmachine.emulator)
+
+every case runs the client in a fresh process, so peak rss belongs to the client alone, while the
+emulator counts the round trips and bytes on the wire
+
+    python benchmarks/throughput.py --output throughput.json
+    python benchmarks/throughput.py --latency 0.002 --bandwidth 10000000 --baseline throughput.json
+
+with --baseline the exit code is 1 when a metric regressed more than --threshold
+"""
+import argparse
+import multiprocessing
+import sys
+import time
+from common import save_results, load_results, compare, print_comparison
+from fpmachine import devices, models
+from fpmachine.emulator import Emulator, EmulatedDevice
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+COMM_KEY = 2022
+METRICS = {"records_per_sec": True, "round_trips": False, "peak_rss_mb": False}
+
+
+def _fp_infos(size: int, template_size: int):
+    return [models.FPInfo(serial, 0, 1, bytes([serial & 0xFF]) * template_size) for serial in range(1, size + 1)]
+
+
+def _set_fp(device, fp_infos):
+    for fp_info in fp_infos:
+        device.set_fp(fp_info)
+    return len(fp_infos)
+
+
+# name -> (download or upload, arguments of EmulatedDevice.populate, inputs prepared by the client before timing,
+#          operation that returns the number of records, downloads decode every record)
+BENCHMARKS = {
+    "get_users": ("download", lambda size: {"users": size}, None,
+                  lambda device, _: len(list(device.get_users()))),
+    "get_att_logs": ("download", lambda size: {"users": 100, "att_logs": size}, None,
+                     lambda device, _: len(list(device.get_att_logs()))),
+    "get_op_logs": ("download", lambda size: {"op_logs": size}, None,
+                    lambda device, _: len(list(device.get_op_logs()))),
+    "get_fps": ("download", lambda size: {"users": size, "fps_per_user": 1}, None,
+                lambda device, _: len(list(device.get_fps()))),
+    "set_fp": ("upload", lambda size: {"users": size}, _fp_infos, _set_fp),
+    "set_fps": ("upload", lambda size: {"users": size}, _fp_infos,
+                lambda device, fp_infos: device.set_fps(fp_infos) or len(fp_infos)),
+}
+
+
+def _peak_rss_mb():
+    # ru_maxrss survives exec on linux and would report the peak of the parent process
+    try:
+        with open("/proc/self/status", "r") as file:
+            for line in file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macos
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _client(conn, port: int, model: str, name: str, size: int, template_size: int):
+    """
+    child process: connect, wait for the parent to reset the emulator stats, run the operation once
+    """
+    _, _, inputs, operation = BENCHMARKS[name]
+    args = inputs(size, template_size) if inputs else None
+    device = getattr(devices, model)("127.0.0.1", port, "latin-1")
+    device.connect(COMM_KEY)
+    conn.send(_peak_rss_mb())
+    conn.recv()
+    start = time.perf_counter()
+    records = operation(device, args)
+    seconds = time.perf_counter() - start
+    conn.send((seconds, records, _peak_rss_mb()))
+    conn.recv()
+    device.disconnect()
+
+
+def run_case(name: str, size: int, options):
+    """
+    run one benchmark options.repeat times, the fastest run counts
+    :return: dict of the result
+    """
+    direction, populate, _, _ = BENCHMARKS[name]
+    device = EmulatedDevice.populate(template_size=options.template_size, comm_key=COMM_KEY, **populate(size))
+    device.user_max = max(device.user_max, size)
+    device.finger_max = max(device.finger_max, size)
+    device.record_max = max(device.record_max, size)
+    context = multiprocessing.get_context("spawn")
+    best = None
+    peak = rss_before = None
+    with Emulator(device, model=options.model, latency=options.latency, bandwidth=options.bandwidth) as emulator:
+        for _ in range(options.repeat):
+            parent_conn, child_conn = context.Pipe()
+            process = context.Process(target=_client, args=(child_conn, emulator.port, options.model, name, size,
+                                                            options.template_size))
+            process.start()
+            child_conn.close()
+            try:
+                rss_start = parent_conn.recv()
+                emulator.reset_stats()
+                parent_conn.send(True)
+                seconds, records, rss_peak = parent_conn.recv()
+                stats = dict(emulator.stats)
+                parent_conn.send(True)
+            except EOFError:
+                raise Exception("client of {} {} failed".format(name, size))
+            finally:
+                process.join()
+            if best is None or seconds < best[0]:
+                best = seconds, records, stats
+            if rss_peak is not None:
+                peak = rss_peak if peak is None else max(peak, rss_peak)
+                rss_before = rss_start if rss_before is None else min(rss_before, rss_start)
+    seconds, records, stats = best
+    wire_bytes = stats["bytes_sent"] if direction == "download" else stats["bytes_received"]
+    return {
+        "name": name,
+        "size": size,
+        "records": records,
+        "seconds": seconds,
+        "records_per_sec": records / seconds if seconds else 0.0,
+        "bytes": wire_bytes,
+        "mb_per_sec": wire_bytes / seconds / 1e6 if seconds else 0.0,
+        "requests": stats["requests"],
+        "round_trips": stats["round_trips"],
+        "peak_rss_mb": peak,
+        "rss_growth_mb": None if peak is None else peak - rss_before,
+    }
+
+
+def _int_list(text: str):
+    return [int(item) for item in text.split(",") if item]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="client throughput against the local device emulator")
+    parser.add_argument("--benchmarks", default=",".join(BENCHMARKS),
+                        help="comma separated names, default all of: " + ", ".join(BENCHMARKS))
+    parser.add_argument("--sizes", type=_int_list, default=[1000, 10000, 100000],
+                        help="table sizes of the downloads (default 1000,10000,100000 = record_max)")
+    parser.add_argument("--upload-sizes", type=_int_list, default=[100, 1000, 3000],
+                        help="templates per upload (default 100,1000,3000 = finger_max)")
+    parser.add_argument("--template-size", type=int, default=512, help="bytes per fingerprint template")
+    parser.add_argument("--model", default="ZMM220_TFT", choices=["ZMM100_TFT", "ZMM220_TFT"])
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every round trip")
+    parser.add_argument("--bandwidth", type=float, default=None, help="bytes per second, default unlimited")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case, the fastest counts")
+    parser.add_argument("--output", default="-", help="json file of the results, default stdout")
+    parser.add_argument("--baseline", help="json file of a previous run to compare with")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative change that fails the comparison")
+    options = parser.parse_args(argv)
+
+    results = []
+    for name in options.benchmarks.split(","):
+        if name not in BENCHMARKS:
+            parser.error("unknown benchmark {}".format(name))
+        sizes = options.sizes if BENCHMARKS[name][0] == "download" else options.upload_sizes
+        for size in sizes:
+            result = run_case(name, size, options)
+            results.append(result)
+            sys.stderr.write("{:<14} {:>7} {:>12.0f} rec/s {:>8.2f} MB/s {:>6} round trips {:>8.1f} MB rss\n".format(
+                name, size, result["records_per_sec"], result["mb_per_sec"], result["round_trips"],
+                result["peak_rss_mb"] or 0))
+    save_results(options.output, results, METRICS, model=options.model, latency=options.latency,
+                 bandwidth=options.bandwidth, template_size=options.template_size, repeat=options.repeat)
+    if options.baseline:
+        _, baseline = load_results(options.baseline)
+        if not print_comparison(compare(results, baseline, METRICS, options.threshold)):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,5 @@
 import os
+import atexit
 import logging
 import logging.handlers
 
@@ -20,4 +21,11 @@ def setup_logger():
         logger.setLevel(logging.DEBUG)
         logger.addHandler(handler)
 
-setup_logger()
\ No newline at end of file
+setup_logger()
+
+if debug:
+    # every packet of every device in binary form, read it with: python -m fpmachine.capture wire.fpcap
+    from .capture import WireCapture, set_default_capture
+    _capture = WireCapture(os.path.join(os.environ.get("LOG_PATH") or "", "wire.fpcap"))
+    set_default_capture(_capture)
+    atexit.register(_capture.close)
@@ -0,0 +1,714 @@
+import asyncio
+import struct
+import time
+import logging
+from contextlib import asynccontextmanager
+from .utils import device_cmd, device_event, datetime_from_bytes, hash_commkey, BatchState
+from .network_utils import packet, DataBuffer, BufferHash, RecordStream
+from .instrumentation import CommandTracker, get_default_collector
+from .capture import get_default_capture, SENT, RECEIVED, OPENED
+from . import models, debug
+
+
+class AsyncClientConnection(object):
+    def __init__(self, host: str, port: int, timeout: float = 20):
+        """
+        asyncio version of ClientConnection
+        :param host: ip address or dns name
+        :param port: port number
+        :param timeout: seconds to wait for connect and for every response
+        """
+        self._serial = None
+        self._secret_key = None
+        self._host = host
+        self._port = port
+        self._timeout = timeout
+        self._reader = None
+        self._writer = None
+        self._request = None
+        self._response = None
+        self._logger = logging.getLogger("buffer") if debug else None
+        self._tracker = None
+        self.collector = get_default_collector()
+        self._capture = None
+        self._capture_session = 0
+        self.capture = get_default_capture()
+
+    @property
+    def address(self):
+        return "{}:{}".format(self._host, self._port)
+
+    @property
+    def collector(self):
+        """
+        instrumentation.Collector of this device, None (default) for no instrumentation
+        """
+        return self._tracker.collector if self._tracker else None
+
+    @collector.setter
+    def collector(self, collector):
+        self._tracker = CommandTracker(collector, self.address) if collector is not None else None
+
+    @property
+    def capture(self):
+        """
+        capture.WireCapture that records every packet of this device, None (default) for no capture
+        """
+        return self._capture
+
+    @capture.setter
+    def capture(self, capture):
+        self._capture = capture
+        if capture is not None and self._writer is not None:
+            self._open_capture_session()
+
+    def _open_capture_session(self):
+        self._capture_session = self._capture.new_session()
+        self._capture.record(OPENED, self._capture_session, self.address.encode("utf-8"))
+
+    async def disconnect(self):
+        if self._writer:
+            self._writer.close()
+            self._writer = None
+            self._reader = None
+
+    def abort(self):
+        """
+        close the connection immediately without talking to the device
+        :return:
+        """
+        if self._writer:
+            self._writer.close()
+            self._writer = None
+            self._reader = None
+
+    async def connect(self):
+        await self.disconnect()
+        self._reader, self._writer = await asyncio.wait_for(asyncio.open_connection(self._host, self._port),
+                                                            self._timeout)
+        if self._capture is not None:
+            self._open_capture_session()
+        return self._writer is not None
+
+    async def send(self):
+        if self._request:
+            header = self._request.header_bytes()
+            payload = self._request.payload or b''
+            if self._capture is not None:
+                self._capture.record(SENT, self._capture_session, header, payload)
+            if self._tracker is not None:
+                self._tracker.request(self._request, len(header) + len(payload))
+            self._writer.write(header)
+            if payload:
+                self._writer.write(payload)
+            await self._writer.drain()
+
+    async def _read_exact(self, size: int):
+        try:
+            return await asyncio.wait_for(self._reader.readexactly(size), self._timeout)
+        except asyncio.IncompleteReadError:
+            raise ConnectionError("connection is closed by server")
+
+    async def receive(self, verify_checksum=True, verify_size=False, header: bytes = None):
+        """
+        receive one packet
+        :param verify_checksum: validate checksum of the response
+        :param verify_size: validate size of the response
+        :param header: first 8 bytes of the packet when they were already read
+        :return:
+        """
+        if header is None:
+            header = await self._read_exact(8)
+        size = struct.unpack_from("<I", header, 4)[0]
+        data = header + await self._read_exact(size)
+        if self._capture is not None:
+            self._capture.record(RECEIVED, self._capture_session, data)
+        self._response = packet(data)
+        if self._tracker is not None:
+            self._tracker.response(self._response, len(data))
+        if not self._response.is_valid(verify_checksum, verify_size):
+            raise Exception("invalid packet response")
+
+    def verify_response(self, cmd_name: list = None):
+        if cmd_name is None:
+            cmd_name = ["ack"]
+        if self._response.cmd not in [device_cmd[x] for x in cmd_name]:
+            raise Exception("unexpected response cmd: {}".format(self._response.cmd))
+
+    async def send_cmd(self, cmd_name: str, payload: bytes = b'', res_cmd_name: list = None):
+        self._request = packet(cmd=device_cmd[cmd_name], serial=self._serial, secret_key=self._secret_key,
+                               payload=payload)
+        try:
+            await self.send()
+            await self.receive()
+            self.verify_response(res_cmd_name)
+        except Exception as ex:
+            if self._tracker is not None:
+                self._tracker.error(cmd_name, ex)
+            raise
+        # serial is 2 bytes in the packet header, long lived sessions wrap around
+        self._serial = (self._serial + 1) & 0xFFFF
+
+
+def _device_prop(prop_payload: bytes):
+    """
+    read only property that return awaitable of get_device_prop
+    """
+    return property(lambda self: self.get_device_prop(prop_payload))
+
+
+class AsyncZMM100_TFT(AsyncClientConnection):
+    def __init__(self, host: str, port: int, encoding: str, secret_key: int = 0, serial: int = 0,
+                 timeout: float = 20, info_ttl: float = 0, comm_key: int = 0):
+        """
+        initialize the device, all operations are coroutines so one event loop can drive many devices.
+        async with connects like the blocking Client and disconnects at the end
+        :param host: string that contain ip or dns name of the host
+        :param port: port number
+        :param encoding: default encoding for string->bytes conversion and vise versa
+        :param secret_key: session key default = 0 and this key will be generated from the server
+        :param serial: serial number of the packet starting with 0
+        :param timeout: seconds to wait for connect and for every response
+        :param info_ttl: seconds the DeviceInfo snapshot serves option properties, 0 (default) to read every
+                         option directly
+        :param comm_key: password used by async with to connect
+        """
+        super().__init__(host, port, timeout)
+        self._encoding = encoding
+        self._connected = False
+        self._secret_key: int = secret_key
+        self._serial: int = serial
+        self._pending_events = []
+        self._batch = BatchState()
+        self._info_ttl = info_ttl
+        self._info = None
+        self._info_time = 0.0
+        self._comm_key = comm_key
+
+    async def connect(self, comm_key=0):
+        """
+        do connect. note if comm_Key is wrong connect will return True also
+        but when try to use the device it will panic
+        :param comm_key: password for connection
+        :return: True if success
+        """
+        await self._connect_session(comm_key, ["ack"])
+        return self._connected
+
+    async def _connect_session(self, comm_key: int, res_cmd_name: list):
+        await super().connect()
+        self._connected = False
+        self._secret_key = 0
+        self._serial = 0
+        self._pending_events = []
+        self._info = None
+        await self.send_cmd("connect", res_cmd_name=res_cmd_name)
+        self._secret_key = self._response.secret_key
+        if comm_key > 0:
+            await self.send_cmd("login", hash_commkey(comm_key, self._secret_key))
+        self._connected = True
+
+    async def disconnect(self):
+        """
+        disconnect the device
+        :return:
+        """
+        try:
+            if self._connected:
+                await self.send_cmd("disconnect")
+        except Exception as ex:
+            if self._logger:
+                self._logger.error("disconnection with error:")
+                self._logger.error(str(ex))
+        finally:
+            await super().disconnect()
+            self._connected = False
+
+    def abort(self):
+        """
+        drop the session without disconnect command, used when a command timed out and
+        the connection is in unknown state
+        :return:
+        """
+        self._connected = False
+        super().abort()
+
+    async def __aenter__(self):
+        if not self._connected and not await self.connect(self._comm_key):
+            raise Exception("connection error")
+        return self
+
+    async def __aexit__(self, _type, value, traceback):
+        await self.disconnect()
+
+    def _check_connected(self):
+        if not self._connected:
+            raise Exception("you need to connect to machine first")
+
+    async def ping(self):
+        """
+        cheap round trip (get_time) to check that the session is still alive
+        :return:
+        """
+        self._check_connected()
+        await self.send_cmd("get_time")
+
+    async def register_events(self, events: list = None):
+        """
+        ask the device to push real time events on this session, see ZMM100_TFT.register_events
+        :param events: names of utils.device_event, None for all, empty list to stop the events
+        :return:
+        """
+        self._check_connected()
+        flags = 0
+        for name in (device_event if events is None else events):
+            flags |= device_event[name]
+        self._request = packet(cmd=device_cmd["reg_event"], serial=self._serial, secret_key=self._secret_key,
+                               payload=struct.pack("<I", flags))
+        await self.send()
+        await self.receive()
+        while self._response.cmd == device_cmd["reg_event"]:
+            self._pending_events.extend(await self._ack_event())
+            await self.receive()
+        self.verify_response()
+        self._serial = (self._serial + 1) & 0xFFFF
+
+    async def read_events(self, timeout: float = None):
+        """
+        wait for events pushed by the device after register_events
+        :param timeout: seconds to wait, None to wait forever
+        :return: list of RealTimeEvent, empty when nothing arrived before timeout
+        """
+        self._check_connected()
+        if self._pending_events:
+            events, self._pending_events = self._pending_events, []
+            return events
+        try:
+            # readexactly takes nothing from the stream until the whole header arrived so it is safe to cancel
+            header = await asyncio.wait_for(self._reader.readexactly(8), timeout)
+        except asyncio.TimeoutError:
+            return []
+        except asyncio.IncompleteReadError:
+            raise ConnectionError("connection is closed by server")
+        await self.receive(header=header)
+        self.verify_response(["reg_event"])
+        return await self._ack_event()
+
+    async def _ack_event(self):
+        """
+        decode the event in the last response and acknowledge it
+        :return: list of RealTimeEvent
+        """
+        events = models.RealTimeEvent.from_bytes(self._response.secret_key, self._response.payload, self._encoding)
+        self._request = packet(cmd=device_cmd["ack"], serial=0xFFFE, secret_key=self._secret_key)
+        await self.send()
+        return events
+
+    async def get_device_info(self, refresh=False):
+        """
+        read all options of DeviceInfo with a few query_sys_op commands, see ZMM100_TFT.get_device_info
+        :param refresh: ignore the cached snapshot
+        :return: DeviceInfo
+        """
+        self._check_connected()
+        if not refresh and self._info is not None and time.monotonic() - self._info_time < self._info_ttl:
+            return self._info
+        options = {}
+        for query in models.DeviceInfo.queries():
+            await self.send_cmd("query_sys_op", query.encode('latin-1'), ["ack", "nak", "no_sys_op", "not_support"])
+            if self._response.cmd == device_cmd["ack"]:
+                options.update(models.DeviceInfo.parse_options(bytes(self._response.payload).decode("latin-1")))
+        self._info = models.DeviceInfo(options)
+        self._info_time = time.monotonic()
+        return self._info
+
+    async def get_device_prop(self, prop_payload: bytes):
+        self._check_connected()
+        option = bytes(prop_payload).rstrip(b"\x00").decode('latin-1')
+        if self._info_ttl > 0 and option in models.DEVICE_INFO_OPTIONS:
+            value = (await self.get_device_info()).options.get(option)
+            # options the device left empty or did not report are read directly
+            if value:
+                return value
+        await self.send_cmd("get_data", prop_payload, ["ack", "no_sys_op"])
+        if self._response.cmd == device_cmd["no_sys_op"]:
+            return None
+        msg = bytes(self._response.payload).decode('latin-1')
+        return msg.split("=")[1].strip(' \x00')
+
+    async def set_device_prop(self, new_value: bytes, prop_cmd="set_data"):
+        """
+        set some system properties of the device
+        :param new_value: new value
+        :param prop_cmd: set_data or any special command
+        :return:
+        """
+        self._check_connected()
+        self._info = None
+        await self.send_cmd(prop_cmd, new_value)
+        await self.save_data()
+
+    async def query_system_option(self,
+                                  query_string="~OS=?,ExtendFmt=?,~ExtendFmt=?,ExtendOPLog=?,~ExtendOPLog=?,"
+                                               "~Platform=?,~ZKFPVersion=?,WorkCode=?,~SSR=?,~PIN2Width=?,"
+                                               "~UserExtFmt=?,BuildVersion=?,AttPhotoForSDK=?,~IsOnlyRFMachine=?,"
+                                               "CameraOpen=?,CompatOldFirmware=?,IsSupportPull=?,Language=?,"
+                                               "~SerialNumber=?,FaceFunOn=?,~DeviceName=?"):
+        await self.send_cmd("query_sys_op", query_string.encode('latin-1'))
+        return bytes(self._response.payload).decode("latin-1")
+
+    id = _device_prop(b"DeviceID\x00")
+    name = _device_prop(b"~DeviceName\x00")
+    type = _device_prop(b"DeviceType\x00")
+    product_time = _device_prop(b"~ProductTime")
+    serial_number = _device_prop(b"~SerialNumber\x00")
+    language = _device_prop(b"Language\x00")
+    compat_old_firmware = _device_prop(b"CompatOldFirmware\x00")
+    is_support_pull = _device_prop(b"IsSupportPull\x00")
+    camera_open = _device_prop(b"CameraOpen\x00")
+    finger_fun_on = _device_prop(b"FingerFunOn")
+    face_fun_on = _device_prop(b"FaceFunOn\x00")
+    zk_face_version = _device_prop(b"ZKFaceVersion")
+    biometric_type = _device_prop(b"BiometricType")
+    build_version = _device_prop(b"BuildVersion\x00")
+    att_photo_for_sdk = _device_prop(b"AttPhotoForSDK\x00")
+    is_only_rf_machine = _device_prop(b"~IsOnlyRFMachine\x00")
+    ssr = _device_prop(b"~SSR\x00")
+    pin_width = _device_prop(b"~PIN2Width\x00")
+    vendor = _device_prop(b"~OEMVendor\x00")
+    platform = _device_prop(b"~Platform\x00")
+    os = _device_prop(b"~OS")
+    extend_fmt_1 = _device_prop(b"~ExtendFmt")
+    extend_fmt_2 = _device_prop(b"ExtendFmt\x00")
+    extend_oplog_1 = _device_prop(b"~ExtendOPLog\x00")
+    user_ext_fmt = _device_prop(b"~UserExtFmt\x00")
+    extend_oplog_2 = _device_prop(b"ExtendOPLog")
+    fp_version = _device_prop(b"~ZKFPVersion\x00")
+    work_code = _device_prop(b"WorkCode\x00")
+    mac_address = _device_prop(b"MAC\x00")
+    ip_address = _device_prop(b"IPAddress\x00")
+    password = _device_prop(b"COMKey\x00")
+    daylight_saving_timeon = _device_prop(b"DaylightSavingTimeOn\x00")
+    daylight_saving_time = _device_prop(b"DaylightSavingTime\x00")
+    standard_time = _device_prop(b"StandardTime\x00")
+
+    @property
+    def port(self):
+        return self._get_port()
+
+    async def _get_port(self):
+        return int(await self.get_device_prop(b"UDPPort\x00"))
+
+    @property
+    def software_version(self):
+        return self._get_software_version()
+
+    async def _get_software_version(self):
+        self._check_connected()
+        await self.send_cmd("soft_ver")
+        msg = bytes(self._response.payload).decode('latin-1')
+        return msg.strip(' \x00')
+
+    @property
+    def device_time(self):
+        return self._get_device_time()
+
+    async def _get_device_time(self):
+        self._check_connected()
+        await self.send_cmd("get_time")
+        return datetime_from_bytes(self._response.payload[:4])
+
+    async def disable_device(self, time_out_in_sec=0):
+        """
+        disable the device for time period, does nothing inside batch because the batch keeps it disabled
+        :param time_out_in_sec: number of second to disable the device 0 mean forever until you call enable_device
+        :return:
+        """
+        self._check_connected()
+        if self._batch.active:
+            return
+        await self.send_cmd("disable", struct.pack("<I", time_out_in_sec))
+
+    async def enable_device(self):
+        """
+        enable the device, does nothing inside batch
+        :return:
+        """
+        self._check_connected()
+        if self._batch.active:
+            return
+        await self.send_cmd("enable")
+
+    async def save_data(self):
+        """
+        make the changes persistent, inside batch it is deferred to the end of the batch
+        :return:
+        """
+        self._check_connected()
+        if self._batch.defer_save():
+            return
+        await self.send_cmd("save_data")
+
+    @asynccontextmanager
+    async def batch(self):
+        """
+        share one disable/enable and one save_data between many operations, see ZMM100_TFT.batch
+        :return: async context manager of the device
+        """
+        await self.disable_device()
+        self._batch.enter()
+        error = None
+        try:
+            yield self
+        except BaseException as ex:
+            error = ex
+            raise
+        finally:
+            save = self._batch.leave()
+            if save is not None:
+                try:
+                    await self.enable_device()
+                    # changes of the operations that ran are saved even when a later one failed
+                    if save:
+                        await self.save_data()
+                except Exception as ex:
+                    self._batch.cleanup_failed(error, ex, self._logger)
+
+    async def get_state(self, disable_device=True):
+        """
+        get the machine state and capacity
+        :param disable_device: disable device during the command execution
+        :return: structure describe machine state and capacity
+        """
+        self._check_connected()
+        if disable_device:
+            await self.disable_device()
+        try:
+            await self.send_cmd("logs_count")
+            if len(self._response.payload or b'') < (23 * 4):
+                raise Exception("error in logs_count command")
+            return models.MachineState.from_bytes(self._response.payload)
+        finally:
+            if disable_device:
+                await self.enable_device()
+
+    async def _upload_data(self, data: bytes):
+        """
+        upload data to the device it is intermediate function
+        :param data: data to be uploaded in bytes
+        :return:
+        """
+        await self.send_cmd("recv_buff_header", struct.pack("<I", len(data)))
+        await self.send_cmd("recv_buff_content", data)
+        hash_code = BufferHash(data).value
+        await self.send_cmd("check_hash")
+        if hash_code != struct.unpack("<I", self._response.payload)[0]:
+            raise Exception("problem in data sending")
+
+    async def set_user(self, user_info: models.UserInfo):
+        """
+        set user info at specific serial number
+        :param user_info: contain user information to be set. serial field is the determinant of set position
+        :return:
+        """
+        self._check_connected()
+        await self.send_cmd("set_user", bytes(user_info))
+
+    async def set_fp(self, fp_info: models.FPInfo, disable_device=True):
+        """
+        set fingerprint for a user
+        :param fp_info: fingerprint information special user serial, finger id and fingerprint data in bytes
+        :param disable_device: disable device during the command execution
+        :return:
+        """
+        self._check_connected()
+        if disable_device:
+            await self.disable_device()
+        try:
+            await self._upload_data(fp_info.data)
+            payload = struct.pack("<HBBH", fp_info.user_id, fp_info.finger_id, fp_info.enabled, len(fp_info.data))
+            await self.send_cmd("set_fp_ex", payload)
+            await self.send_cmd("end_buff_stream")
+        finally:
+            if disable_device:
+                await self.enable_device()
+        await self.save_data()
+
+    async def get_users(self, disable_device=True):
+        """
+        get all users
+        :param disable_device: disable device during the command execution
+        :return: sequence of UserInfo (decoded on access)
+        """
+        ret = await self._get_data_buffer(0x05000901, disable_device)
+        ret.remove_leading()
+        return ret.users
+
+    async def get_op_logs(self, disable_device=True):
+        """
+        get all op logs
+        :param disable_device: disable device during the command execution
+        :return: sequence of OpLog struct (decoded on access)
+        """
+        ret = await self._get_data_buffer(0x2201, disable_device)
+        ret.remove_leading()
+        return ret.op_logs
+
+    async def get_att_logs(self, disable_device=True):
+        """
+        get all attendance logs
+        :param disable_device: disable device during the command execution
+        :return: sequence of AttLog (decoded on access)
+        """
+        ret = await self._get_data_buffer(0x0D01, disable_device)
+        ret.remove_leading()
+        return ret.att_logs
+
+    async def get_new_att_logs(self, watermark: models.AttLogWatermark = None, disable_device=True):
+        """
+        get attendance logs recorded after watermark, see ZMM100_TFT.get_new_att_logs
+        :param watermark: AttLogWatermark returned by the previous call, None to get all logs
+        :param disable_device: disable device during the table transfer
+        :return: tuple of list of new AttLog and the watermark to pass next time
+        """
+        if watermark is not None and watermark.is_current(await self.get_state(disable_device=False)):
+            return [], watermark
+        logs = await self.get_att_logs(disable_device) or []
+        new_logs = watermark.new_logs(logs) if watermark is not None else list(logs)
+        return new_logs, models.AttLogWatermark.from_logs(logs)
+
+    async def get_fps(self, disable_device=True):
+        """
+        return all fingerprints that stored in the device
+        :param disable_device: disable device during the command execution
+        :return: list of FPInfo struct
+        """
+        ret = await self._get_data_buffer(0x02000701, disable_device)
+        ret.remove_leading()
+        return ret.fps
+
+    def iter_users(self, disable_device=True):
+        """
+        get users one by one while they are downloaded
+        :param disable_device: disable device during the command execution
+        :return: async generator of UserInfo
+        """
+        encoding = self._encoding
+        return self._iter_records(0x05000901, 72, lambda x: models.UserInfo.from_bytes(x, encoding), disable_device)
+
+    def iter_op_logs(self, disable_device=True):
+        """
+        get op logs one by one while they are downloaded
+        :param disable_device: disable device during the command execution
+        :return: async generator of OpLog
+        """
+        return self._iter_records(0x2201, 16, models.OpLog.from_bytes, disable_device)
+
+    def iter_att_logs(self, disable_device=True):
+        """
+        get attendance logs one by one while they are downloaded
+        :param disable_device: disable device during the command execution
+        :return: async generator of AttLog
+        """
+        encoding = self._encoding
+        return self._iter_records(0x0D01, 40, lambda x: models.AttLog.from_bytes(x, encoding), disable_device)
+
+    def iter_fps(self, disable_device=True):
+        """
+        get fingerprints one by one while they are downloaded
+        :param disable_device: disable device during the command execution
+        :return: async generator of FPInfo
+        """
+        return self._iter_records(0x02000701, 0, lambda x: models.FPInfo.from_bytes(x[2:]), disable_device)
+
+    async def _iter_records(self, data_id: int, record_size: int, decoder, disable_device=True):
+        """
+        split data stream into records as chunks arrive and decode them. the stream is closed
+        explicitly because an abandoned async generator is finalized later by the event loop
+        while the connection may already be used by the next command
+        :param data_id: data type to be read
+        :param record_size: size of fixed records or 0 for length prefixed records
+        :param decoder: function that converts record bytes into model object
+        :param disable_device: disable device during the command execution
+        :return: async generator of model objects
+        """
+        stream = RecordStream(record_size)
+        chunks = self._iter_data_stream(data_id, disable_device)
+        try:
+            async for chunk in chunks:
+                for record in stream.feed(chunk):
+                    yield decoder(record)
+        finally:
+            await chunks.aclose()
+        stream.close()
+
+    async def _iter_data_stream(self, data_id: int, disable_device=True, on_size=None):
+        """
+        read data stream chunk by chunk
+        :param data_id: data type to be read
+        :param disable_device: disable device during the command execution
+        :param on_size: called with total data size when the device announces it
+        :return: async generator of chunks
+        """
+        self._check_connected()
+        if disable_device:
+            await self.disable_device()
+        streaming = False
+        try:
+            payload = struct.pack("<I7x", data_id)
+            await self.send_cmd("start_buff_stream", payload, ["ack", "nak", "recv_buff_content", "no_record"])
+            if self._response.cmd == device_cmd["recv_buff_content"]:
+                yield self._response.payload
+            elif self._response.cmd not in [device_cmd["nak"], device_cmd["no_record"]]:
+                data_size = struct.unpack("<I", self._response.payload[1:5])[0]
+                if on_size is not None:
+                    on_size(data_size)
+                streaming = True
+                packet_size = 0xFFC0
+                packets = data_size // packet_size
+                rem_size = data_size
+                if (data_size % packet_size) > 0:
+                    packets += 1
+                for _ in range(0, packets):
+                    payload = struct.pack("<II", data_size - rem_size,
+                                          rem_size if rem_size < packet_size else packet_size)
+                    await self.send_cmd("buff_stream", payload, ["recv_buff_header"])
+                    recv_size = struct.unpack("<I", self._response.payload[:4])[0]
+                    await self.receive()
+                    self.verify_response(["recv_buff_content"])
+                    data = self._response.payload
+                    await self.receive()
+                    self.verify_response()
+                    yield data
+                    rem_size -= recv_size
+                streaming = False
+                await self.send_cmd("end_buff_stream")
+        except GeneratorExit:
+            if streaming:
+                await self.send_cmd("end_buff_stream")
+            raise
+        finally:
+            if disable_device:
+                await self.enable_device()
+
+    async def _get_data_buffer(self, data_id: int, disable_device=True):
+        """
+        read data buffer from the stream
+        :param data_id: data type to be read
+        :param disable_device: disable device during the command execution
+        :return: DataBuffer object
+        """
+        data_buffer = DataBuffer(self._encoding)
+        async for chunk in self._iter_data_stream(data_id, disable_device, data_buffer.reserve):
+            data_buffer.append(chunk)
+        return data_buffer
+
+    @property
+    def connected(self):
+        return self._connected
+
+
+class AsyncZMM220_TFT(AsyncZMM100_TFT):
+    async def connect(self, comm_key=0):
+        await self._connect_session(comm_key, ["accept_conn"])
+        return self._connected
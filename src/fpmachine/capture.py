@@ -0,0 +1,248 @@
+import itertools
+import os
+import queue
+import struct
+import sys
+import threading
+import time
+from .network_utils import packet
+from .instrumentation import cmd_name
+
+# every capture file starts with this
+CAPTURE_MAGIC = b"FPCAP\x01\x00\x00"
+# direction, unix time, session id, size of the data that follows
+CAPTURE_RECORD_STRUCT = struct.Struct("<BdII")
+
+SENT = 0
+RECEIVED = 1
+# data of the record is "host:port" of the device, written when a session connects
+OPENED = 2
+
+_session_ids = itertools.count(1)
+_default_capture = None
+
+
+def set_default_capture(capture):
+    """
+    attach capture to every device object created afterwards
+    :param capture: WireCapture or None to stop attaching
+    """
+    global _default_capture
+    _default_capture = capture
+
+
+def get_default_capture():
+    return _default_capture
+
+
+class WireCapture(object):
+    def __init__(self, path: str, max_bytes: int = 16 * 1024 * 1024, backup_count: int = 5,
+                 queue_size: int = 10000):
+        """
+        append raw packets of device connections to a binary file, the file is written by a background
+        thread so the device threads only copy the packet and queue it
+        :param path: file name, rotated to path.1 ... path.backup_count like logging's RotatingFileHandler
+        :param max_bytes: size after which the file is rotated, 0 to never rotate
+        :param backup_count: number of rotated files kept
+        :param queue_size: packets waiting for the writer, further packets are dropped (see dropped)
+        """
+        self._path = path
+        self._max_bytes = max_bytes
+        self._backup_count = backup_count
+        self._queue = queue.Queue(queue_size)
+        self._file = None
+        self._size = 0
+        self.dropped = 0
+        # exception that stopped the writer thread, packets are dropped after it
+        self.error = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._write_loop, name="fpmachine-capture", daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def new_session():
+        """
+        :return: id of a new session, unique in this process
+        """
+        return next(_session_ids)
+
+    def record(self, direction: int, session: int, *parts):
+        """
+        queue one packet, never blocks
+        :param direction: SENT, RECEIVED or OPENED
+        :param session: id of the session from new_session
+        :param parts: bytes-like objects of the packet (e.g. header and payload), copied once before return
+        """
+        if self._closed:
+            return
+        if self.error is not None:
+            self.dropped += 1
+            return
+        data = bytes(parts[0]) if len(parts) == 1 else b''.join(parts)
+        try:
+            self._queue.put_nowait((direction, time.time(), session, data))
+        except queue.Full:
+            self.dropped += 1
+
+    def _open(self):
+        self._file = open(self._path, "ab")
+        self._size = self._file.tell()
+        if self._size == 0:
+            self._file.write(CAPTURE_MAGIC)
+            self._size = len(CAPTURE_MAGIC)
+
+    def _rotate(self):
+        self._file.close()
+        if self._backup_count > 0:
+            for index in range(self._backup_count - 1, 0, -1):
+                source = "{}.{}".format(self._path, index)
+                if os.path.exists(source):
+                    os.replace(source, "{}.{}".format(self._path, index + 1))
+            os.replace(self._path, self._path + ".1")
+        else:
+            os.remove(self._path)
+        self._open()
+
+    def _write(self, item):
+        direction, timestamp, session, data = item
+        size = CAPTURE_RECORD_STRUCT.size + len(data)
+        if self._max_bytes and self._size + size > self._max_bytes and self._size > len(CAPTURE_MAGIC):
+            self._rotate()
+        self._file.write(CAPTURE_RECORD_STRUCT.pack(direction, timestamp, session, len(data)))
+        self._file.write(data)
+        self._size += size
+
+    def _write_loop(self):
+        try:
+            self._open()
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    return
+                self._write(item)
+                # write everything queued meanwhile and flush once the queue is empty
+                while True:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        return
+                    self._write(item)
+                self._file.flush()
+        except Exception as ex:
+            self.error = ex
+        finally:
+            if self._file is not None:
+                self._file.close()
+
+    def close(self):
+        """
+        write the queued packets and close the file, see error when the writer failed
+        :return:
+        """
+        if self._closed:
+            return
+        self._closed = True
+        # a writer that failed does not empty the queue anymore
+        while self._thread.is_alive():
+            try:
+                self._queue.put(None, timeout=0.1)
+                break
+            except queue.Full:
+                pass
+        self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, _type, value, traceback):
+        self.close()
+
+
+class CaptureRecord(object):
+    __slots__ = ("direction", "time", "session", "data")
+
+    def __init__(self, direction: int, timestamp: float, session: int, data: bytes):
+        self.direction = direction
+        self.time = timestamp
+        self.session = session
+        self.data = data
+
+    @property
+    def packet(self):
+        """
+        :return: packet decoded from data, None for OPENED records
+        """
+        return packet(self.data) if self.direction != OPENED else None
+
+    @property
+    def command(self):
+        """
+        :return: command name of the packet
+        """
+        return cmd_name(self.packet.cmd) if self.direction != OPENED else None
+
+    def __repr__(self):
+        if self.direction == OPENED:
+            return "CaptureRecord({:.6f} session {} opened {})".format(self.time, self.session,
+                                                                     self.data.decode("utf-8", "replace"))
+        response = self.packet
+        return "CaptureRecord({:.6f} session {} {} {} serial {} {} bytes)".format(
+            self.time, self.session, "->" if self.direction == SENT else "<-", self.command, response.serial,
+            len(self.data))
+
+
+def _split_packets(data: bytes):
+    """
+    split data into packets by the size field of their headers, a truncated tail stays one piece
+    """
+    offset = 0
+    while offset < len(data):
+        size = struct.unpack_from("<I", data, offset + 4)[0] + 8 if offset + 8 <= len(data) else len(data) - offset
+        yield data[offset: offset + size]
+        offset += size
+
+
+def read_capture(path: str):
+    """
+    read a capture file written by WireCapture
+    :param path: file name, rotated files are read one by one
+    :return: generator of CaptureRecord, one per packet
+    """
+    with open(path, "rb") as file:
+        if file.read(len(CAPTURE_MAGIC)) != CAPTURE_MAGIC:
+            raise Exception("{} is not a capture file".format(path))
+        while True:
+            header = file.read(CAPTURE_RECORD_STRUCT.size)
+            if len(header) < CAPTURE_RECORD_STRUCT.size:
+                return
+            direction, timestamp, session, size = CAPTURE_RECORD_STRUCT.unpack(header)
+            data = file.read(size)
+            if len(data) < size:
+                # the writer was stopped in the middle of a record
+                return
+            if direction == OPENED:
+                yield CaptureRecord(direction, timestamp, session, data)
+                continue
+            for part in _split_packets(data):
+                yield CaptureRecord(direction, timestamp, session, part)
+
+
+def read_sessions(*paths):
+    """
+    read capture files and group the packets by session
+    :param paths: file names, oldest first (e.g. wire.fpcap.2, wire.fpcap.1, wire.fpcap)
+    :return: dict of session id -> list of CaptureRecord in capture order
+    """
+    sessions = {}
+    for path in paths:
+        for record in read_capture(path):
+            sessions.setdefault(record.session, []).append(record)
+    return sessions
+
+
+if __name__ == "__main__":
+    for _path in sys.argv[1:]:
+        for _record in read_capture(_path):
+            print(_record)
@@ -1,23 +1,71 @@
 import datetime
+import select
 import socket
 import struct
+import time
 import logging
-from random import randint
-from .utils import device_cmd, datetime_to_bytes, datetime_from_bytes, split_list
-from .network_utils import packet, DataBuffer
+from contextlib import contextmanager
+from .utils import device_cmd, device_event, datetime_to_bytes, datetime_from_bytes, split_list, hash_commkey, \
+    BatchState
+from .network_utils import packet, DataBuffer, BufferHash, RecordStream
+from .instrumentation import CommandTracker, get_default_collector
+from .capture import get_default_capture, SENT, RECEIVED, OPENED
 from . import models, debug
 
+# largest buffer sent with one table upload, same as the packets of data streams
+TABLE_UPLOAD_SIZE = 0xFFC0
+
 
 class ClientConnection(object):
-    def __init__(self, host: str, port: int):
+    def __init__(self, host: str, port: int, timeout: float = 20):
         self._serial = None
         self._secret_key = None
         self._host = host
         self._port = port
+        self._timeout = timeout
         self._socket = None
         self._request = None
         self._response = None
+        self._recv_buffer = bytearray(0x10000)
         self._logger = logging.getLogger("buffer") if debug else None
+        self._tracker = None
+        self.collector = get_default_collector()
+        self._capture = None
+        self._capture_session = 0
+        self.capture = get_default_capture()
+
+    @property
+    def address(self):
+        return "{}:{}".format(self._host, self._port)
+
+    @property
+    def collector(self):
+        """
+        instrumentation.Collector that receives the requests, replies, errors and disabled time
+        of this device, None (default) for no instrumentation
+        """
+        return self._tracker.collector if self._tracker else None
+
+    @collector.setter
+    def collector(self, collector):
+        self._tracker = CommandTracker(collector, self.address) if collector is not None else None
+
+    @property
+    def capture(self):
+        """
+        capture.WireCapture that records every packet of this device, None (default) for no capture
+        """
+        return self._capture
+
+    @capture.setter
+    def capture(self, capture):
+        self._capture = capture
+        if capture is not None and self._socket is not None:
+            self._open_capture_session()
+
+    def _open_capture_session(self):
+        self._capture_session = self._capture.new_session()
+        self._capture.record(OPENED, self._capture_session, self.address.encode("utf-8"))
 
     def disconnect(self):
         if self._socket:
@@ -27,36 +75,86 @@ class ClientConnection(object):
     def connect(self):
         self.disconnect()
         self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self._socket.settimeout(20)
+        self._socket.settimeout(self._timeout)
         self._socket.connect((self._host, self._port))
+        if self._capture is not None:
+            self._open_capture_session()
         return self._socket is not None
 
+    def _sendmsg_all(self, buffers: list):
+        """
+        write all buffers with scatter-gather sendmsg calls, buffers are never joined
+        :param buffers: list of memoryview
+        :return:
+        """
+        while buffers:
+            # the kernel limits the number of buffers of one call (IOV_MAX)
+            count = self._socket.sendmsg(buffers[:512])
+            while buffers and count >= len(buffers[0]):
+                count -= len(buffers[0])
+                buffers.pop(0)
+            if buffers and count > 0:
+                buffers[0] = buffers[0][count:]
+
     def send(self):
         if self._request:
-            data = bytes(self._request)
-            if debug:
-                self._logger.debug("REQ ({} bytes): {}".format(len(data),
-                                                               str.join(' ', [hex(char) for char in data])))
-            self._socket.sendall(data)
+            if not isinstance(self._request, packet):
+                data = bytes(self._request)
+                if self._capture is not None:
+                    self._capture.record(SENT, self._capture_session, data)
+                self._socket.sendall(data)
+                return
+            header = self._request.header_bytes()
+            payload = memoryview(self._request.payload or b'')
+            if self._capture is not None:
+                self._capture.record(SENT, self._capture_session, header, payload)
+            if self._tracker is not None:
+                self._tracker.request(self._request, len(header) + payload.nbytes)
+            if len(payload) == 0:
+                self._socket.sendall(header)
+            elif hasattr(self._socket, "sendmsg"):
+                self._sendmsg_all([memoryview(header), payload.cast("B")])
+            else:
+                self._socket.sendall(header + payload)
+
+    def _recv_exact(self, view: memoryview):
+        """
+        fill the whole view with data from the socket
+        :param view: writable memoryview into the receive buffer
+        :return:
+        """
+        offset = 0
+        size = len(view)
+        while offset < size:
+            count = self._socket.recv_into(view[offset:], size - offset)
+            if not count:
+                raise ConnectionError("connection is closed by server")
+            offset += count
 
     def receive(self, verify_checksum=True, verify_size=False):
-        recv = b''
-        buffer_size = 4096
-        header = self._socket.recv(8)
-        if not header:
-            raise Exception("connection is closed by server")
-        temp = packet(header)
-        while len(recv) < temp.size:
-            rem_size = temp.size - len(recv)
-            temp_data = self._socket.recv(buffer_size if rem_size > buffer_size else rem_size)
-            if not temp_data:
-                raise Exception("connection is closed by server")
-            recv += temp_data
-        data = header + recv
-        if debug:
-            self._logger.debug("RES ({} bytes): {}".format(len(data),
-                                                           str.join(' ', [hex(char) for char in data])))
+        """
+        receive one packet into the reusable receive buffer. payload of the response is a
+        memoryview into that buffer and is only valid until the next receive, copy it
+        (bytes(payload) or packet.detach) if you need to keep it
+        :param verify_checksum: validate checksum of the response
+        :param verify_size: validate size of the response
+        :return:
+        """
+        buffer = self._recv_buffer
+        self._recv_exact(memoryview(buffer)[:8])
+        size = struct.unpack_from("<I", buffer, 4)[0] + 8
+        if size > len(buffer):
+            # a memoryview of the old buffer may still be alive so it cannot be resized in place
+            temp = bytearray(max(size, len(buffer) * 2))
+            temp[:8] = buffer[:8]
+            buffer = self._recv_buffer = temp
+        data = memoryview(buffer)[:size]
+        self._recv_exact(data[8:])
+        if self._capture is not None:
+            self._capture.record(RECEIVED, self._capture_session, data)
         self._response = packet(data)
+        if self._tracker is not None:
+            self._tracker.response(self._response, size)
         if not self._response.is_valid(verify_checksum, verify_size):
             raise Exception("invalid packet response")
 
@@ -73,14 +171,65 @@ class ClientConnection(object):
     def send_cmd(self, cmd_name: str, payload: bytes = b'', res_cmd_name: list = None):
         self._request = packet(cmd=device_cmd[cmd_name], serial=self._serial, secret_key=self._secret_key,
                                payload=payload)
-        self.send()
-        self.receive()
-        self.verify_response(res_cmd_name)
-        self._serial += 1
+        try:
+            self.send()
+            self.receive()
+            self.verify_response(res_cmd_name)
+        except Exception as ex:
+            if self._tracker is not None:
+                self._tracker.error(cmd_name, ex)
+            raise
+        # serial is 2 bytes in the packet header, long lived sessions wrap around
+        self._serial = (self._serial + 1) & 0xFFFF
+
+    def send_cmds(self, commands: list, res_cmd_name: list = None):
+        """
+        pipeline commands: all requests are written at once and the replies are read afterwards,
+        so a batch costs one round trip instead of one per command
+        :param commands: list of (cmd_name, payload)
+        :param res_cmd_name: accepted response commands of every request
+        :return: list of response packets in the order of commands
+        """
+        buffers = []
+        for index, (cmd_name, payload) in enumerate(commands):
+            request = packet(cmd=device_cmd[cmd_name], serial=self._serial, secret_key=self._secret_key,
+                             payload=payload)
+            header = request.header_bytes()
+            buffers.append(memoryview(header))
+            if payload:
+                buffers.append(memoryview(payload).cast("B"))
+            if self._tracker is not None:
+                self._tracker.request(request, len(header) + len(payload or b''), pipelined=index > 0)
+            if self._capture is not None:
+                self._capture.record(SENT, self._capture_session, header, payload or b'')
+            self._serial = (self._serial + 1) & 0xFFFF
+        # name of the command whose reply failed
+        failed = commands[0][0]
+        try:
+            if hasattr(self._socket, "sendmsg"):
+                self._sendmsg_all(buffers)
+            else:
+                self._socket.sendall(b''.join(buffers))
+            responses = []
+            for cmd_name, _ in commands:
+                failed = cmd_name
+                self.receive()
+                responses.append(self._response.detach())
+            # every reply is read before checking so the stream stays in sync when one of them fails
+            for (cmd_name, _), response in zip(commands, responses):
+                failed = cmd_name
+                self._response = response
+                self.verify_response(res_cmd_name)
+        except Exception as ex:
+            if self._tracker is not None:
+                self._tracker.error(failed, ex)
+            raise
+        return responses
 
 
 class ZMM100_TFT(ClientConnection):
-    def __init__(self, host: str, port: int, encoding: str, secret_key: int = 0, serial: int = 0):
+    def __init__(self, host: str, port: int, encoding: str, secret_key: int = 0, serial: int = 0,
+                 timeout: float = 20, info_ttl: float = 0):
         """
         initialize the device
         :param host: string that contain ip or dns name of the host
@@ -88,13 +237,21 @@ class ZMM100_TFT(ClientConnection):
         :param encoding: default encoding for string->bytes conversion and vise versa
         :param secret_key: session key default = 0 and this key will be generated from the server
         :param serial: serial number of the packet starting with 0
+        :param timeout: socket timeout in seconds
+        :param info_ttl: seconds the DeviceInfo snapshot serves option properties, 0 (default) to read every
+                         option directly
         """
-        super().__init__(host, port)
+        super().__init__(host, port, timeout)
         self._encoding = encoding
         self._connected = (self._socket is not None)
         self._secret_key: int = secret_key
         self._serial: int = serial
         self._enabled: bool = True
+        self._pending_events = []
+        self._batch = BatchState()
+        self._info_ttl = info_ttl
+        self._info = None
+        self._info_time = 0.0
 
     def connect(self, comm_key=0):
         """
@@ -104,9 +261,7 @@ class ZMM100_TFT(ClientConnection):
         :return: True if success
         """
         super().connect()
-        self._connected = False
-        self._secret_key = 0
-        self._serial = 0
+        self._new_session()
         self.send_cmd("connect")
         self._secret_key = self._response.secret_key
         if comm_key > 0:
@@ -115,6 +270,16 @@ class ZMM100_TFT(ClientConnection):
         self._connected = True
         return self._connected
 
+    def _new_session(self):
+        """
+        reset the state kept per session before connect
+        """
+        self._connected = False
+        self._secret_key = 0
+        self._serial = 0
+        self._pending_events = []
+        self._info = None
+
     def disconnect(self):
         """
         disconnect the device
@@ -131,34 +296,81 @@ class ZMM100_TFT(ClientConnection):
             super().disconnect()
             self._connected = False
 
+    def abort(self):
+        """
+        close the socket without disconnect command, used when the session is broken
+        :return:
+        """
+        self._connected = False
+        super().disconnect()
+
     def hash_commkey(self, comm_key: int):
         """
         hash the comm_key and return 4 bytes
         :param comm_key: connection password
         :return: 4 bytes represent the comm_Key hash
         """
-        index = 1
-        num = 0
-        for _ in range(0x20):
-            num *= 2
-            num = num & 0xFFFFFFFF
-            if comm_key & index > 0:
-                num = num | 1
-            index = index << 1
-            if index > 0xFFFFFFFF:
-                index = 1
-        num += self._secret_key
-        # y1 = (num & 0xFF) ^ 0x5A
-        y2 = (num >> 8 & 0xFF) ^ 0x4B
-        y3 = (num >> 16 & 0xFF) ^ 0x53
-        y4 = (num >> 24 & 0xFF) ^ 0x4F
-        y5 = randint(1, 0x100)
-        y2 = y2 ^ y5
-        y3 = y3 ^ y5
-        y4 = y4 ^ y5
-        ret = [y2, y5, y4, y3]
-        ret.reverse()
-        return bytes(ret)
+        return hash_commkey(comm_key, self._secret_key)
+
+    def ping(self):
+        """
+        cheap round trip (get_time) to check that the session is still alive
+        :return:
+        """
+        if not self._connected:
+            raise Exception("you need to connect to machine first")
+        self.send_cmd("get_time")
+
+    def register_events(self, events: list = None):
+        """
+        ask the device to push real time events on this session. while registered the device may send
+        events between any command and its reply, so use a dedicated session for events.
+        events pushed before the reply are kept for the next read_events
+        :param events: names of utils.device_event, None for all, empty list to stop the events
+        :return:
+        """
+        if not self._connected:
+            raise Exception("you need to connect to machine first")
+        flags = 0
+        for name in (device_event if events is None else events):
+            flags |= device_event[name]
+        self._request = packet(cmd=device_cmd["reg_event"], serial=self._serial, secret_key=self._secret_key,
+                               payload=struct.pack("<I", flags))
+        self.send()
+        self.receive()
+        while self._response.cmd == device_cmd["reg_event"]:
+            self._pending_events.extend(self._ack_event())
+            self.receive()
+        self.verify_response()
+        self._serial = (self._serial + 1) & 0xFFFF
+
+    def read_events(self, timeout: float = None):
+        """
+        wait for events pushed by the device after register_events
+        :param timeout: seconds to wait, None to wait forever
+        :return: list of RealTimeEvent, empty when nothing arrived before timeout
+        """
+        if not self._connected:
+            raise Exception("you need to connect to machine first")
+        if self._pending_events:
+            events, self._pending_events = self._pending_events, []
+            return events
+        if not select.select([self._socket], [], [], timeout)[0]:
+            return []
+        self.receive()
+        self.verify_response(["reg_event"])
+        return self._ack_event()
+
+    def _ack_event(self):
+        """
+        decode the event in the last response and acknowledge it, the device waits for the ack
+        before it pushes the next event
+        :return: list of RealTimeEvent
+        """
+        events = models.RealTimeEvent.from_bytes(self._response.secret_key, self._response.payload, self._encoding)
+        self._request = packet(cmd=device_cmd["ack"], serial=0xFFFE, secret_key=self._secret_key)
+        self.send()
+        return events
 
     def reboot(self):
         self.send_cmd("reboot")
@@ -175,8 +387,9 @@ class ZMM100_TFT(ClientConnection):
         """
         if not self._connected:
             raise Exception("you need to connect to machine first")
+        self._info = None
         self.send_cmd(prop_cmd, new_value)
-        self.send_cmd("save_data")
+        self.save_data()
 
     @property
     def id(self):
@@ -292,7 +505,7 @@ class ZMM100_TFT(ClientConnection):
         if not self._connected:
             raise Exception("you need to connect to machine first")
         self.send_cmd("soft_ver")
-        msg = self._response.payload.decode('latin-1')
+        msg = bytes(self._response.payload).decode('latin-1')
         return msg.strip(' \x00')
 
     @property
@@ -388,15 +601,41 @@ class ZMM100_TFT(ClientConnection):
                                          "AttPhotoForSDK=?,~IsOnlyRFMachine=?,CameraOpen=?,CompatOldFirmware=?,"
                                          "IsSupportPull=?,Language=?,~SerialNumber=?,FaceFunOn=?,~DeviceName=?"):
         self.send_cmd("query_sys_op", query_string.encode('latin-1'))
-        return self._response.payload.decode("latin-1")
+        return bytes(self._response.payload).decode("latin-1")
+
+    def get_device_info(self, refresh=False):
+        """
+        read all options of DeviceInfo with a few query_sys_op commands, the snapshot is kept for
+        info_ttl seconds of the session and dropped by the property setters
+        :param refresh: ignore the cached snapshot
+        :return: DeviceInfo
+        """
+        if not self._connected:
+            raise Exception("you need to connect to machine first")
+        if not refresh and self._info is not None and time.monotonic() - self._info_time < self._info_ttl:
+            return self._info
+        options = {}
+        for query in models.DeviceInfo.queries():
+            self.send_cmd("query_sys_op", query.encode('latin-1'), ["ack", "nak", "no_sys_op", "not_support"])
+            if self._response.cmd == device_cmd["ack"]:
+                options.update(models.DeviceInfo.parse_options(bytes(self._response.payload).decode("latin-1")))
+        self._info = models.DeviceInfo(options)
+        self._info_time = time.monotonic()
+        return self._info
 
     def get_device_prop(self, prop_payload: bytes):
         if not self._connected:
             raise Exception("you need to connect to machine first")
+        option = bytes(prop_payload).rstrip(b"\x00").decode('latin-1')
+        if self._info_ttl > 0 and option in models.DEVICE_INFO_OPTIONS:
+            value = self.get_device_info().options.get(option)
+            # options the device left empty or did not report are read directly
+            if value:
+                return value
         self.send_cmd("get_data", prop_payload, ["ack", "no_sys_op"])
         if self._response.cmd == device_cmd["no_sys_op"]:
             return None
-        msg = self._response.payload.decode('latin-1')
+        msg = bytes(self._response.payload).decode('latin-1')
         return msg.split("=")[1].strip(' \x00')
 
     def get_tz_info(self, tz_index: int):
@@ -423,7 +662,7 @@ class ZMM100_TFT(ClientConnection):
         if not self._connected:
             raise Exception("you need to connect to machine first")
         self.send_cmd("cls_data", payload=struct.pack("<B", data_id))
-        self.send_cmd("save_data")
+        self.save_data()
 
     def del_user(self, _id: int, disable_device=True):
         if not self._connected:
@@ -449,11 +688,11 @@ class ZMM100_TFT(ClientConnection):
         self.send_cmd("get_table_struct", res_cmd_name=["recv_buff_header"])
         self.receive()
         self.verify_response(["recv_buff_content"])
-        data = self._response
+        data = bytes(self._response.payload).decode('latin-1')
         self.receive()
         self.verify_response()
         # footer = self._response
-        return data.payload.decode('latin-1')
+        return data
 
     def get_fp_data(self, user_id: int, finger_id: int, disable_device=True):
         """
@@ -476,11 +715,11 @@ class ZMM100_TFT(ClientConnection):
             else:
                 self.receive()
                 self.verify_response(["recv_buff_content"])
-                data = self._response
+                data = bytes(self._response.payload[:-6])
                 self.receive()
                 self.verify_response()
                 # footer = self._response
-                return data.payload[:-6]
+                return data
         except Exception as ex:
             raise ex
         finally:
@@ -512,7 +751,7 @@ class ZMM100_TFT(ClientConnection):
         finally:
             if disable_device:
                 self.enable_device()
-        self.send_cmd("save_data")
+        self.save_data()
 
     def set_user_pic(self, person_id: str, pic_data: bytes, disable_device=True):
         """
@@ -536,7 +775,7 @@ class ZMM100_TFT(ClientConnection):
         finally:
             if disable_device:
                 self.enable_device()
-        self.send_cmd("save_data")
+        self.save_data()
 
     def del_user_pic(self, person_id: str, disable_device=True):
         """
@@ -557,7 +796,7 @@ class ZMM100_TFT(ClientConnection):
         finally:
             if disable_device:
                 self.enable_device()
-            self.send_cmd("save_data")
+            self.save_data()
 
     def get_user_pic(self, person_id: str):
         """
@@ -574,13 +813,13 @@ class ZMM100_TFT(ClientConnection):
         data_size, _ = struct.unpack("<II", self._response.payload[:8])
         self.receive()
         self.verify_response(["recv_buff_content"])
-        data = self._response
+        data = bytes(self._response.payload)
         self.receive()
         self.verify_response()
         _ = self._response
-        if len(data.payload) != data_size:
+        if len(data) != data_size:
             raise Exception("data integrity is incorrect")
-        return data.payload
+        return data
 
     def del_op_logs(self):
         """
@@ -588,7 +827,7 @@ class ZMM100_TFT(ClientConnection):
         :return:
         """
         self.send_cmd("clear_op_log")
-        self.send_cmd("save_data")
+        self.save_data()
 
     def del_users(self):
         """
@@ -612,7 +851,7 @@ class ZMM100_TFT(ClientConnection):
         if not self._connected:
             raise Exception("you need to connect to machine first")
         self.send_cmd("cls_admins")
-        self.send_cmd("save_data")
+        self.save_data()
 
     def get_photo_count(self):
         """
@@ -670,27 +909,74 @@ class ZMM100_TFT(ClientConnection):
         finally:
             if disable_device:
                 self.enable_device()
-        self.send_cmd("save_data")
+        self.save_data()
 
     def disable_device(self, time_out_in_sec=0):
         """
-        disable the device for time period
+        disable the device for time period, does nothing inside batch because the batch keeps it disabled
         :param time_out_in_sec: number of second to disable the device 0 mean forever until you call enable_device
         :return:
         """
         if not self._connected:
             raise Exception("you need to connect to machine first")
+        if self._batch.active:
+            return
         self.send_cmd("disable", struct.pack("<I", time_out_in_sec))
 
     def enable_device(self):
         """
-        enable the device
+        enable the device, does nothing inside batch
         :return:
         """
         if not self._connected:
             raise Exception("you need to connect to machine first")
+        if self._batch.active:
+            return
         self.send_cmd("enable")
 
+    def save_data(self):
+        """
+        make the changes persistent, inside batch it is deferred to the end of the batch
+        :return:
+        """
+        if not self._connected:
+            raise Exception("you need to connect to machine first")
+        if self._batch.defer_save():
+            return
+        self.send_cmd("save_data")
+
+    @contextmanager
+    def batch(self):
+        """
+        share one disable/enable and one save_data between many operations:
+            with dev.batch():
+                for person_id in person_ids:
+                    dev.del_user_pic(person_id)
+        the device is disabled once, operations skip their own disable/enable and save_data is sent once
+        at the end if any operation needed it. the device is enabled and the changes are saved even when an
+        operation fails, errors of that cleanup are logged instead of hiding the error of the operation.
+        batches can be nested
+        :return: context manager of the device
+        """
+        self.disable_device()
+        self._batch.enter()
+        error = None
+        try:
+            yield self
+        except BaseException as ex:
+            error = ex
+            raise
+        finally:
+            save = self._batch.leave()
+            if save is not None:
+                try:
+                    self.enable_device()
+                    # changes of the operations that ran are saved even when a later one failed
+                    if save:
+                        self.save_data()
+                except Exception as ex:
+                    self._batch.cleanup_failed(error, ex, self._logger)
+
     def check_hash(self):
         """
         use as follows after send data from client to machine using header-content-footer
@@ -737,7 +1023,7 @@ class ZMM100_TFT(ClientConnection):
         finally:
             if disable_device:
                 self.enable_device()
-        self.send_cmd("save_data")
+        self.save_data()
 
     def get_user_face(self, person_id: str, face_id=50, disable_device=True):
         """
@@ -763,11 +1049,11 @@ class ZMM100_TFT(ClientConnection):
             else:
                 self.receive()
                 self.verify_response(["recv_buff_content"])
-                data = self._response
+                data = bytes(self._response.payload)
                 self.receive()
                 self.verify_response()
                 _ = self._response
-                return data.payload
+                return data
         finally:
             if disable_device:
                 self.enable_device()
@@ -794,7 +1080,7 @@ class ZMM100_TFT(ClientConnection):
         finally:
             if disable_device:
                 self.enable_device()
-        self.send_cmd("save_data")
+        self.save_data()
 
     # old function
     # def delFP(self, user_id, finger_id, disable_device=True):
@@ -820,6 +1106,32 @@ class ZMM100_TFT(ClientConnection):
             raise Exception("you need to connect to machine first")
         self.send_cmd("set_user", bytes(user_info))
 
+    def set_users(self, user_infos: list, disable_device=True, table_upload=True, pipeline=64):
+        """
+        bulk set of users. users are packed into table buffers of up to TABLE_UPLOAD_SIZE bytes, each one
+        uploaded with a single hash check and written with one command, when the firmware refuses the table
+        upload set_user commands are pipelined
+        :param user_infos: iterable of UserInfo, serial field is the determinant of set position
+        :param disable_device: disable device during the command execution
+        :param table_upload: try the table upload first
+        :param pipeline: number of set_user commands written before their replies are read
+        :return:
+        """
+        if not self._connected:
+            raise Exception("you need to connect to machine first")
+        user_infos = list(user_infos)
+        if disable_device:
+            self.disable_device()
+        try:
+            remaining = user_infos[self._write_user_tables(user_infos):] if table_upload else user_infos
+            pipeline = max(pipeline, 1)
+            for start in range(0, len(remaining), pipeline):
+                self.send_cmds([("set_user", bytes(user_info)) for user_info in remaining[start: start + pipeline]])
+        finally:
+            if disable_device:
+                self.enable_device()
+        self.save_data()
+
     def del_fp(self, person_id: str, finger_id: int, disable_device=True):
         """
         delete fingerprint of a user
@@ -852,7 +1164,7 @@ class ZMM100_TFT(ClientConnection):
             if disable_device:
                 self.enable_device()
         if ret:
-            self.send_cmd("save_data")
+            self.save_data()
         return ret
 
     def _upload_data(self, data: bytes):
@@ -863,8 +1175,7 @@ class ZMM100_TFT(ClientConnection):
         """
         self.send_cmd("recv_buff_header", struct.pack("<I", len(data)))
         self.send_cmd("recv_buff_content", data)
-        buffer = DataBuffer(self._encoding, data)
-        hash_code = hash(buffer)
+        hash_code = BufferHash(data).value
         self.send_cmd("check_hash")
         if hash_code != struct.unpack("<I", self._response.payload)[0]:
             raise Exception("problem in data sending")
@@ -895,35 +1206,114 @@ class ZMM100_TFT(ClientConnection):
         finally:
             if disable_device:
                 self.enable_device()
-        self.send_cmd("save_data")
+        self.save_data()
 
-    def set_fps(self, fp_infos: list, disable_device=True):
+    def set_fps(self, fp_infos: list, disable_device=True, table_upload=True):
         """
-        bulk set of fingerprints in the device
-        :param fp_infos: list of all fingerprints
+        bulk set of fingerprints in the device. templates are packed into table buffers that are uploaded
+        and verified with one hash each, templates with a non default enabled flag (disabled, duress) and
+        all templates of firmware that refuses the table upload are written one by one with set_fp_ex
+        :param fp_infos: iterable of all fingerprints
         :param disable_device: disable device during the command execution
+        :param table_upload: try the table upload first
         :return:
         """
         if not self._connected:
             raise Exception("you need to connect to machine first")
+        fp_infos = list(fp_infos)
         if disable_device:
             self.disable_device()
         try:
-            for fp_info in fp_infos:
-                self.send_cmd("recv_buff_header", struct.pack("<I", len(fp_info.data)))
-                self.send_cmd("recv_buff_content", fp_info.data)
-                buffer = DataBuffer(self._encoding, fp_info.data)
-                hash_code = hash(buffer)
-                self.send_cmd("check_hash")
-                if hash_code != struct.unpack("<I", self._response.payload)[0]:
-                    raise Exception("problem in data sending")
-                payload = struct.pack("<HBBH", fp_info.user_id, fp_info.finger_id, fp_info.enabled, len(fp_info.data))
-                self.send_cmd("set_fp_ex", payload)
-                self.send_cmd("end_buff_stream")
+            remaining = fp_infos
+            if table_upload:
+                # the table index has no field for the flag
+                plain = [fp_info for fp_info in fp_infos if fp_info.enabled == 1]
+                flagged = [fp_info for fp_info in fp_infos if fp_info.enabled != 1]
+                remaining = plain[self._write_fp_tables(plain):] + flagged
+            self._pipeline_fps(remaining)
         finally:
             if disable_device:
                 self.enable_device()
-        self.send_cmd("save_data")
+        self.save_data()
+
+    def _write_user_tables(self, user_infos: list):
+        """
+        write users with table uploads of up to TABLE_UPLOAD_SIZE bytes
+        :param user_infos: list of UserInfo
+        :return: number of users written, less than all when the firmware refused the table
+        """
+        count = (TABLE_UPLOAD_SIZE - models.UPLOAD_TABLE_HEADER_STRUCT.size) // (models.USER_INFO_STRUCT.size + 1)
+        written = 0
+        while written < len(user_infos):
+            if not self._write_table(models.UserInfo.to_table(user_infos[written: written + count]), b'', b''):
+                break
+            written += count
+        return min(written, len(user_infos))
+
+    def _write_fp_tables(self, fp_infos: list):
+        """
+        write fingerprints with table uploads of up to TABLE_UPLOAD_SIZE bytes
+        :param fp_infos: list of FPInfo, their enabled flag is not uploaded
+        :return: number of fingerprints written, less than all when the firmware refused the table
+        """
+        entry_size = models.FP_TABLE_ENTRY_STRUCT.size + models.FP_LEN_STRUCT.size
+        written = 0
+        while written < len(fp_infos):
+            count = 0
+            size = models.UPLOAD_TABLE_HEADER_STRUCT.size
+            for fp_info in fp_infos[written:]:
+                size += entry_size + len(fp_info.data)
+                if count > 0 and size > TABLE_UPLOAD_SIZE:
+                    break
+                count += 1
+            index, templates = models.FPInfo.to_table(fp_infos[written: written + count])
+            if not self._write_table(b'', index, templates):
+                break
+            written += count
+        return written
+
+    def _write_table(self, users: bytes, fp_index: bytes, templates: bytes):
+        """
+        upload users and fingerprints in table format and write them with one command
+        :param users: user records, each one prefixed with a marker byte
+        :param fp_index: fingerprint index entries
+        :param templates: length prefixed templates
+        :return: False when the firmware does not support table upload
+        """
+        header = models.UPLOAD_TABLE_HEADER_STRUCT.pack(len(users), len(fp_index), len(templates))
+        self._upload_data(b''.join((header, users, fp_index, templates)))
+        self.send_cmd("send_file", struct.pack("<IHH", models.UPLOAD_TABLE_HEADER_STRUCT.size, 0,
+                                               models.FP_TABLE_ENTRY_STRUCT.size), ["ack", "nak", "not_support"])
+        ret = self._response.cmd == device_cmd["ack"]
+        self.send_cmd("end_buff_stream")
+        return ret
+
+    def _pipeline_fps(self, fp_infos: list):
+        """
+        write fingerprints one by one. a template is written with set_fp_ex only after the device confirmed
+        its hash, the device has one upload buffer so the write of a template is pipelined with the upload
+        of the next one, about one round trip per template
+        :param fp_infos: list of FPInfo
+        :return:
+        """
+        verified = None
+        for fp_info in fp_infos + [None]:
+            commands = []
+            if verified is not None:
+                payload = struct.pack("<HBBH", verified.user_id, verified.finger_id, verified.enabled,
+                                      len(verified.data))
+                commands += [("set_fp_ex", payload), ("end_buff_stream", b'')]
+            if fp_info is not None:
+                commands += [("recv_buff_header", struct.pack("<I", len(fp_info.data))),
+                             ("recv_buff_content", fp_info.data),
+                             ("check_hash", b'')]
+            if not commands:
+                break
+            responses = self.send_cmds(commands)
+            if fp_info is not None and \
+                    BufferHash(fp_info.data).value != struct.unpack("<I", responses[-1].payload[:4])[0]:
+                raise Exception("problem in data sending")
+            verified = fp_info
 
     def get_fp(self, user_id: int, finger_id: int, disable_device=True):
         """
@@ -946,12 +1336,13 @@ class ZMM100_TFT(ClientConnection):
             else:
                 self.receive()
                 self.verify_response(["recv_buff_content"])
-                data = self._response
+                data = self._response.payload
+                fp_info = models.FPInfo(user_id=user_id, finger_id=finger_id, enabled=data[-1],
+                                        data=bytes(data[:-7]))
                 self.receive()
                 self.verify_response()
                 # footer = self._response
-                return models.FPInfo(user_id=user_id, finger_id=finger_id, enabled=data.payload[-1],
-                                     data=data.payload[:-7])
+                return fp_info
         except Exception as ex:
             raise ex
         finally:
@@ -962,7 +1353,7 @@ class ZMM100_TFT(ClientConnection):
         """
         get all users
         :param disable_device: disable device during the command execution
-        :return: list of UserInfo
+        :return: sequence of UserInfo (decoded on access)
         """
         ret = self._get_data_buffer(0x05000901, disable_device)
         if ret is not None:
@@ -973,7 +1364,7 @@ class ZMM100_TFT(ClientConnection):
         """
         get all op logs
         :param disable_device: disable device during the command execution
-        :return: list of OpLog struct
+        :return: sequence of OpLog struct (decoded on access)
         """
         ret = self._get_data_buffer(0x2201, disable_device)
         if ret is not None:
@@ -984,82 +1375,175 @@ class ZMM100_TFT(ClientConnection):
         """
         get all attendance logs
         :param disable_device: disable device during the command execution
-        :return: list of AttLog
+        :return: sequence of AttLog (decoded on access)
         """
         ret = self._get_data_buffer(0x0D01, disable_device)
         if ret is not None:
             ret.remove_leading()
             return ret.att_logs
 
-    def _get_data_buffer(self, data_id: int, disable_device=True):
+    def get_new_att_logs(self, watermark: models.AttLogWatermark = None, disable_device=True):
         """
-        read data buffer from the stream
+        get attendance logs recorded after watermark. the record count is checked first so a device
+        without new records costs one small command instead of a table transfer. when there are new records
+        the whole attendance table is still transferred and filtered here, only the new tail is decoded.
+        the firmware has no documented query for records after a position (the reply of read_latest_log
+        differs between firmwares), so the transfer is not reduced
+        :param watermark: AttLogWatermark returned by the previous call, None to get all logs
+        :param disable_device: disable device during the table transfer
+        :return: tuple of list of new AttLog and the watermark to pass next time
+        """
+        if watermark is not None and watermark.is_current(self.get_state(disable_device=False)):
+            return [], watermark
+        logs = self.get_att_logs(disable_device) or []
+        new_logs = watermark.new_logs(logs) if watermark is not None else list(logs)
+        return new_logs, models.AttLogWatermark.from_logs(logs)
+
+    def get_att_log_batch(self, disable_device=True):
+        """
+        get all attendance logs decoded column wise (needs numpy)
+        :param disable_device: disable device during the command execution
+        :return: AttLogBatch
+        """
+        ret = self._get_data_buffer(0x0D01, disable_device)
+        if ret is not None:
+            ret.remove_leading()
+            return ret.att_log_batch
+
+    def iter_users(self, disable_device=True):
+        """
+        get users one by one while they are downloaded
+        :param disable_device: disable device during the command execution
+        :return: generator of UserInfo
+        """
+        for record in self._iter_records(0x05000901, 72, disable_device):
+            yield models.UserInfo.from_bytes(record, self._encoding)
+
+    def iter_op_logs(self, disable_device=True):
+        """
+        get op logs one by one while they are downloaded
+        :param disable_device: disable device during the command execution
+        :return: generator of OpLog
+        """
+        for record in self._iter_records(0x2201, 16, disable_device):
+            yield models.OpLog.from_bytes(record)
+
+    def iter_att_logs(self, disable_device=True):
+        """
+        get attendance logs one by one while they are downloaded, only one stream chunk
+        is held in memory so it can be used for tables of any size
+        :param disable_device: disable device during the command execution
+        :return: generator of AttLog
+        """
+        for record in self._iter_records(0x0D01, 40, disable_device):
+            yield models.AttLog.from_bytes(record, self._encoding)
+
+    def iter_fps(self, disable_device=True):
+        """
+        get fingerprints one by one while they are downloaded
+        :param disable_device: disable device during the command execution
+        :return: generator of FPInfo
+        """
+        for record in self._iter_records(0x02000701, 0, disable_device):
+            yield models.FPInfo.from_bytes(record[2:])
+
+    def _iter_records(self, data_id: int, record_size: int, disable_device=True):
+        """
+        split data stream into records as chunks arrive
         :param data_id: data type to be read
+        :param record_size: size of fixed records or 0 for length prefixed records
         :param disable_device: disable device during the command execution
-        :return: DataBuffer object
+        :return: generator of records in form of memoryview
+        """
+        stream = RecordStream(record_size)
+        chunks = self._iter_data_stream(data_id, disable_device)
+        try:
+            for chunk in chunks:
+                for record in stream.feed(chunk):
+                    yield record
+        finally:
+            chunks.close()
+        stream.close()
+
+    def _iter_data_stream(self, data_id: int, disable_device=True, on_size=None):
+        """
+        read data stream chunk by chunk. every chunk is a memoryview into the receive
+        buffer that is valid until the generator is resumed
+        :param data_id: data type to be read
+        :param disable_device: disable device during the command execution
+        :param on_size: called with total data size when the device announces it
+        :return: generator of chunks
         """
         if not self._connected:
             raise Exception("you need to connect to machine first")
         if disable_device:
             self.disable_device()
+        streaming = False
         try:
-
-            data_buffer = DataBuffer(self._encoding)
             payload = struct.pack("<I7x", data_id)
             self.send_cmd("start_buff_stream", payload, ["ack", "nak", "recv_buff_content", "no_record"])
             if self._response.cmd == device_cmd["recv_buff_content"]:
-                data_buffer.append(self._response.payload)
-                return data_buffer
-            elif self._response.cmd in [device_cmd["nak"], device_cmd["no_record"]]:
-                return data_buffer
-            else:
+                yield self._response.payload
+            elif self._response.cmd not in [device_cmd["nak"], device_cmd["no_record"]]:
                 data_size = struct.unpack("<I", self._response.payload[1:5])[0]
+                if on_size is not None:
+                    on_size(data_size)
+                streaming = True
                 packet_size = 0xFFC0
                 packets = data_size // packet_size
                 rem_size = data_size
                 if (data_size % packet_size) > 0:
                     packets += 1
-                # has_error = False
                 for _ in range(0, packets):
-                    # payload = DwordToBytes(data_size - rem_size) + DwordToBytes(rem_size if rem_size < packet_size
-                    # else packet_size)
                     payload = struct.pack("<I", data_size - rem_size) + \
                               struct.pack("<I", rem_size if rem_size < packet_size else packet_size)
                     self.send_cmd("buff_stream", payload, ["recv_buff_header"])
                     recv_size = struct.unpack("<I", self._response.payload[:4])[0]
                     self.receive()
                     self.verify_response(["recv_buff_content"])
-                    data = self._response
-                    self.receive()
-                    self.verify_response()
-                    # footer = self._response
-                    data_buffer.append(data.payload)
+                    try:
+                        yield self._response.payload
+                    finally:
+                        # footer, read even when the consumer stops early
+                        self.receive()
+                        self.verify_response()
                     rem_size -= recv_size
+                streaming = False
                 self.send_cmd("end_buff_stream")
-                # if not has_error:
-                return data_buffer
-        except Exception as ex:
-            raise ex
+        except GeneratorExit:
+            if streaming:
+                self.send_cmd("end_buff_stream")
+            raise
         finally:
             if disable_device:
                 self.enable_device()
 
+    def _get_data_buffer(self, data_id: int, disable_device=True):
+        """
+        read data buffer from the stream
+        :param data_id: data type to be read
+        :param disable_device: disable device during the command execution
+        :return: DataBuffer object
+        """
+        data_buffer = DataBuffer(self._encoding)
+        for chunk in self._iter_data_stream(data_id, disable_device, data_buffer.reserve):
+            data_buffer.append(chunk)
+        return data_buffer
+
     @property
     def connected(self):
         return self._connected
 
 
 class ZMM220_TFT(ZMM100_TFT):
-    def __init__(self, host, port, encoding, secret_key=0, serial=0):
-        super().__init__(host, port, encoding, secret_key, serial)
+    def __init__(self, host, port, encoding, secret_key=0, serial=0, timeout=20, info_ttl=0):
+        super().__init__(host, port, encoding, secret_key, serial, timeout, info_ttl)
 
     def connect(self, comm_key=0):
         if self._socket:
             self.disconnect()
         super(ZMM100_TFT, self).connect()
-        self._connected = False
-        self._secret_key = 0
-        self._serial = 0
+        self._new_session()
         self.send_cmd("connect", res_cmd_name=["accept_conn"])
         self._secret_key = self._response.secret_key
         if comm_key > 0:
@@ -0,0 +1,716 @@
+import datetime
+import logging
+import random
+import select
+import socket
+import struct
+import threading
+import time
+from .network_utils import packet, BufferHash
+from .utils import device_cmd, device_event, hash_commkey, datetime_to_number, number_to_datetime, get_null_term_str
+from . import models
+
+# command number -> first name of it in device_cmd
+_cmd_names = {}
+for _name, _value in device_cmd.items():
+    _cmd_names.setdefault(_value, _name)
+
+# smallest payload of the requests whose handlers read fixed fields, shorter requests are refused with nak
+_PAYLOAD_SIZES = {
+    "login": 4,
+    "reg_event": 4,
+    "set_time": 4,
+    "start_buff_stream": 4,
+    "buff_stream": 8,
+    "set_user": models.USER_INFO_STRUCT.size,
+    "del_user": 2,
+    "set_fp_ex": 6,
+    "get_fp": 3,
+    "get_fp_ex": 3,
+    "del_fp_ex": 25,
+    "set_face": 26,
+    "get_face": 26,
+    "del_face": 26,
+}
+
+# data ids of start_buff_stream
+_USERS_TABLE = 0x05000901
+_FPS_TABLE = 0x02000701
+_ATT_LOGS_TABLE = 0x0D01
+_OP_LOGS_TABLE = 0x2201
+
+# data ids of cls_data
+_CLEAR_ATT_LOGS = 0x01
+_CLEAR_FPS = 0x02
+_CLEAR_OP_LOGS = 0x04
+_CLEAR_USERS = 0x05
+
+DEFAULT_OPTIONS = {
+    "DeviceID": "1",
+    "~DeviceName": "ZMM220_TFT",
+    "DeviceType": "1",
+    "~ProductTime": "2017-04-28 10:00:00",
+    "~SerialNumber": "EMU0000000001",
+    "Language": "69",
+    "CompatOldFirmware": "0",
+    "IsSupportPull": "1",
+    "CameraOpen": "0",
+    "FingerFunOn": "1",
+    "FaceFunOn": "0",
+    "ZKFaceVersion": "0",
+    "BiometricType": "10",
+    "BuildVersion": "1.0",
+    "AttPhotoForSDK": "0",
+    "~IsOnlyRFMachine": "0",
+    "~SSR": "1",
+    "~PIN2Width": "9",
+    "~OEMVendor": "ZKTeco Inc.",
+    "~Platform": "ZMM220_TFT",
+    "~OS": "1",
+    "~ExtendFmt": "0",
+    "ExtendFmt": "0",
+    "~ExtendOPLog": "1",
+    "~UserExtFmt": "1",
+    "ExtendOPLog": "1",
+    "~ZKFPVersion": "10",
+    "WorkCode": "0",
+    "MAC": "00:17:61:00:00:01",
+    "IPAddress": "127.0.0.1",
+    "COMKey": "0",
+    "UDPPort": "4370",
+    "DaylightSavingTimeOn": "0",
+    "DaylightSavingTime": "0",
+    "StandardTime": "0",
+}
+
+
+def _unsalt(commkey_hash):
+    """
+    hash_commkey xors the key bytes with a random salt that is sent along in the third byte
+    """
+    salt = commkey_hash[2]
+    return bytes(commkey_hash[index] ^ salt for index in (0, 1, 3))
+
+
+class EmulatedDevice(object):
+    def __init__(self, encoding: str = "latin-1", comm_key: int = 0, options: dict = None,
+                 software_version: str = "Ver 6.60 Apr 28 2017"):
+        """
+        in memory state of an emulated device, shared by all sessions of an Emulator
+        :param encoding: encoding of names and person ids
+        :param comm_key: password the clients must log in with, 0 for none
+        :param options: device options returned by get_data and query_sys_op, merged into DEFAULT_OPTIONS
+        :param software_version: reply of soft_ver
+        """
+        self.encoding = encoding
+        self.comm_key = comm_key
+        self.options = dict(DEFAULT_OPTIONS)
+        self.options.update(options or {})
+        self.options["COMKey"] = str(comm_key)
+        self.software_version = software_version
+        self.users = {}  # user serial -> UserInfo
+        self.fps = {}  # (user serial, finger id) -> FPInfo
+        self.att_logs = []
+        self.op_logs = []
+        self.faces = {}  # (person id, face index) -> bytes
+        self.pics = {}  # person id -> bytes
+        self.files = {}  # file name -> bytes
+        self.time_offset = 0.0
+        self.user_max = 3000
+        self.finger_max = 3000
+        self.face_max = 1200
+        self.record_max = 100000
+        self.lock = threading.RLock()
+        self._listeners = []
+
+    @classmethod
+    def populate(cls, users: int = 0, fps_per_user: int = 0, att_logs: int = 0, op_logs: int = 0,
+                 template_size: int = 512, seed: int = 0, **kwargs):
+        """
+        create a device filled with generated data
+        :param users: number of users
+        :param fps_per_user: fingerprints of every user
+        :param att_logs: number of attendance logs, spread over the users
+        :param op_logs: number of operation logs
+        :param template_size: size of every fingerprint template in bytes
+        :param seed: seed of the generated data
+        :param kwargs: arguments of EmulatedDevice
+        :return: EmulatedDevice
+        """
+        device = cls(**kwargs)
+        rnd = random.Random(seed)
+        for serial in range(1, users + 1):
+            user = models.UserInfo(device.encoding)
+            user.id = serial
+            user.name = "user {}".format(serial)
+            user.person_id = str(1000 + serial)
+            user.card_no = rnd.randrange(1 << 24)
+            device.users[serial] = user
+            for finger_id in range(fps_per_user):
+                data = rnd.getrandbits(8 * template_size).to_bytes(template_size, "little")
+                device.fps[(serial, finger_id)] = models.FPInfo(serial, finger_id, 1, data)
+        start = datetime.datetime(2020, 1, 1)
+        for index in range(att_logs):
+            log = models.AttLog()
+            log.serial = index % users + 1 if users else 0
+            log.person_id = str(1000 + log.serial)
+            log.verify_mode = 1
+            log.att_time = start + datetime.timedelta(minutes=index)
+            log.in_out = index % 2
+            log.encoding = device.encoding
+            device.att_logs.append(log)
+        for index in range(op_logs):
+            log = models.OpLog()
+            log.op_id = index % 30
+            log.op_time = start + datetime.timedelta(minutes=index)
+            device.op_logs.append(log)
+        return device
+
+    def now(self):
+        return datetime.datetime.now() + datetime.timedelta(seconds=self.time_offset)
+
+    def user_by_person_id(self, person_id: str):
+        for user in self.users.values():
+            if user.person_id == person_id:
+                return user
+
+    def punch(self, person_id: str, verify_mode: int = 1, in_out: int = 0, att_time: datetime.datetime = None):
+        """
+        record attendance like a user did on the device and push it to the sessions registered for att_log
+        :return: the new AttLog
+        """
+        log = models.AttLog()
+        user = self.user_by_person_id(person_id)
+        log.serial = user.id if user else 0
+        log.person_id = person_id
+        log.verify_mode = verify_mode
+        log.in_out = in_out
+        log.att_time = (att_time or self.now()).replace(microsecond=0)
+        log.encoding = self.encoding
+        with self.lock:
+            self.att_logs.append(log)
+            listeners = list(self._listeners)
+        t = log.att_time
+        record = struct.pack("<24sBB6s", person_id.encode(self.encoding), verify_mode, in_out,
+                             bytes((t.year - 2000, t.month, t.day, t.hour, t.minute, t.second)))
+        for listener in listeners:
+            listener(device_event["att_log"], record)
+        return log
+
+    def add_listener(self, listener):
+        with self.lock:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        with self.lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def state(self):
+        """
+        :return: MachineState with the counts of the device
+        """
+        with self.lock:
+            state = models.MachineState()
+            state.user_count = len(self.users)
+            state.finger_count = len(self.fps)
+            state.face_count = len(self.faces)
+            state.record_count = len(self.att_logs)
+            state.op_record_count = len(self.op_logs)
+            state.admin_count = sum(1 for user in self.users.values() if user.privilege > 0)
+            state.password_count = sum(1 for user in self.users.values() if user.password)
+            state.user_max = self.user_max
+            state.finger_max = self.finger_max
+            state.face_max = self.face_max
+            state.record_max = self.record_max
+            state.user_rem = max(self.user_max - state.user_count, 0)
+            state.finger_rem = max(self.finger_max - state.finger_count, 0)
+            state.face_rem = max(self.face_max - state.face_count, 0)
+            state.record_rem = max(self.record_max - state.record_count, 0)
+            return state
+
+    def table(self, data_id: int):
+        """
+        encode a table the way the device streams it
+        :param data_id: data id of start_buff_stream
+        :return: table bytes or None for unknown data id
+        """
+        with self.lock:
+            if data_id == _USERS_TABLE:
+                return bytes(models.UserInfo.to_buffer([self.users[key] for key in sorted(self.users)]))
+            if data_id == _FPS_TABLE:
+                return bytes(models.FPInfo.to_buffer([self.fps[key] for key in sorted(self.fps)]))
+            if data_id == _ATT_LOGS_TABLE:
+                return bytes(models.AttLog.to_buffer(self.att_logs))
+            if data_id == _OP_LOGS_TABLE:
+                return bytes(models.OpLog.to_buffer(self.op_logs))
+
+    def write_table(self, data: bytes):
+        """
+        apply a table upload (users and fingerprints)
+        :param data: uploaded buffer
+        """
+        users_size, index_size, templates_size = models.UPLOAD_TABLE_HEADER_STRUCT.unpack_from(data)
+        offset = models.UPLOAD_TABLE_HEADER_STRUCT.size
+        users = data[offset: offset + users_size]
+        index = data[offset + users_size: offset + users_size + index_size]
+        templates = data[offset + users_size + index_size: offset + users_size + index_size + templates_size]
+        record_size = models.USER_INFO_STRUCT.size + 1
+        with self.lock:
+            for position in range(0, len(users) - record_size + 1, record_size):
+                user = models.UserInfo.from_bytes(users[position + 1: position + record_size], self.encoding)
+                self.users[user.id] = user
+            entry_size = models.FP_TABLE_ENTRY_STRUCT.size
+            for position in range(0, len(index) - entry_size + 1, entry_size):
+                _, user_id, finger, start = models.FP_TABLE_ENTRY_STRUCT.unpack_from(index, position)
+                size = models.FP_LEN_STRUCT.unpack_from(templates, start)[0]
+                data = bytes(templates[start + 2: start + 2 + size])
+                self.fps[(user_id, finger - 0x10)] = models.FPInfo(user_id, finger - 0x10, 1, data)
+
+
+class _EmulatorSession(threading.Thread):
+    def __init__(self, emulator, conn: socket.socket):
+        super().__init__(name="fpmachine-emulator-session", daemon=True)
+        self._emulator = emulator
+        self._device = emulator.device
+        self._conn = conn
+        self._buffer = bytearray()
+        self._send_lock = threading.Lock()
+        self._session_key = random.randint(0x1000, 0xFFFF)
+        self._logged_in = self._device.comm_key == 0
+        self._stream = None
+        self._upload = bytearray()
+        self._event_flags = 0
+        self._closed = False
+        # the client has every reply and waits, its next request starts a round trip
+        self._answered = True
+
+    def close(self):
+        self._closed = True
+        try:
+            self._conn.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._conn.close()
+
+    def _read(self, size: int):
+        while len(self._buffer) < size:
+            data = self._conn.recv(0x10000)
+            if not data:
+                raise EOFError
+            self._emulator.count("bytes_received", len(data))
+            self._emulator.throttle(len(data))
+            self._buffer += data
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def _read_packet(self):
+        """
+        :return: request packet
+        """
+        header = self._read(8)
+        size = struct.unpack_from("<I", header, 4)[0]
+        return packet(header + self._read(size))
+
+    def _pending(self):
+        """
+        :return: True when the client already sent more data
+        """
+        return len(self._buffer) > 0 or bool(select.select([self._conn], [], [], 0)[0])
+
+    def _send(self, data: bytes):
+        with self._send_lock:
+            self._conn.sendall(data)
+        self._emulator.count("bytes_sent", len(data))
+        self._emulator.throttle(len(data))
+
+    def _reply(self, request: packet, cmd_name="ack", payload=b'', secret_key=None):
+        return bytes(packet(cmd=device_cmd[cmd_name], serial=request.serial,
+                            secret_key=self._session_key if secret_key is None else secret_key, payload=payload))
+
+    def _reply_buffer(self, request: packet, data: bytes, limit=0x10000):
+        """
+        reply data in the header-content-footer form
+        """
+        return (self._reply(request, "recv_buff_header", struct.pack("<II", len(data), limit)) +
+                self._reply(request, "recv_buff_content", data, 0) + self._reply(request))
+
+    def _push_event(self, event: int, data: bytes):
+        if self._event_flags & event and not self._closed:
+            try:
+                self._send(bytes(packet(cmd=device_cmd["reg_event"], serial=0, secret_key=event, payload=data)))
+            except OSError:
+                pass
+
+    def run(self):
+        self._device.add_listener(self._push_event)
+        try:
+            while not self._closed:
+                request = self._read_packet()
+                if not request.is_valid():
+                    raise Exception("invalid packet from client")
+                name = _cmd_names.get(request.cmd)
+                if name == "ack":
+                    # acknowledge of a pushed event
+                    continue
+                self._emulator.count("requests")
+                if self._answered:
+                    self._answered = False
+                    self._emulator.count("round_trips")
+                    if self._emulator.latency:
+                        time.sleep(self._emulator.latency)
+                if not self._logged_in and name not in ("connect", "login", "disconnect"):
+                    reply = self._reply(request, "nak")
+                elif len(request.payload or b"") < _PAYLOAD_SIZES.get(name, 0):
+                    # a device refuses a malformed request and keeps the session
+                    reply = self._reply(request, "nak")
+                else:
+                    reply = self._handle(name, request)
+                if reply:
+                    # a request that arrived before this reply was sent without waiting for it, it belongs
+                    # to the same pipelined batch and round trip
+                    self._answered = not self._pending()
+                    self._send(reply)
+                if name == "disconnect":
+                    break
+        except (EOFError, OSError):
+            pass
+        except Exception as ex:
+            logging.getLogger("server").error("emulator session failed: {}".format(ex))
+        finally:
+            self._device.remove_listener(self._push_event)
+            self.close()
+            self._emulator.remove_session(self)
+
+    def _handle(self, name, request):
+        handler = getattr(self, "_on_" + name, None) if name else None
+        if handler is None:
+            return self._reply(request)
+        try:
+            return handler(request)
+        except (IndexError, ValueError, struct.error) as ex:
+            logging.getLogger("server").info("emulator refused {} request: {}".format(name, ex))
+            return self._reply(request, "nak")
+
+    # session
+
+    def _on_connect(self, request):
+        return self._reply(request, "accept_conn" if self._emulator.model == "ZMM220_TFT" else "ack")
+
+    def _on_login(self, request):
+        if _unsalt(request.payload[:4]) != _unsalt(hash_commkey(self._device.comm_key, self._session_key)):
+            return self._reply(request, "nak")
+        self._logged_in = True
+        return self._reply(request)
+
+    def _on_reg_event(self, request):
+        self._event_flags = struct.unpack("<I", request.payload[:4])[0]
+        return self._reply(request)
+
+    # options and state
+
+    def _on_soft_ver(self, request):
+        return self._reply(request, payload=self._device.software_version.encode("latin-1") + b"\x00")
+
+    def _on_get_time(self, request):
+        return self._reply(request, payload=struct.pack("<I", datetime_to_number(self._device.now())))
+
+    def _on_set_time(self, request):
+        new_time = number_to_datetime(struct.unpack("<I", request.payload[:4])[0])
+        self._device.time_offset = (new_time - datetime.datetime.now()).total_seconds()
+        return self._reply(request)
+
+    def _on_logs_count(self, request):
+        return self._reply(request, payload=bytes(self._device.state()))
+
+    def _on_get_data(self, request):
+        name = bytes(request.payload).decode("latin-1").strip(" \x00")
+        value = self._device.options.get(name)
+        if value is None:
+            return self._reply(request, "no_sys_op")
+        return self._reply(request, payload="{}={}\x00".format(name, value).encode("latin-1"))
+
+    def _on_set_data(self, request):
+        name, _, value = bytes(request.payload).decode("latin-1").strip(" \x00").partition("=")
+        self._device.options[name] = value
+        return self._reply(request)
+
+    def _on_query_sys_op(self, request):
+        names = [item.partition("=")[0] for item in bytes(request.payload).decode("latin-1").strip(" \x00").split(",")]
+        values = ["{}={}".format(name, self._device.options[name]) for name in names if name in self._device.options]
+        return self._reply(request, payload=",".join(values).encode("latin-1") + b"\x00")
+
+    def _on_get_photo_count(self, request):
+        return self._reply(request, payload=struct.pack("<I", len(self._device.pics)))
+
+    def _on_get_table_struct(self, request):
+        return self._reply_buffer(request, b"user,fptemplate,attlog,oplog\x00", 0xFFF8)
+
+    # data streams
+
+    def _on_start_buff_stream(self, request):
+        data_id = struct.unpack("<I", request.payload[:4])[0]
+        table = self._device.table(data_id)
+        if table is None:
+            return self._reply(request, "no_record")
+        self._stream = struct.pack("<I", len(table)) + table
+        size = struct.pack("<I", len(self._stream))
+        return self._reply(request, payload=b"\x00" + size + size + struct.pack("<I", BufferHash(self._stream).value))
+
+    def _on_buff_stream(self, request):
+        offset, size = struct.unpack("<II", request.payload[:8])
+        return self._reply_buffer(request, (self._stream or b"")[offset: offset + size])
+
+    def _on_end_buff_stream(self, request):
+        self._stream = None
+        self._upload = bytearray()
+        return self._reply(request)
+
+    def _on_recv_buff_header(self, request):
+        self._upload = bytearray()
+        return self._reply(request)
+
+    def _on_recv_buff_content(self, request):
+        self._upload += request.payload
+        return self._reply(request)
+
+    def _on_check_hash(self, request):
+        return self._reply(request, payload=struct.pack("<I", BufferHash(self._upload).value))
+
+    def _on_send_file(self, request):
+        payload = bytes(request.payload)
+        if payload == struct.pack("<IHH", models.UPLOAD_TABLE_HEADER_STRUCT.size, 0, models.FP_TABLE_ENTRY_STRUCT.size):
+            if not self._emulator.table_upload:
+                return self._reply(request, "not_support")
+            self._device.write_table(bytes(self._upload))
+        else:
+            self._device.files[get_null_term_str(payload[4:], "latin-1")] = bytes(self._upload)
+        return self._reply(request)
+
+    # users and fingerprints
+
+    def _person_id(self, request):
+        return get_null_term_str(request.payload[:24], self._device.encoding)
+
+    def _on_set_user(self, request):
+        user = models.UserInfo.from_bytes(request.payload, self._device.encoding)
+        with self._device.lock:
+            self._device.users[user.id] = user
+        return self._reply(request)
+
+    def _on_del_user(self, request):
+        user_id = struct.unpack("<H", request.payload[:2])[0]
+        with self._device.lock:
+            self._device.users.pop(user_id, None)
+            for key in [key for key in self._device.fps if key[0] == user_id]:
+                del self._device.fps[key]
+        return self._reply(request)
+
+    def _on_cls_admins(self, request):
+        with self._device.lock:
+            for user in self._device.users.values():
+                user.privilege = 0
+        return self._reply(request)
+
+    def _on_cls_data(self, request):
+        data_id = request.payload[0] if request.payload else 0
+        with self._device.lock:
+            if data_id == _CLEAR_USERS:
+                self._device.users.clear()
+                self._device.fps.clear()
+            elif data_id == _CLEAR_FPS:
+                self._device.fps.clear()
+            elif data_id == _CLEAR_ATT_LOGS:
+                del self._device.att_logs[:]
+            elif data_id == _CLEAR_OP_LOGS:
+                del self._device.op_logs[:]
+        return self._reply(request)
+
+    def _on_del_logs(self, request):
+        with self._device.lock:
+            del self._device.att_logs[:]
+        return self._reply(request)
+
+    def _on_clear_op_log(self, request):
+        with self._device.lock:
+            del self._device.op_logs[:]
+        return self._reply(request)
+
+    def _on_set_fp_ex(self, request):
+        user_id, finger_id, enabled, size = struct.unpack("<HBBH", request.payload[:6])
+        if not self._upload:
+            return self._reply(request, "empty_upload_buffer")
+        with self._device.lock:
+            self._device.fps[(user_id, finger_id)] = models.FPInfo(user_id, finger_id, enabled, bytes(self._upload))
+        return self._reply(request)
+
+    def _get_fp(self, request, trailer_size):
+        user_id, finger_id = struct.unpack("<HB", request.payload[:3])
+        fp_info = self._device.fps.get((user_id, finger_id))
+        if fp_info is None:
+            return self._reply(request, "no_data")
+        trailer = bytes(trailer_size - 1) + bytes([int(fp_info.enabled)])
+        return self._reply_buffer(request, fp_info.data + trailer)
+
+    def _on_get_fp_ex(self, request):
+        return self._get_fp(request, 7)
+
+    def _on_get_fp(self, request):
+        return self._get_fp(request, 6)
+
+    def _on_del_fp_ex(self, request):
+        user = self._device.user_by_person_id(self._person_id(request))
+        finger_id = request.payload[24]
+        with self._device.lock:
+            if user is None or self._device.fps.pop((user.id, finger_id), None) is None:
+                return self._reply(request, "no_fp")
+        return self._reply(request)
+
+    # faces and pictures
+
+    def _on_set_face(self, request):
+        face_index = request.payload[25]
+        self._device.faces[(self._person_id(request), face_index)] = bytes(self._upload)
+        return self._reply(request)
+
+    def _on_get_face(self, request):
+        data = self._device.faces.get((self._person_id(request), request.payload[25]))
+        if data is None:
+            return self._reply(request, "no_data")
+        return self._reply_buffer(request, data)
+
+    def _on_del_face(self, request):
+        self._device.faces.pop((self._person_id(request), request.payload[25]), None)
+        return self._reply(request)
+
+    def _pic_person_id(self, request):
+        return get_null_term_str(request.payload, self._device.encoding)[:-len(".jpg")]
+
+    def _on_set_user_pic(self, request):
+        self._device.pics[self._pic_person_id(request)] = bytes(self._upload)
+        return self._reply(request)
+
+    def _on_get_user_pic(self, request):
+        data = self._device.pics.get(self._pic_person_id(request))
+        if data is None:
+            return self._reply(request, "no_pic")
+        return self._reply_buffer(request, data, 0xFFF8)
+
+    def _on_del_user_pic(self, request):
+        if self._device.pics.pop(self._pic_person_id(request), None) is None:
+            return self._reply(request, "no_pic")
+        return self._reply(request)
+
+
+class Emulator(object):
+    def __init__(self, device: EmulatedDevice = None, host: str = "127.0.0.1", port: int = 0,
+                 model: str = "ZMM220_TFT", latency: float = 0.0, bandwidth: float = None, table_upload=True):
+        """
+        local server that speaks the device protocol over tcp, every client connection is served by its own
+        thread and all of them share one EmulatedDevice
+        :param device: state of the device, default an empty EmulatedDevice
+        :param host: address to listen on
+        :param port: port to listen on, 0 for any free port (see port property after start)
+        :param model: ZMM220_TFT accepts connect with accept_conn, ZMM100_TFT with ack
+        :param latency: seconds added to every round trip, requests pipelined behind another one are not delayed
+        :param bandwidth: bytes per second of each direction of every session, None for unlimited
+        :param table_upload: accept table uploads of users and fingerprints, False to emulate firmware without it
+        """
+        self.device = device or EmulatedDevice()
+        self.model = model
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.table_upload = table_upload
+        self._host = host
+        self._port = port
+        self._socket = None
+        self._thread = None
+        self._sessions = []
+        self._lock = threading.Lock()
+        self.stats = {}
+        self.reset_stats()
+
+    @property
+    def port(self):
+        return self._port
+
+    def reset_stats(self):
+        """
+        zero the counters of connections, requests, round trips (requests the client had to wait for)
+        and bytes in both directions
+        """
+        with self._lock:
+            self.stats = {"connections": 0, "requests": 0, "round_trips": 0, "bytes_received": 0, "bytes_sent": 0}
+
+    def count(self, name: str, value: int = 1):
+        with self._lock:
+            self.stats[name] += value
+
+    def throttle(self, size: int):
+        if self.bandwidth:
+            time.sleep(size / self.bandwidth)
+
+    def remove_session(self, session):
+        with self._lock:
+            if session in self._sessions:
+                self._sessions.remove(session)
+
+    def start(self):
+        """
+        start listening in a background thread
+        :return: the emulator
+        """
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind((self._host, self._port))
+        self._socket.listen(64)
+        self._port = self._socket.getsockname()[1]
+        self._thread = threading.Thread(target=self._accept_loop, name="fpmachine-emulator", daemon=True)
+        self._thread.start()
+        return self
+
+    def _accept_loop(self):
+        while True:
+            try:
+                conn, _ = self._socket.accept()
+            except OSError:
+                return
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            session = _EmulatorSession(self, conn)
+            with self._lock:
+                self._sessions.append(session)
+                self.stats["connections"] += 1
+            session.start()
+
+    def drop_connections(self):
+        """
+        close every client connection like a device that lost the network
+        """
+        with self._lock:
+            sessions = list(self._sessions)
+        for session in sessions:
+            session.close()
+
+    def stop(self):
+        """
+        stop listening and close all sessions
+        """
+        if self._socket is not None:
+            # closing alone does not wake up accept on linux
+            try:
+                self._socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self._socket.close()
+            self._socket = None
+        self.drop_connections()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, _type, value, traceback):
+        self.stop()
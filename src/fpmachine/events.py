@@ -0,0 +1,192 @@
+import asyncio
+import inspect
+import logging
+import threading
+import time
+from .fleet import DeviceSpec
+
+
+class EventSubscription(object):
+    def __init__(self, spec: DeviceSpec, events: list = None, idle_timeout: float = 30, reconnect_delay: float = 5,
+                 timeout: float = 20, poll_interval: float = 1):
+        """
+        real time events of one device on a dedicated session. the session is opened on first use,
+        registered again when nothing arrived for idle_timeout and reopened and registered again
+        when the connection fails
+        :param spec: the device
+        :param events: names of utils.device_event, None for all
+        :param idle_timeout: seconds without events after which the registration is renewed
+        :param reconnect_delay: seconds to wait before reconnecting a failed session
+        :param timeout: socket timeout of the session in seconds
+        :param poll_interval: seconds between checks of stop
+        """
+        self._spec = spec
+        self._events = events
+        self._idle_timeout = idle_timeout
+        self._reconnect_delay = reconnect_delay
+        self._timeout = timeout
+        self._poll_interval = poll_interval
+        self._device = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._logger = logging.getLogger("server")
+
+    def _open(self):
+        device = self._spec.create(self._timeout)
+        device.connect(self._spec.comm_key)
+        self._device = device
+        device.register_events(self._events)
+
+    def _close(self):
+        device, self._device = self._device, None
+        if device is None:
+            return
+        try:
+            device.register_events([])
+            device.disconnect()
+        except Exception:
+            device.abort()
+
+    def __iter__(self):
+        """
+        yield RealTimeEvent objects until stop is called
+        """
+        try:
+            last_activity = time.monotonic()
+            while not self._stop.is_set():
+                try:
+                    if self._device is None:
+                        self._open()
+                        last_activity = time.monotonic()
+                    events = self._device.read_events(self._poll_interval)
+                    if not events:
+                        if time.monotonic() - last_activity >= self._idle_timeout:
+                            # renewing the registration also checks that the session is alive
+                            self._device.register_events(self._events)
+                            last_activity = time.monotonic()
+                        continue
+                except Exception as ex:
+                    self._logger.info("event session of {} failed: {}".format(self._spec, ex))
+                    if self._device is not None:
+                        self._device.abort()
+                        self._device = None
+                    self._stop.wait(self._reconnect_delay)
+                    continue
+                last_activity = time.monotonic()
+                for event in events:
+                    yield event
+        finally:
+            self._close()
+
+    def run(self, callback):
+        """
+        call callback with every event until stop is called
+        :param callback: function that takes RealTimeEvent
+        :return:
+        """
+        for event in self:
+            callback(event)
+
+    def start(self, callback):
+        """
+        run the subscription in a background thread
+        :param callback: function that takes RealTimeEvent, called from the background thread
+        :return:
+        """
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run, args=(callback,), name="fpmachine-events", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """
+        stop the events, the session is closed within poll_interval
+        :return:
+        """
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, _type, value, traceback):
+        self.stop()
+
+
+class AsyncEventSubscription(object):
+    def __init__(self, spec: DeviceSpec, events: list = None, idle_timeout: float = 30, reconnect_delay: float = 5,
+                 timeout: float = 20):
+        """
+        asyncio version of EventSubscription, iterate it with async for and leave the loop (or cancel the
+        task) to stop the events
+        :param spec: the device
+        :param events: names of utils.device_event, None for all
+        :param idle_timeout: seconds without events after which the registration is renewed
+        :param reconnect_delay: seconds to wait before reconnecting a failed session
+        :param timeout: timeout of every response in seconds
+        """
+        self._spec = spec
+        self._events = events
+        self._idle_timeout = idle_timeout
+        self._reconnect_delay = reconnect_delay
+        self._timeout = timeout
+        self._device = None
+        self._logger = logging.getLogger("server")
+
+    async def _open(self):
+        device = self._spec.create_async(self._timeout)
+        await device.connect(self._spec.comm_key)
+        self._device = device
+        await device.register_events(self._events)
+
+    async def _close(self):
+        device, self._device = self._device, None
+        if device is None:
+            return
+        try:
+            await device.register_events([])
+            await device.disconnect()
+        except Exception:
+            device.abort()
+
+    async def __aiter__(self):
+        """
+        yield RealTimeEvent objects
+        """
+        try:
+            while True:
+                try:
+                    if self._device is None:
+                        await self._open()
+                    events = await self._device.read_events(self._idle_timeout)
+                    if not events:
+                        await self._device.register_events(self._events)
+                        continue
+                except Exception as ex:
+                    self._logger.info("event session of {} failed: {}".format(self._spec, ex))
+                    if self._device is not None:
+                        self._device.abort()
+                        self._device = None
+                    await asyncio.sleep(self._reconnect_delay)
+                    continue
+                for event in events:
+                    yield event
+        finally:
+            await self._close()
+
+    async def run(self, callback):
+        """
+        call callback with every event until the task is cancelled
+        :param callback: function or coroutine function that takes RealTimeEvent
+        :return:
+        """
+        events = self.__aiter__()
+        try:
+            async for event in events:
+                result = callback(event)
+                if inspect.isawaitable(result):
+                    await result
+        finally:
+            await events.aclose()
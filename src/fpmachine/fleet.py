@@ -0,0 +1,168 @@
+import asyncio
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from .devices import ZMM100_TFT, ZMM220_TFT
+from .async_devices import AsyncZMM100_TFT, AsyncZMM220_TFT
+
+device_models = {
+    "ZMM100_TFT": (ZMM100_TFT, AsyncZMM100_TFT),
+    "ZMM220_TFT": (ZMM220_TFT, AsyncZMM220_TFT),
+}
+
+
+class DeviceSpec(object):
+    def __init__(self, host: str, port: int = 4370, model: str = "ZMM220_TFT", encoding: str = "latin-1",
+                 comm_key: int = 0):
+        """
+        description of one device in the fleet
+        :param host: ip address or dns name
+        :param port: port number
+        :param model: key of device_models
+        :param encoding: default encoding of the device
+        :param comm_key: password for connection
+        """
+        if model not in device_models:
+            raise Exception("unknown device model: {}".format(model))
+        self.host = host
+        self.port = port
+        self.model = model
+        self.encoding = encoding
+        self.comm_key = comm_key
+
+    def create(self, timeout: float = 20):
+        """
+        create blocking device object
+        """
+        return device_models[self.model][0](self.host, self.port, self.encoding, timeout=timeout)
+
+    def create_async(self, timeout: float = 20):
+        """
+        create asyncio device object
+        """
+        return device_models[self.model][1](self.host, self.port, self.encoding, timeout=timeout)
+
+    def __repr__(self):
+        return "DeviceSpec({}:{} {})".format(self.host, self.port, self.model)
+
+
+class FleetResult(object):
+    def __init__(self, spec: DeviceSpec, result=None, error: Exception = None, elapsed: float = 0.0):
+        """
+        outcome of an operation on one device
+        :param spec: the device
+        :param result: value returned by the operation
+        :param error: exception raised by the device, None on success
+        :param elapsed: seconds spent on the device including connect and disconnect
+        """
+        self.spec = spec
+        self.result = result
+        self.error = error
+        self.elapsed = elapsed
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __repr__(self):
+        return "FleetResult({}, {})".format(self.spec, "ok" if self.ok else repr(self.error))
+
+
+def _run_on_device(spec: DeviceSpec, operation, timeout: float, args, kwargs):
+    start = time.monotonic()
+    device = spec.create(timeout)
+    try:
+        device.connect(spec.comm_key)
+        if callable(operation):
+            result = operation(device, *args, **kwargs)
+        else:
+            result = getattr(device, operation)(*args, **kwargs)
+        return FleetResult(spec, result, elapsed=time.monotonic() - start)
+    except Exception as ex:
+        return FleetResult(spec, error=ex, elapsed=time.monotonic() - start)
+    finally:
+        device.disconnect()
+
+
+def poll(specs: list, operation, *args, max_workers: int = 16, timeout: float = 20, **kwargs):
+    """
+    run an operation on many devices with a thread pool and yield results as devices finish.
+    errors of one device are returned in its result and do not stop the others. when the generator is
+    closed early devices that did not start are skipped and the ones in progress finish in the background
+    :param specs: list of DeviceSpec
+    :param operation: name of device method ("get_att_logs", "get_state", "get_users", ...) or
+                      function that takes connected device as first argument
+    :param args: extra arguments of the operation
+    :param max_workers: maximum number of devices handled at the same time
+    :param timeout: socket timeout of every device in seconds, it limits each connect and reply, not the
+                    whole operation (a long table transfer takes longer), see async_poll for a deadline
+    :param kwargs: extra keyword arguments of the operation
+    :return: generator of FleetResult in order of completion
+    """
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    futures = [executor.submit(_run_on_device, spec, operation, timeout, args, kwargs) for spec in specs]
+    try:
+        for future in as_completed(futures):
+            yield future.result()
+    finally:
+        # never block the caller that stopped iterating on devices that are still running
+        if sys.version_info >= (3, 9):
+            executor.shutdown(wait=False, cancel_futures=True)
+        else:
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+
+async def _run_on_async_device(spec: DeviceSpec, operation, semaphore, timeout: float, args, kwargs):
+    async with semaphore:
+        start = time.monotonic()
+        device = spec.create_async(timeout)
+
+        async def run():
+            await device.connect(spec.comm_key)
+            if callable(operation):
+                return await operation(device, *args, **kwargs)
+            return await getattr(device, operation)(*args, **kwargs)
+        success = False
+        try:
+            result = await asyncio.wait_for(run(), timeout)
+            success = True
+        except Exception as ex:
+            return FleetResult(spec, error=ex, elapsed=time.monotonic() - start)
+        finally:
+            if not success:
+                device.abort()
+        await device.disconnect()
+        return FleetResult(spec, result, elapsed=time.monotonic() - start)
+
+
+async def async_poll(specs: list, operation, *args, concurrency: int = 64, timeout: float = 60, **kwargs):
+    """
+    asyncio version of poll, all devices are handled by one event loop
+    :param specs: list of DeviceSpec
+    :param operation: name of async device method or coroutine function that takes connected device
+    :param args: extra arguments of the operation
+    :param concurrency: maximum number of devices handled at the same time
+    :param timeout: maximum seconds for the whole operation on one device (connect included)
+    :param kwargs: extra keyword arguments of the operation
+    :return: async generator of FleetResult in order of completion
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    tasks = [asyncio.ensure_future(_run_on_async_device(spec, operation, semaphore, timeout, args, kwargs))
+             for spec in specs]
+    try:
+        for task in asyncio.as_completed(tasks):
+            yield await task
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def poll_all(specs: list, operation, *args, max_workers: int = 16, timeout: float = 20, **kwargs):
+    """
+    same as poll but wait for all devices, timeout is the socket timeout as in poll
+    :return: list of FleetResult in the order of specs
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(lambda spec: _run_on_device(spec, operation, timeout, args, kwargs), specs))
@@ -0,0 +1,279 @@
+import bisect
+import threading
+import time
+from .utils import device_cmd
+
+# command number -> first name of device_cmd
+_cmd_names = {}
+for _name, _value in device_cmd.items():
+    _cmd_names.setdefault(_value, _name)
+
+# upper bounds of the latency histogram buckets in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_default_collector = None
+
+
+def cmd_name(cmd: int):
+    """
+    :param cmd: command number of a packet
+    :return: name of the command in device_cmd, the number as string for unknown commands
+    """
+    return _cmd_names.get(cmd) or str(cmd)
+
+
+def set_default_collector(collector):
+    """
+    attach collector to every device object created afterwards, e.g. once at program start
+    :param collector: Collector or None to stop attaching
+    """
+    global _default_collector
+    _default_collector = collector
+
+
+def get_default_collector():
+    return _default_collector
+
+
+class Collector(object):
+    """
+    base of instrumentation collectors, every hook does nothing. hooks are called from the thread
+    (or event loop) of the device, device is "host:port" of the device
+    """
+
+    def request(self, device: str, command: str, size: int):
+        """
+        a request packet of size bytes was sent
+        """
+
+    def response(self, device: str, command: str, response: str, size: int, latency: float = None):
+        """
+        a packet of size bytes was received for command
+        :param response: command name of the received packet, like ack, nak or recv_buff_content
+        :param latency: seconds since the request was sent for the first reply of the request,
+                        None for further packets of the same request and packets pushed by the device
+        """
+
+    def error(self, device: str, command: str, error: Exception):
+        """
+        command failed with error (timeout, closed connection, unexpected reply, ...)
+        """
+
+    def disabled(self, device: str, seconds: float):
+        """
+        the device was enabled again after it was disabled for seconds
+        """
+
+
+class CommandTracker(object):
+    def __init__(self, collector: Collector, device: str):
+        """
+        match the packets of one connection to their commands and feed the collector,
+        replies are matched to requests by serial so pipelined requests are counted right
+        :param collector: Collector
+        :param device: "host:port" of the device
+        """
+        self.collector = collector
+        self._device = device
+        self._requests = {}  # serial -> [command name, send time or None after the first reply]
+        self._last = None
+        self._disabled_since = None
+
+    def request(self, request, size: int, pipelined: bool = False):
+        """
+        :param request: sent packet
+        :param size: bytes sent
+        :param pipelined: more requests are outstanding, keep waiting for their replies
+        """
+        name = cmd_name(request.cmd)
+        if request.cmd != device_cmd["ack"]:
+            # acks of pushed events get no reply
+            if not pipelined:
+                self._requests.clear()
+            self._requests[request.serial] = [name, time.perf_counter()]
+        self.collector.request(self._device, name, size)
+
+    def response(self, response, size: int):
+        """
+        :param response: received packet
+        :param size: bytes received
+        """
+        entry = self._requests.get(response.serial)
+        response_name = cmd_name(response.cmd)
+        latency = None
+        if entry is None:
+            # pushed by the device
+            name = response_name
+        else:
+            name = entry[0]
+            if entry[1] is not None:
+                latency = time.perf_counter() - entry[1]
+                entry[1] = None
+        self.collector.response(self._device, name, response_name, size, latency)
+        if response_name == "ack":
+            if name == "disable" and self._disabled_since is None:
+                self._disabled_since = time.perf_counter()
+            elif name == "enable" and self._disabled_since is not None:
+                self.collector.disabled(self._device, time.perf_counter() - self._disabled_since)
+                self._disabled_since = None
+
+    def error(self, command: str, error: Exception):
+        self.collector.error(self._device, command, error)
+
+
+class CommandStats(object):
+    __slots__ = ("count", "errors", "naks", "bytes_sent", "bytes_received", "latency_sum", "latency_buckets")
+
+    def __init__(self):
+        """
+        counters of one command of one device, latency_buckets[i] counts replies up to LATENCY_BUCKETS[i]
+        seconds and the last bucket the slower ones
+        """
+        self.count = 0
+        self.errors = 0
+        self.naks = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.latency_sum = 0.0
+        self.latency_buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    @property
+    def latency_count(self):
+        return sum(self.latency_buckets)
+
+    def merge(self, other):
+        self.count += other.count
+        self.errors += other.errors
+        self.naks += other.naks
+        self.bytes_sent += other.bytes_sent
+        self.bytes_received += other.bytes_received
+        self.latency_sum += other.latency_sum
+        self.latency_buckets = [a + b for a, b in zip(self.latency_buckets, other.latency_buckets)]
+
+    def __repr__(self):
+        return "CommandStats(count={}, errors={}, naks={}, bytes_sent={}, bytes_received={}, latency_sum={:.6f})" \
+            .format(self.count, self.errors, self.naks, self.bytes_sent, self.bytes_received, self.latency_sum)
+
+
+class InMemoryCollector(Collector):
+    def __init__(self):
+        """
+        keep CommandStats per device and command and the disabled time per device, safe to share
+        between threads and devices
+        """
+        self._lock = threading.Lock()
+        self._commands = {}  # (device, command) -> CommandStats
+        self._disabled = {}  # device -> [count, seconds]
+
+    def _stats(self, device: str, command: str):
+        stats = self._commands.get((device, command))
+        if stats is None:
+            stats = self._commands[(device, command)] = CommandStats()
+        return stats
+
+    def request(self, device: str, command: str, size: int):
+        with self._lock:
+            stats = self._stats(device, command)
+            stats.count += 1
+            stats.bytes_sent += size
+
+    def response(self, device: str, command: str, response: str, size: int, latency: float = None):
+        with self._lock:
+            stats = self._stats(device, command)
+            stats.bytes_received += size
+            if response == "nak":
+                stats.naks += 1
+            if latency is not None:
+                stats.latency_sum += latency
+                stats.latency_buckets[bisect.bisect_left(LATENCY_BUCKETS, latency)] += 1
+
+    def error(self, device: str, command: str, error: Exception):
+        with self._lock:
+            self._stats(device, command).errors += 1
+
+    def disabled(self, device: str, seconds: float):
+        with self._lock:
+            entry = self._disabled.setdefault(device, [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+
+    def commands(self, device: str = None):
+        """
+        :param device: "host:port" of one device, None for all devices
+        :return: dict of (device, command) -> copy of CommandStats
+        """
+        with self._lock:
+            result = {}
+            for key, stats in self._commands.items():
+                if device is None or key[0] == device:
+                    copy = result[key] = CommandStats()
+                    copy.merge(stats)
+            return result
+
+    def disabled_time(self, device: str = None):
+        """
+        :param device: "host:port" of one device, None for all devices
+        :return: dict of device -> (times disabled, seconds disabled)
+        """
+        with self._lock:
+            return {key: tuple(value) for key, value in self._disabled.items() if device is None or key == device}
+
+    def reset(self):
+        with self._lock:
+            self._commands.clear()
+            self._disabled.clear()
+
+    def openmetrics(self):
+        """
+        :return: all counters in OpenMetrics text format
+        """
+        return openmetrics(self)
+
+
+def _escape(value: str):
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(**labels):
+    return "{" + ",".join("{}=\"{}\"".format(key, _escape(str(value))) for key, value in labels.items()) + "}"
+
+
+def openmetrics(collector: InMemoryCollector, prefix: str = "fpmachine"):
+    """
+    export the counters of collector in OpenMetrics text format, e.g. for a prometheus scrape endpoint
+    :param collector: InMemoryCollector
+    :param prefix: prefix of the metric names
+    :return: str
+    """
+    commands = sorted(collector.commands().items())
+    lines = []
+    counters = (
+        ("commands", "requests sent to the device", lambda stats: stats.count),
+        ("command_errors", "commands failed with an exception", lambda stats: stats.errors),
+        ("command_naks", "commands refused by the device with nak", lambda stats: stats.naks),
+        ("sent_bytes", "bytes sent to the device", lambda stats: stats.bytes_sent),
+        ("received_bytes", "bytes received from the device", lambda stats: stats.bytes_received),
+    )
+    for name, help_text, value in counters:
+        lines.append("# TYPE {}_{} counter".format(prefix, name))
+        lines.append("# HELP {}_{} {}".format(prefix, name, help_text))
+        for (device, command), stats in commands:
+            lines.append("{}_{}_total{} {}".format(prefix, name, _labels(device=device, command=command), value(stats)))
+    name = "{}_command_latency_seconds".format(prefix)
+    lines.append("# TYPE {} histogram".format(name))
+    lines.append("# HELP {} seconds from request to first reply".format(name))
+    for (device, command), stats in commands:
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), stats.latency_buckets):
+            cumulative += count
+            lines.append("{}_bucket{} {}".format(name, _labels(device=device, command=command, le=bound), cumulative))
+        lines.append("{}_count{} {}".format(name, _labels(device=device, command=command), cumulative))
+        lines.append("{}_sum{} {}".format(name, _labels(device=device, command=command), stats.latency_sum))
+    disabled = sorted(collector.disabled_time().items())
+    name = "{}_disabled_seconds".format(prefix)
+    lines.append("# TYPE {} counter".format(name))
+    lines.append("# HELP {} time the device was disabled by the client".format(name))
+    for device, (_, seconds) in disabled:
+        lines.append("{}_total{} {}".format(name, _labels(device=device), seconds))
+    lines.append("# EOF")
+    return "\n".join(lines) + "\n"
@@ -1,9 +1,47 @@
 import struct
 
-from .utils import get_null_term_str, number_to_datetime, datetime_to_number
+from .utils import get_null_term_str, number_to_datetime, datetime_to_number, numbers_to_datetime64, \
+    datetime_from_event_bytes, device_event
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# precompiled codecs of the device records
+USER_INFO_STRUCT = struct.Struct("<HB8s24sIB8x24s")
+FP_INFO_STRUCT = struct.Struct("<HBB")
+FP_LEN_STRUCT = struct.Struct("<H")
+MACHINE_STATE_STRUCT = struct.Struct("<16xI4xI4xI4xI4x11I")
+ATT_LOG_STRUCT = struct.Struct("<H24sBIBH6x")
+OP_LOG_STRUCT = struct.Struct("<HHIHHHH")
+# table upload: section sizes (users, fingerprint index, templates) then the sections,
+# index entries point to length prefixed templates by offset
+UPLOAD_TABLE_HEADER_STRUCT = struct.Struct("<III")
+FP_TABLE_ENTRY_STRUCT = struct.Struct("<bHbI")
+
+# size of attendance record pushed by real time event -> layout (person id, verify mode, in out, time)
+# person id is a number in the short layouts, one event may carry several records of the same layout
+_RT_ATT_LOG_STRUCTS = {
+    10: struct.Struct("<HBB6s"),
+    12: struct.Struct("<IBB6s"),
+    14: struct.Struct("<HBB6s4x"),
+    32: struct.Struct("<24sBB6s"),
+    36: struct.Struct("<24sBB6s4x"),
+    37: struct.Struct("<24sBB6s5x"),
+    52: struct.Struct("<24sBB6s20x"),
+}
+
+# privilege level -> value stored in bits 1.. of the user flags and the reverse
+_PRIVILEGE_FLAGS = {2: 3, 3: 7}
+_FLAGS_PRIVILEGE = {1: 1, 3: 2, 7: 3}
 
 
 class UserInfo:
+    __slots__ = ("id", "machine_id", "name", "password", "enabled", "privilege", "card_no", "person_id", "pic",
+                 "_encoding")
+
     def __init__(self, encoding):
         self.id = 0
         self.machine_id = 0
@@ -14,56 +52,77 @@ class UserInfo:
         self.card_no = 0
         self.person_id = ""
         self.pic = None
-        self._data = None
         self._encoding = encoding
 
     @staticmethod
     def from_bytes(data, encoding):
         model = UserInfo(encoding)
-        model._data = data
         if data:
-            model.id = struct.unpack("<H", data[:2])[0]
-            temp = int(data[2])
+            model.id, temp, password, name, model.card_no, _, person_id = USER_INFO_STRUCT.unpack_from(data)
             model.enabled = (temp & 1 == 0)
-            temp = temp >> 1
-            if temp == 1:
-                model.privilege = 1
-            elif temp == 3:
-                model.privilege = 2
-            elif temp == 7:
-                model.privilege = 3
-            else:
-                model.privilege = 0
-            model.password = get_null_term_str(data[3:11], encoding)
-            model.name = get_null_term_str(data[11: 35], encoding)
-            model.card_no = struct.unpack("<I", data[35:39])[0]
-            model.person_id = get_null_term_str(data[48:], encoding)
+            model.privilege = _FLAGS_PRIVILEGE.get(temp >> 1, 0)
+            model.password = get_null_term_str(password, encoding)
+            model.name = get_null_term_str(name, encoding)
+            model.person_id = get_null_term_str(person_id, encoding)
         return model
 
-    def __bytes__(self):
-        output = [0] * 72
-        output[0:2] = struct.pack("<H", self.id)
-        if self.privilege == 2:
-            temp = 3
-        elif self.privilege == 3:
-            temp = 7
-        else:
-            temp = self.privilege
-        temp = temp << 1
+    @classmethod
+    def from_buffer(cls, data, encoding):
+        """
+        decode buffer of 72 byte records
+        :param data: bytes-like object
+        :param encoding: encoding of string fields
+        :return: list of UserInfo
+        """
+        data = memoryview(data)
+        return [cls.from_bytes(data[offset: offset + USER_INFO_STRUCT.size], encoding)
+                for offset in range(0, len(data) - USER_INFO_STRUCT.size + 1, USER_INFO_STRUCT.size)]
+
+    @classmethod
+    def to_buffer(cls, models):
+        """
+        encode users into one buffer of 72 byte records
+        :param models: list of UserInfo
+        :return: bytearray
+        """
+        output = bytearray(USER_INFO_STRUCT.size * len(models))
+        for index, model in enumerate(models):
+            model.pack_into(output, index * USER_INFO_STRUCT.size)
+        return output
+
+    @classmethod
+    def to_table(cls, models):
+        """
+        encode users into the user section of a table upload, 72 byte records each one after a marker byte
+        :param models: list of UserInfo
+        :return: bytearray
+        """
+        size = USER_INFO_STRUCT.size + 1
+        output = bytearray(size * len(models))
+        for index, model in enumerate(models):
+            output[index * size] = 2
+            model.pack_into(output, index * size + 1)
+        return output
+
+    def pack_into(self, buffer, offset=0):
+        """
+        write the 72 byte record into buffer at offset
+        """
+        temp = _PRIVILEGE_FLAGS.get(self.privilege, self.privilege) << 1
         temp = temp | (0 if self.enabled else 1)
-        output[2] = temp
-        temp = self.password.encode(self._encoding)
-        output[3: 3 + len(temp)] = temp
-        temp = self.name.encode(self._encoding)
-        output[11: 11 + len(temp)] = temp
-        output[35:39] = struct.pack("<I", self.card_no)
-        output[39] = 1
-        temp = self.person_id.encode(self._encoding)
-        output[48: 48 + len(temp)] = temp
+        USER_INFO_STRUCT.pack_into(buffer, offset, self.id, temp, self.password.encode(self._encoding),
+                                   self.name.encode(self._encoding), self.card_no, 1,
+                                   self.person_id.encode(self._encoding))
+
+    def __bytes__(self):
+        output = bytearray(USER_INFO_STRUCT.size)
+        self.pack_into(output)
         return bytes(output)
 
 
 class FPInfo:
+    __slots__ = ("machine_id", "user_id", "finger_id", "enabled", "data")
+
     def __init__(self, user_id=0, finger_id=0, enabled=True, data=None):
         self.machine_id = 0
         self.user_id = user_id
@@ -75,15 +134,171 @@ class FPInfo:
     def from_bytes(data):
         model = FPInfo()
         if data:
-            model.user_id, model.finger_id, model.enabled = struct.unpack("<HBB", data[:4])
-            model.data = data[4:]
+            model.user_id, model.finger_id, model.enabled = FP_INFO_STRUCT.unpack_from(data)
+            model.data = bytes(data[FP_INFO_STRUCT.size:])
         return model
 
+    @classmethod
+    def from_buffer(cls, data):
+        """
+        decode fingerprint table, every entry starts with 2 byte length that include itself
+        :param data: bytes-like object
+        :return: list of FPInfo
+        """
+        data = memoryview(data)
+        index = 0
+        ret = []
+        while index < len(data):
+            seg_len = FP_LEN_STRUCT.unpack_from(data, index)[0]
+            if seg_len < FP_LEN_STRUCT.size:
+                raise Exception("invalid fingerprint entry length")
+            ret.append(cls.from_bytes(data[index + FP_LEN_STRUCT.size: index + seg_len]))
+            index += seg_len
+        return ret
+
+    @classmethod
+    def to_buffer(cls, models):
+        """
+        encode fingerprints into fingerprint table format (length prefixed entries)
+        :param models: list of FPInfo
+        :return: bytearray
+        """
+        header_size = FP_LEN_STRUCT.size + FP_INFO_STRUCT.size
+        output = bytearray(sum(header_size + len(model.data) for model in models))
+        offset = 0
+        for model in models:
+            size = header_size + len(model.data)
+            FP_LEN_STRUCT.pack_into(output, offset, size)
+            model.pack_into(output, offset + FP_LEN_STRUCT.size)
+            offset += size
+        return output
+
+    @classmethod
+    def to_table(cls, models):
+        """
+        encode fingerprints into the index and template sections of a table upload, the index has no field
+        for the enabled flag so only templates with enabled == 1 can be uploaded this way
+        :param models: list of FPInfo
+        :return: tuple of index bytearray and templates bytearray
+        """
+        index = bytearray(FP_TABLE_ENTRY_STRUCT.size * len(models))
+        templates = bytearray()
+        for position, model in enumerate(models):
+            FP_TABLE_ENTRY_STRUCT.pack_into(index, position * FP_TABLE_ENTRY_STRUCT.size, 2, model.user_id,
+                                            0x10 + model.finger_id, len(templates))
+            templates += FP_LEN_STRUCT.pack(len(model.data))
+            templates += model.data
+        return index, templates
+
+    def pack_into(self, buffer, offset=0):
+        """
+        write fingerprint header and data into buffer at offset
+        """
+        FP_INFO_STRUCT.pack_into(buffer, offset, self.user_id, self.finger_id, self.enabled)
+        offset += FP_INFO_STRUCT.size
+        buffer[offset: offset + len(self.data)] = self.data
+
     def __bytes__(self):
-        return struct.pack("<HBB", self.user_id, self.finger_id, self.enabled) + self.data
+        return FP_INFO_STRUCT.pack(self.user_id, self.finger_id, self.enabled) + self.data
+
+
+# option name of query_sys_op / get_data -> (DeviceInfo attribute, value type)
+DEVICE_INFO_OPTIONS = {
+    "DeviceID": ("id", int),
+    "~DeviceName": ("name", str),
+    "DeviceType": ("type", str),
+    "~ProductTime": ("product_time", str),
+    "~SerialNumber": ("serial_number", str),
+    "Language": ("language", int),
+    "CompatOldFirmware": ("compat_old_firmware", bool),
+    "IsSupportPull": ("is_support_pull", bool),
+    "CameraOpen": ("camera_open", bool),
+    "FingerFunOn": ("finger_fun_on", bool),
+    "FaceFunOn": ("face_fun_on", bool),
+    "ZKFaceVersion": ("zk_face_version", int),
+    "BiometricType": ("biometric_type", str),
+    "BuildVersion": ("build_version", str),
+    "AttPhotoForSDK": ("att_photo_for_sdk", bool),
+    "~IsOnlyRFMachine": ("is_only_rf_machine", bool),
+    "~SSR": ("ssr", bool),
+    "~PIN2Width": ("pin_width", int),
+    "~OEMVendor": ("vendor", str),
+    "~Platform": ("platform", str),
+    "~OS": ("os", str),
+    "~ExtendFmt": ("extend_fmt_1", int),
+    "ExtendFmt": ("extend_fmt_2", int),
+    "~ExtendOPLog": ("extend_oplog_1", int),
+    "~UserExtFmt": ("user_ext_fmt", int),
+    "ExtendOPLog": ("extend_oplog_2", int),
+    "~ZKFPVersion": ("fp_version", int),
+    "WorkCode": ("work_code", str),
+    "MAC": ("mac_address", str),
+    "IPAddress": ("ip_address", str),
+    "UDPPort": ("port", int),
+    "DaylightSavingTimeOn": ("daylight_saving_timeon", str),
+    "DaylightSavingTime": ("daylight_saving_time", str),
+    "StandardTime": ("standard_time", str),
+}
+
+
+class DeviceInfo:
+    __slots__ = ("options",) + tuple(attr for attr, _ in DEVICE_INFO_OPTIONS.values())
+
+    def __init__(self, options=None):
+        """
+        typed snapshot of the device options, options missing in the device are None
+        :param options: dict of option name -> raw string value
+        """
+        self.options = options or {}
+        for option, (attr, kind) in DEVICE_INFO_OPTIONS.items():
+            setattr(self, attr, self._convert(self.options.get(option), kind))
+
+    @staticmethod
+    def _convert(value, kind):
+        if value is None or kind is str:
+            return value
+        try:
+            number = int(value)
+        except ValueError:
+            return value
+        return number != 0 if kind is bool else number
+
+    @staticmethod
+    def parse_options(text):
+        """
+        split reply of query_sys_op into option values
+        :param text: "name=value,name=value..." string
+        :return: dict of option name -> value
+        """
+        options = {}
+        for item in text.strip(" \x00").split(","):
+            name, sep, value = item.partition("=")
+            if sep:
+                options[name.strip(" \x00")] = value.strip(" \x00")
+        return options
+
+    @staticmethod
+    def queries(options=None, size=21):
+        """
+        group option names into query_sys_op query strings
+        :param options: option names, default all options of DeviceInfo
+        :param size: maximum number of options in one query
+        :return: list of query strings
+        """
+        options = list(DEVICE_INFO_OPTIONS if options is None else options)
+        return [",".join(option + "=?" for option in options[index: index + size])
+                for index in range(0, len(options), size)]
+
+    def __repr__(self):
+        return "DeviceInfo(serial_number={!r}, platform={!r}, fp_version={!r})".format(
+            self.serial_number, self.platform, self.fp_version)
 
 
 class MachineState:
+    __slots__ = ("machine_id", "user_count", "finger_count", "face_count", "record_count", "op_record_count",
+                 "admin_count", "password_count", "user_max", "finger_max", "face_max", "record_max", "user_rem",
+                 "finger_rem", "face_rem", "record_rem")
+
     def __init__(self):
         self.machine_id = 0
         self.user_count = 0
@@ -136,32 +351,35 @@ class MachineState:
         model.record_rem, \
         model.face_count, \
         model.face_rem, \
-        model.face_max = struct.unpack("<16xI4xI4xI4xI4x11I", data[:23 * 4])
+        model.face_max = MACHINE_STATE_STRUCT.unpack_from(data)
         return model
 
     def __bytes__(self):
-        return struct.pack("<16xI4xI4xI4xI4x11I20x",
-                           self.user_count,
-                           self.finger_count,
-                           self.record_count,
-                           self.op_record_count,
-                           self.admin_count,
-                           self.password_count,
-                           self.finger_max,
-                           self.user_max,
-                           self.record_max,
-                           self.finger_rem,
-                           self.user_rem,
-                           self.record_rem,
-                           self.face_count,
-                           self.face_rem,
-                           self.face_max)
+        return MACHINE_STATE_STRUCT.pack(self.user_count,
+                                         self.finger_count,
+                                         self.record_count,
+                                         self.op_record_count,
+                                         self.admin_count,
+                                         self.password_count,
+                                         self.finger_max,
+                                         self.user_max,
+                                         self.record_max,
+                                         self.finger_rem,
+                                         self.user_rem,
+                                         self.record_rem,
+                                         self.face_count,
+                                         self.face_rem,
+                                         self.face_max) + bytes(20)
 
 
 class AttLog:
+    __slots__ = ("machine_id", "_att_time", "_time", "person_id", "serial", "verify_mode", "in_out", "work_code",
+                 "encoding")
+
     def __init__(self):
         self.machine_id = 0
-        self.att_time = None
+        self._att_time = None
+        self._time = None
         self.person_id = ""
         self.serial = 0
         self.verify_mode = 0
@@ -169,43 +387,381 @@ class AttLog:
         self.work_code = 0
         self.encoding = ""
 
+    @property
+    def att_time(self):
+        """
+        attendance time, packed device time is converted to datetime on first read
+        """
+        if self._att_time is None and self._time is not None:
+            self._att_time = number_to_datetime(self._time)
+        return self._att_time
+
+    @att_time.setter
+    def att_time(self, val):
+        self._att_time = val
+        self._time = None
+
     @staticmethod
     def from_bytes(data, encoding):
         model = AttLog()
         if data:
-            model.serial = struct.unpack("<H", data[:2])[0]
-            model.person_id = get_null_term_str(data[2:26], encoding)
-            model.verify_mode, date, model.in_out, model.work_code = struct.unpack("<BIBH", data[26:34])
-            model.att_time = number_to_datetime(date)
+            model.serial, person_id, model.verify_mode, model._time, model.in_out, model.work_code \
+                = ATT_LOG_STRUCT.unpack_from(data)
+            model.person_id = get_null_term_str(person_id, encoding)
             model.encoding = encoding
         return model
 
+    @classmethod
+    def from_buffer(cls, data, encoding):
+        """
+        decode buffer of 40 byte records
+        :param data: bytes-like object
+        :param encoding: encoding of person id
+        :return: list of AttLog
+        """
+        data = memoryview(data)
+        return [cls.from_bytes(data[offset: offset + ATT_LOG_STRUCT.size], encoding)
+                for offset in range(0, len(data) - ATT_LOG_STRUCT.size + 1, ATT_LOG_STRUCT.size)]
+
+    @classmethod
+    def to_buffer(cls, models):
+        """
+        encode attendance logs into one buffer of 40 byte records
+        :param models: list of AttLog
+        :return: bytearray
+        """
+        output = bytearray(ATT_LOG_STRUCT.size * len(models))
+        for index, model in enumerate(models):
+            model.pack_into(output, index * ATT_LOG_STRUCT.size)
+        return output
+
+    def pack_into(self, buffer, offset=0):
+        """
+        write the 40 byte record into buffer at offset
+        """
+        date = self._time if self._att_time is None else datetime_to_number(self._att_time)
+        ATT_LOG_STRUCT.pack_into(buffer, offset, self.serial, self.person_id.encode(self.encoding), self.verify_mode,
+                                 date, self.in_out, self.work_code)
+
     def __bytes__(self):
-        output = [0] * 40
-        output[0:2] = struct.pack("<H", self.serial)
-        b_userid = self.person_id.encode(self.encoding)
-        output[2:2 + len(b_userid)] = b_userid
-        output[26:34] = struct.pack("<BIBH", self.verify_mode, datetime_to_number(self.att_time), self.in_out,
-                                    self.work_code)
+        output = bytearray(ATT_LOG_STRUCT.size)
+        self.pack_into(output)
         return bytes(output)
 
 
+# layout of the 40 byte attendance record
+ATT_LOG_DTYPE = numpy.dtype({
+    "names": ["serial", "person_id", "verify_mode", "time", "in_out", "work_code"],
+    "formats": ["<u2", "S24", "u1", "<u4", "u1", "<u2"],
+    "offsets": [0, 2, 26, 27, 31, 32],
+    "itemsize": 40
+}) if numpy is not None else None
+
+
+class AttLogBatch:
+    def __init__(self, records, encoding):
+        """
+        columnar view of attendance logs, records are decoded to AttLog only when accessed
+        :param records: numpy array of ATT_LOG_DTYPE
+        :param encoding: encoding of person_id
+        """
+        self._records = records
+        self._att_time = None
+        self.encoding = encoding
+
+    @staticmethod
+    def from_bytes(data, encoding):
+        """
+        map buffer of 40 byte records without copying it
+        :param data: bytes-like object its length is multiple of 40
+        :param encoding: encoding of person_id
+        :return: AttLogBatch
+        """
+        if numpy is None:
+            raise ImportError("numpy is required for AttLogBatch")
+        return AttLogBatch(numpy.frombuffer(data, dtype=ATT_LOG_DTYPE, count=len(data) // 40), encoding)
+
+    @property
+    def serial(self):
+        return self._records["serial"]
+
+    @property
+    def person_id(self):
+        """
+        raw person ids as fixed length bytes (S24) array
+        """
+        return self._records["person_id"]
+
+    @property
+    def verify_mode(self):
+        return self._records["verify_mode"]
+
+    @property
+    def time(self):
+        """
+        packed device time of each record
+        """
+        return self._records["time"]
+
+    @property
+    def in_out(self):
+        return self._records["in_out"]
+
+    @property
+    def work_code(self):
+        return self._records["work_code"]
+
+    @property
+    def att_time(self):
+        """
+        attendance time of each record as datetime64[s], converted once for the whole batch
+        """
+        if self._att_time is None:
+            self._att_time = numbers_to_datetime64(self.time)
+        return self._att_time
+
+    def __len__(self):
+        return len(self._records)
+
+    def __getitem__(self, index):
+        """
+        return AttLog for integer index or AttLogBatch for slice or mask
+        """
+        if isinstance(index, (int, numpy.integer)):
+            return AttLog.from_bytes(self._records[index].tobytes(), self.encoding)
+        return AttLogBatch(self._records[index], self.encoding)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def to_list(self):
+        """
+        convert the batch into list of AttLog object
+        :return: list of AttLog object
+        """
+        return list(self)
+
+
 class OpLog:
+    __slots__ = ("machine_id", "op_id", "_op_time", "_time", "admin", "param_1", "param_2", "param_3", "param_4")
+
     def __init__(self):
         self.machine_id = 0
         self.op_id = 0
-        self.op_time = None
+        self._op_time = None
+        self._time = None
         self.admin = 0
         self.param_1 = 0
         self.param_2 = 0
         self.param_3 = 0
         self.param_4 = 0
 
+    @property
+    def op_time(self):
+        """
+        operation time, packed device time is converted to datetime on first read
+        """
+        if self._op_time is None and self._time is not None:
+            self._op_time = number_to_datetime(self._time)
+        return self._op_time
+
+    @op_time.setter
+    def op_time(self, val):
+        self._op_time = val
+        self._time = None
+
     @staticmethod
     def from_bytes(data):
         model = OpLog()
         if data:
-            model.admin, model.op_id, date, model.param_1, model.param_2, model.param_3, model.param_4 \
-                 = struct.unpack("<HHIHHHH", data[:16])
-            model.op_time = number_to_datetime(date)
-        return model
\ No newline at end of file
+            model.admin, model.op_id, model._time, model.param_1, model.param_2, model.param_3, model.param_4 \
+                 = OP_LOG_STRUCT.unpack_from(data)
+        return model
+
+    @classmethod
+    def from_buffer(cls, data):
+        """
+        decode buffer of 16 byte records
+        :param data: bytes-like object
+        :return: list of OpLog
+        """
+        data = memoryview(data)
+        return [cls.from_bytes(data[offset: offset + OP_LOG_STRUCT.size])
+                for offset in range(0, len(data) - OP_LOG_STRUCT.size + 1, OP_LOG_STRUCT.size)]
+
+    @classmethod
+    def to_buffer(cls, models):
+        """
+        encode op logs into one buffer of 16 byte records
+        :param models: list of OpLog
+        :return: bytearray
+        """
+        output = bytearray(OP_LOG_STRUCT.size * len(models))
+        for index, model in enumerate(models):
+            model.pack_into(output, index * OP_LOG_STRUCT.size)
+        return output
+
+    def pack_into(self, buffer, offset=0):
+        """
+        write the 16 byte record into buffer at offset
+        """
+        date = self._time if self._op_time is None else datetime_to_number(self._op_time)
+        OP_LOG_STRUCT.pack_into(buffer, offset, self.admin, self.op_id, date, self.param_1, self.param_2,
+                                self.param_3, self.param_4)
+
+    def __bytes__(self):
+        output = bytearray(OP_LOG_STRUCT.size)
+        self.pack_into(output)
+        return bytes(output)
+
+
+class AttLogWatermark:
+    __slots__ = ("count", "last_time", "last_person_id", "last_keys")
+
+    def __init__(self, count=0, last_time=None, last_person_id="", last_keys=()):
+        """
+        position of the last attendance log already read from a device
+        :param count: number of records in the device table
+        :param last_time: packed device time of the last record, None for empty table
+        :param last_person_id: person id of the last record
+        :param last_keys: (person_id, serial) of the records read at last_time, they are skipped when
+                          records are selected by time
+        """
+        self.count = count
+        self.last_time = last_time
+        self.last_person_id = last_person_id
+        self.last_keys = frozenset((str(person_id), int(serial)) for person_id, serial in last_keys)
+
+    @staticmethod
+    def _log_time(log):
+        return log._time if log._att_time is None else datetime_to_number(log._att_time)
+
+    @classmethod
+    def from_logs(cls, logs):
+        """
+        watermark at the end of the attendance table
+        :param logs: sequence of AttLog as returned by get_att_logs
+        :return: AttLogWatermark
+        """
+        if not logs:
+            return cls()
+        last = logs[-1]
+        last_time = cls._log_time(last)
+        keys = []
+        # only the tail is decoded, records of one second are stored next to each other
+        for index in range(len(logs) - 1, -1, -1):
+            log = logs[index]
+            if cls._log_time(log) != last_time:
+                break
+            keys.append((log.person_id, log.serial))
+        return cls(len(logs), last_time, last.person_id, keys)
+
+    def is_current(self, state):
+        """
+        check whether the device has no new record using its logs_count, a table that was cleared and
+        refilled to the same count in between is not detected
+        :param state: MachineState of the device
+        """
+        return state.record_count == self.count
+
+    def new_logs(self, logs):
+        """
+        select records after the watermark. when the table only grew the new records are its tail and old
+        ones are not decoded. when the table shrank it was cleared and every record is new, otherwise
+        records are selected by time, records of last_time that were already read are skipped
+        :param logs: sequence of AttLog as returned by get_att_logs
+        :return: list of AttLog
+        """
+        if not logs:
+            return []
+        if self.last_time is None or len(logs) < self.count:
+            return list(logs)
+        if self.count > 0:
+            last = logs[self.count - 1]
+            if self._log_time(last) == self.last_time and last.person_id == self.last_person_id:
+                return list(logs[self.count:])
+        return [log for log in logs if self._log_time(log) > self.last_time or
+                (self._log_time(log) == self.last_time and (log.person_id, log.serial) not in self.last_keys)]
+
+    def to_dict(self):
+        return {"count": self.count, "last_time": self.last_time, "last_person_id": self.last_person_id,
+                "last_keys": sorted([person_id, serial] for person_id, serial in self.last_keys)}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.get("count", 0), data.get("last_time"), data.get("last_person_id", ""),
+                   data.get("last_keys", ()))
+
+    def __eq__(self, other):
+        return isinstance(other, AttLogWatermark) and self.to_dict() == other.to_dict()
+
+    def __hash__(self):
+        # watermarks are values, a new one is returned instead of changing the old one
+        return hash((self.count, self.last_time, self.last_person_id, self.last_keys))
+
+    def __repr__(self):
+        return "AttLogWatermark(count={}, last_time={}, last_person_id={!r}, last_keys={})".format(
+            self.count, self.last_time, self.last_person_id, len(self.last_keys))
+
+
+class RealTimeEvent:
+    __slots__ = ("event", "data", "att_log")
+
+    def __init__(self, event=0, data=b"", att_log=None):
+        """
+        event pushed by the device after reg_event
+        :param event: event flag (values of utils.device_event)
+        :param data: raw event data
+        :param att_log: decoded AttLog of att_log events
+        """
+        self.event = event
+        self.data = data
+        self.att_log = att_log
+
+    @property
+    def name(self):
+        for name, flag in device_event.items():
+            if flag == self.event:
+                return name
+        return hex(self.event)
+
+    @staticmethod
+    def from_bytes(event, data, encoding):
+        """
+        decode the payload of one pushed event packet
+        :param event: event flag from the packet header
+        :param data: packet payload
+        :param encoding: encoding of person id
+        :return: list of RealTimeEvent, att_log events may carry several records
+        """
+        data = bytes(data)
+        if event != device_event["att_log"]:
+            return [RealTimeEvent(event, data)]
+        events = []
+        offset = 0
+        while len(data) - offset >= 10:
+            rest = len(data) - offset
+            codec = _RT_ATT_LOG_STRUCTS.get(rest)
+            if codec is None:
+                # several records of the same layout
+                codec = next((_RT_ATT_LOG_STRUCTS[size] for size in (52, 36, 32) if rest % size == 0), None)
+            if codec is None:
+                break
+            person_id, verify_mode, in_out, att_time = codec.unpack_from(data, offset)
+            log = AttLog()
+            log.person_id = str(person_id) if isinstance(person_id, int) else get_null_term_str(person_id, encoding)
+            log.verify_mode = verify_mode
+            log.in_out = in_out
+            try:
+                log.att_time = datetime_from_event_bytes(att_time)
+            except ValueError:
+                # the device clock sent an impossible date, keep the event without time
+                log.att_time = None
+            log.encoding = encoding
+            events.append(RealTimeEvent(event, data[offset: offset + codec.size], log))
+            offset += codec.size
+        return events or [RealTimeEvent(event, data)]
+
+    def __repr__(self):
+        return "RealTimeEvent({}, {})".format(self.name, self.att_log.person_id if self.att_log else len(self.data))
@@ -1,7 +1,48 @@
 import struct
+from collections.abc import Sequence
 
-from .models import UserInfo, AttLog, FPInfo, OpLog
-from .utils import split_list
+from .models import UserInfo, AttLog, AttLogBatch, FPInfo, OpLog
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# below this size the numpy call overhead costs more than it saves
+NUMPY_CHECKSUM_THRESHOLD = 0x1000
+
+
+def words_sum(data):
+    """
+    ones' complement sum of the little-endian 16-bit words in data, an odd trailing byte
+    counts as a word with zero high byte. the result is folded into range 0..0xFFFF so partial
+    sums of different parts of a packet can be added together and folded again with fold_sum
+    :param data: bytes-like object (bytes, bytearray or memoryview)
+    :return: folded sum
+    """
+    size = len(data)
+    if size == 0:
+        return 0
+    if numpy is not None and size >= NUMPY_CHECKSUM_THRESHOLD:
+        total = int(numpy.frombuffer(data, dtype="<u2", count=size // 2).sum(dtype=numpy.uint64))
+        if size % 2 > 0:
+            total += data[-1]
+    else:
+        # 0x10000 == 1 (mod 0xFFFF) so the whole buffer read as one little-endian number
+        # has the same ones' complement sum as its 16-bit words
+        total = int.from_bytes(data, "little")
+    return fold_sum(total)
+
+
+def fold_sum(total: int):
+    """
+    fold carries of a (possibly unbounded) sum into 16 bits the same way the device does
+    :param total: sum of words or of folded partial sums
+    :return: number in range 0..0xFFFF, 0 only when total is 0
+    """
+    if total == 0:
+        return 0
+    return (total - 1) % 0xFFFF + 1
 
 
 class packet(object):
@@ -20,10 +61,11 @@ class packet(object):
         self._secret_key = secret_key  # generate random word key
         self._serial = serial
         self._payload = payload
+        self._payload_sum = None
         self._size = len(self._payload) + 8
         if data is not None:
             if len(data) >= 8:
-                self._header = data[0:4]
+                self._header = bytes(data[0:4])
                 self._size = struct.unpack("<I", data[4:8])[0]
             if len(data) >= 16:
                 self._cmd, self._checksum, self._secret_key, self._serial = struct.unpack("<HHHH", data[8:16])
@@ -41,8 +83,7 @@ class packet(object):
         if check_size:
             ret &= self._size == len(self._payload) + 8
         if check_sum:
-            data = bytes(self)
-            ret &= self._checksum == struct.unpack("<H", data[10:12])[0]
+            ret &= self._checksum == self.compute_checksum()
         return ret
 
     @property
@@ -65,20 +106,49 @@ class packet(object):
     def payload(self):
         return self._payload
 
+    def detach(self):
+        """
+        copy payload out of the buffer it was received into, packets created by
+        ClientConnection.receive share one receive buffer and their payload is overwritten by
+        the next receive, call this to keep the packet after that
+        :return: the packet itself
+        """
+        if isinstance(self._payload, memoryview):
+            self._payload = bytes(self._payload)
+        return self
+
+    def payload_sum(self):
+        """
+        folded sum of the payload words, computed once per packet
+        :return: number in range 0..0xFFFF
+        """
+        if self._payload_sum is None:
+            self._payload_sum = words_sum(self._payload or b'')
+        return self._payload_sum
+
+    def compute_checksum(self):
+        """
+        calculate packet checksum by adding header fields to the cached payload sum
+        the result is the same as calculate_checksum(bytes(self))
+        :return: 2 byte number
+        """
+        return (~fold_sum(self._cmd + self._secret_key + self._serial + self.payload_sum())) & 0xFFFF
+
+    def header_bytes(self):
+        """
+        return the 16 byte packet header (size and checksum are calculated from current payload)
+        :return: header as data bytes
+        """
+        self._size = len(self.payload or b'') + 8
+        return self._header + struct.pack("<IHHHH", self._size, self._cmd, self.compute_checksum(),
+                                          self._secret_key, self._serial)
+
     def __bytes__(self):
         """
         return packet in form of data bytes
         :return: packet as data bytes
         """
-        self._size = len(self.payload or b'') + 8
-        output = self._header
-        checksum = 0
-        output += struct.pack("<IHHHH", self._size, self._cmd, checksum, self._secret_key, self._serial)
-        if self.payload:
-            output += self.payload
-        checksum = self.calculate_checksum(output)
-        return self._header + struct.pack("<IHHHH", self._size, self._cmd, checksum,
-                                          self._secret_key, self._serial) + self.payload
+        return b''.join((self.header_bytes(), self.payload or b''))
 
     @staticmethod
     def calculate_checksum(input_list):
@@ -87,33 +157,212 @@ class packet(object):
         :param input_list: packet in form of bytes
         :return: 2 byte number
         """
-        _sum = 0
-        size = (len(input_list) // 2) * 2
-        for x in range(8, size, 2):
-            if x == 10:
-                continue
-            _sum += struct.unpack("<H", input_list[x:x+2])[0]
-            if (_sum >> 31) & 1 == 1:
-                _sum = (_sum & 0xFFFF) + (_sum >> 0x10)
-        if len(input_list) % 2 > 0:
-            _sum += input_list[-1]
-        num = _sum
-        while num > 0:
-            num = _sum >> 0x10
-            _sum = (_sum & 0xFFFF) + num
-        return (~_sum) & 0xFFFF
+        size = len(input_list)
+        data = memoryview(input_list)
+        if size < 12:
+            # too short to carry a checksum field
+            _sum = struct.unpack("<H", data[8:10])[0] if size >= 10 else 0
+            if size % 2 > 0:
+                _sum += data[-1]
+        else:
+            # words from offset 8 except the checksum field itself at offset 10
+            _sum = words_sum(data[8:10]) + words_sum(data[12:])
+        return (~fold_sum(_sum)) & 0xFFFF
+
+
+def _hash_fold_table():
+    table = []
+    for index in range(0x101):
+        top = index & 0xF
+        fold = 0
+        if top > 0:
+            fold = top << 4
+            if top & 0x8 > 0:
+                fold = fold | 0xFFFFFF00
+            fold = (fold ^ (top << 28)) & 0xFFFFFFFF
+        # bits shifted past 32 bits are cleared by the same xor
+        table.append(fold ^ ((index >> 4) << 32))
+    return table
+
+
+_HASH_FOLD = _hash_fold_table()
+
+
+class BufferHash(object):
+    def __init__(self, data=None):
+        """
+        incremental form of the buffer hash used by the device for check_hash and buffer streams
+        :param data: optional first part of the data
+        """
+        self._state = 0
+        if data is not None:
+            self.update(data)
+
+    def update(self, data):
+        """
+        add more data to the hash, feeding a buffer in parts gives the same value as feeding it at once
+        :param data: bytes-like object
+        :return:
+        """
+        state = self._state
+        table = _HASH_FOLD
+        for x in data:
+            # the state is shifted a nibble per byte and the nibble leaving 32 bits is folded back
+            # by table lookup, index is (shifted state >> 28) which is at most 0x100
+            state = (state << 4) + x
+            state ^= table[state >> 28]
+        self._state = state
+
+    @property
+    def value(self):
+        """
+        hash value of all data added so far
+        :return: hash value in form of number
+        """
+        a = self._state
+        b = ((((a * 0x40404081) >> 32) & 0xFFFFFFFF) >> 0x16) * 0xFEFFFF
+        return a - (b & 0xFFFFFFFF)
+
+
+class RecordSequence(Sequence):
+    def __init__(self, data, record_size: int, decoder, indices: range = None):
+        """
+        read only sequence of fixed size records over a buffer, a record is decoded
+        only when it is accessed and slicing does not decode or copy anything
+        :param data: memoryview of the records
+        :param record_size: size of one record in bytes
+        :param decoder: function that converts record bytes into model object
+        :param indices: record numbers visible through this sequence
+        """
+        self._data = data
+        self._record_size = record_size
+        self._decoder = decoder
+        self._indices = range(len(data) // record_size) if indices is None else indices
+
+    def __len__(self):
+        return len(self._indices)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return RecordSequence(self._data, self._record_size, self._decoder, self._indices[index])
+        offset = self._indices[index] * self._record_size
+        return self._decoder(self._data[offset: offset + self._record_size])
+
+    def __iter__(self):
+        for index in self._indices:
+            offset = index * self._record_size
+            yield self._decoder(self._data[offset: offset + self._record_size])
+
+    def __reversed__(self):
+        return iter(self[::-1])
+
+    def __repr__(self):
+        return "<{} of {} records>".format(type(self).__name__, len(self))
+
+
+class RecordStream(object):
+    def __init__(self, record_size: int = 0, leading: int = 4):
+        """
+        split buffer stream chunks into records, a record that straddles two chunks is
+        copied, every other record is returned as memoryview of the chunk
+        :param record_size: size of fixed records, 0 for records that start with their 2 byte length
+        :param leading: number of bytes to skip at the start of the stream (the buffer length)
+        """
+        self._record_size = record_size
+        self._skip = leading
+        self._pending = bytearray()
+
+    def _record_len(self, data, offset: int):
+        if self._record_size:
+            return self._record_size
+        if len(data) - offset < 2:
+            return None
+        size = struct.unpack_from("<H", data, offset)[0]
+        if size < 2:
+            raise Exception("invalid record length in stream")
+        return size
+
+    def feed(self, chunk):
+        """
+        add next chunk of the stream
+        :param chunk: bytes-like object
+        :return: generator of complete records, consume it before the chunk changes
+        """
+        data = memoryview(chunk)
+        offset = min(self._skip, len(data))
+        self._skip -= offset
+        while self._pending:
+            size = self._record_len(self._pending, 0)
+            need = (size if size is not None else 2) - len(self._pending)
+            take = min(need, len(data) - offset)
+            self._pending += data[offset: offset + take]
+            offset += take
+            if take < need:
+                return
+            if size is not None:
+                record = bytes(self._pending)
+                self._pending = bytearray()
+                yield memoryview(record)
+        while offset < len(data):
+            size = self._record_len(data, offset)
+            if size is None or offset + size > len(data):
+                self._pending += data[offset:]
+                return
+            yield data[offset: offset + size]
+            offset += size
+
+    def close(self):
+        """
+        check that the stream did not end in the middle of a record
+        :return:
+        """
+        if self._pending:
+            raise Exception("stream ended inside a record")
 
 
 class DataBuffer(object):
-    def __init__(self, encoding: str, raw_buffer: bytes = None):
+    def __init__(self, encoding: str, raw_buffer: bytes = None, capacity: int = 0):
         """
         initialize network data buffer from raw_buffer
         :param encoding: default encoding
-        :param raw_buffer: data buffer
+        :param raw_buffer: data buffer, it is wrapped without copy until the buffer is modified
+        :param capacity: number of bytes to preallocate for append
         """
-        self._data = raw_buffer or b''
+        self._data = raw_buffer if raw_buffer is not None else bytearray(capacity)
+        self._start = 0
+        self._end = len(raw_buffer) if raw_buffer is not None else 0
         self._encoding = encoding
 
+    def _realloc(self, capacity: int, leading: int = 0):
+        """
+        move data into new bytearray. views returned by data keep the old buffer alive so
+        the buffer is never resized in place
+        :param capacity: minimum size of the new buffer after leading space
+        :param leading: free space to reserve in front of the data
+        :return:
+        """
+        size = len(self)
+        temp = bytearray(leading + max(capacity, size))
+        temp[leading: leading + size] = memoryview(self._data)[self._start: self._end]
+        self._data = temp
+        self._start = leading
+        self._end = leading + size
+
+    def reserve(self, capacity: int):
+        """
+        make room for capacity bytes of data so append will not reallocate
+        :param capacity: total expected data size, usually data_size announced by the device
+        :return:
+        """
+        if not isinstance(self._data, bytearray) or len(self._data) - self._start < capacity:
+            self._realloc(capacity)
+
+    def _add_leading_bytes(self, data: bytes):
+        if not isinstance(self._data, bytearray) or self._start < len(data):
+            self._realloc(len(self), len(data))
+        self._start -= len(data)
+        self._data[self._start: self._start + len(data)] = data
+
     def add_leading_len(self, size: int = 4):
         """
         add length in front of the raw_buffer
@@ -126,7 +375,7 @@ class DataBuffer(object):
             fmt = "<B"
         else:
             fmt = "<I"
-        self._data = struct.pack(fmt, len(self._data)) + self._data
+        self._add_leading_bytes(struct.pack(fmt, len(self)))
     
     def add_leading(self, val: int, size: int = 4):
         """
@@ -141,37 +390,35 @@ class DataBuffer(object):
             fmt = "<B"
         else:
             fmt = "<I"
-        self._data = struct.pack(fmt, val) + self._data
+        self._add_leading_bytes(struct.pack(fmt, val))
 
     def remove_leading(self, size=4):
-        if len(self._data) > size:
-            self._data = self._data[size:]
+        if len(self) > size:
+            self._start += size
 
     def __len__(self):
         """
         return actual length of the internal _data
         :return: internal _data length
         """
-        return len(self._data)
+        return self._end - self._start
 
     @property
     def data(self):
         """
         get internal data
-        :return: internal _data
+        :return: memoryview of internal _data (no copy)
         """
-        return self._data
-        # return self._data[self._start:] if len(self._data) > self._start else []
-        # return self._data[self._input_leading:] if len(self._data) > self._input_leading else []
+        return memoryview(self._data)[self._start: self._end]
 
     def segment(self, offset, size):
         """
         return segment from internal _data as [offset: offset + size]
         :param offset: start of segment
         :param size: length of segment
-        :return: segment of the data in form of bytes
+        :return: segment of the data in form of memoryview
         """
-        return self._data[offset: offset + size]
+        return self.data[offset: offset + size]
         # return bytes(self)[offset: offset + size]
     # @property
     # def attLogs(self):
@@ -183,31 +430,43 @@ class DataBuffer(object):
     def op_logs(self):
         """
         convert internal buffer to segment each segment represent OpLog object
-        :return: list of OpLog object
+        :return: lazy sequence of OpLog object
         """
         if len(self) % 16 > 0:
             return None
-        return [OpLog.from_bytes(x) for x in split_list(self.data, len(self) // 16)]
+        return RecordSequence(self.data, 16, OpLog.from_bytes)
 
     @property
     def att_logs(self):
         """
         convert internal buffer into segments each segment represent AttLog object
-        :return: list of AttLog object
+        :return: lazy sequence of AttLog object
         """
         if len(self) % 40 > 0:
             return None
-        return [AttLog.from_bytes(x, self._encoding) for x in split_list(self.data, len(self) // 40)]
+        encoding = self._encoding
+        return RecordSequence(self.data, 40, lambda x: AttLog.from_bytes(x, encoding))
+
+    @property
+    def att_log_batch(self):
+        """
+        decode internal buffer column wise into AttLogBatch (needs numpy)
+        :return: AttLogBatch object
+        """
+        if len(self) % 40 > 0:
+            return None
+        return AttLogBatch.from_bytes(self.data, self._encoding)
 
     @property
     def users(self):
         """
         convert internal buffer into segments each segment represent UserInfo object
-        :return: list of UserInfo object
+        :return: lazy sequence of UserInfo object
         """
-        if len(self.data) % 72 > 0:
+        if len(self) % 72 > 0:
             return None
-        return [UserInfo.from_bytes(x, self._encoding) for x in split_list(self.data, len(self) // 72)]
+        encoding = self._encoding
+        return RecordSequence(self.data, 72, lambda x: UserInfo.from_bytes(x, encoding))
     
     @property
     def fps(self):
@@ -215,15 +474,7 @@ class DataBuffer(object):
         convert internal buffer into segments each segment represent FpInfo object
         :return: list of FpInfo object
         """
-        index = 0
-        ret = []
-        while index < len(self.data):
-            seg_len = struct.unpack("<H", self.data[index: index + 2])[0]
-            index += 2
-            seg_len -= 2
-            ret.append(FPInfo.from_bytes(self.data[index: index + seg_len]))
-            index += seg_len
-        return ret
+        return FPInfo.from_buffer(self.data)
 
     def append(self, part):
         """
@@ -231,14 +482,19 @@ class DataBuffer(object):
         :param part:
         :return:
         """
-        self._data += part
+        size = len(part)
+        if not isinstance(self._data, bytearray) or self._end + size > len(self._data):
+            # grow geometrically so appending chunks stays linear
+            self._realloc(max(len(self) + size, 2 * len(self)))
+        self._data[self._end: self._end + size] = part
+        self._end += size
 
     def __bytes__(self):
         """
         return internal data buffer
         :return:
         """
-        return self._data
+        return bytes(self.data)
         # return struct.pack("<I", len(self.data)) + self.data
 
     def __hash__(self):
@@ -246,17 +502,4 @@ class DataBuffer(object):
         create hash from data buffer
         :return: hash value in form of number
         """
-        a = 0
-        # for x in bytes(self):
-        for x in self._data:
-            a = (a << 0x4) + x
-            b = a & 0xF0000000
-            if b > 0:
-                c = b >> 0x18
-                if (c & 0x80) > 0:
-                    c = c | 0xFFFFFF00
-                c = c ^ b
-                a = a ^ c
-            a = a & 0xFFFFFFFF
-        b = ((((a * 0x40404081) >> 32) & 0xFFFFFFFF) >> 0x16) * 0xFEFFFF
-        return a - (b & 0xFFFFFFFF) if len(self) > 0 else 0
+        return BufferHash(self.data).value
@@ -0,0 +1,185 @@
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from .fleet import DeviceSpec
+
+
+class _Session(object):
+    def __init__(self, spec: DeviceSpec, timeout: float):
+        self.spec = spec
+        self.device = spec.create(timeout)
+        self.lock = threading.Lock()
+        self.last_used = 0.0
+
+    @property
+    def connected(self):
+        return self.device.connected
+
+    def open(self):
+        self.device.connect(self.spec.comm_key)
+        self.last_used = time.monotonic()
+
+    def close(self):
+        self.device.disconnect()
+
+    def drop(self):
+        """
+        close socket of a broken session without disconnect command
+        """
+        self.device.abort()
+
+
+class SessionPool(object):
+    def __init__(self, keepalive_interval: float = 30, max_idle: float = None, timeout: float = 20):
+        """
+        keep one authenticated session per device open between calls
+        :param keepalive_interval: seconds of inactivity after which a session is checked with ping
+                                   before it is lent and by the keepalive thread
+        :param max_idle: seconds of inactivity after which the keepalive thread closes the session,
+                         None to keep sessions open forever
+        :param timeout: socket timeout of the sessions in seconds
+        """
+        self._keepalive_interval = keepalive_interval
+        self._max_idle = max_idle
+        self._timeout = timeout
+        self._sessions = {}
+        self._sessions_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._logger = logging.getLogger("server")
+
+    @staticmethod
+    def _key(spec: DeviceSpec):
+        return spec.host, spec.port, spec.model, spec.comm_key
+
+    def _session(self, spec: DeviceSpec):
+        key = self._key(spec)
+        with self._sessions_lock:
+            session = self._sessions.get(key)
+            if session is None:
+                session = self._sessions[key] = _Session(spec, self._timeout)
+        return session
+
+    def _prepare(self, session: _Session):
+        """
+        make sure session is connected, idle sessions are checked first and reconnected when dead
+        """
+        if session.connected and time.monotonic() - session.last_used >= self._keepalive_interval:
+            try:
+                session.device.ping()
+            except Exception as ex:
+                self._logger.info("session to {} is dead: {}".format(session.spec, ex))
+                session.drop()
+        if not session.connected:
+            try:
+                session.open()
+            except BaseException:
+                # connect or login failed half way, do not keep the socket for the next borrow
+                session.drop()
+                raise
+
+    @contextmanager
+    def borrow(self, spec: DeviceSpec):
+        """
+        lend the connected device of spec, the device is locked for the caller until the block exits.
+        the session is dropped when the block raises anything (device errors, KeyboardInterrupt, ...) since
+        a reply may still be on the way, so the next borrow starts from a new connection
+        :param spec: the device
+        :return: context manager of connected device
+        """
+        session = self._session(spec)
+        with session.lock:
+            self._prepare(session)
+            try:
+                yield session.device
+            except BaseException:
+                session.drop()
+                raise
+            finally:
+                session.last_used = time.monotonic()
+
+    def run(self, spec: DeviceSpec, operation, *args, retries: int = 1, **kwargs):
+        """
+        run operation with a pooled session, retry on a fresh connection when the socket fails (OSError),
+        other errors are raised at once after the session was dropped
+        :param spec: the device
+        :param operation: name of device method or function that takes the device as first argument
+        :param args: extra arguments of the operation
+        :param retries: number of retries after connection errors
+        :param kwargs: extra keyword arguments of the operation
+        :return: result of the operation
+        """
+        while True:
+            try:
+                with self.borrow(spec) as device:
+                    if callable(operation):
+                        return operation(device, *args, **kwargs)
+                    return getattr(device, operation)(*args, **kwargs)
+            except OSError:
+                if retries <= 0:
+                    raise
+                retries -= 1
+
+    def keepalive(self):
+        """
+        ping every idle session that is not in use, close sessions idle more than max_idle
+        :return:
+        """
+        with self._sessions_lock:
+            sessions = list(self._sessions.values())
+        now = time.monotonic()
+        for session in sessions:
+            if not session.lock.acquire(blocking=False):
+                continue
+            try:
+                if not session.connected:
+                    continue
+                idle = now - session.last_used
+                if self._max_idle is not None and idle >= self._max_idle:
+                    session.close()
+                elif idle >= self._keepalive_interval:
+                    session.device.ping()
+                    session.last_used = time.monotonic()
+            except Exception as ex:
+                self._logger.info("keepalive of {} failed: {}".format(session.spec, ex))
+                session.drop()
+            finally:
+                session.lock.release()
+
+    def _keepalive_loop(self):
+        while not self._stop.wait(self._keepalive_interval / 2):
+            self.keepalive()
+
+    def start(self):
+        """
+        start background thread that keeps the sessions warm
+        :return:
+        """
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._keepalive_loop, name="fpmachine-keepalive", daemon=True)
+            self._thread.start()
+
+    def close(self):
+        """
+        stop keepalive thread and disconnect all sessions
+        :return:
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._sessions_lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for session in sessions:
+            with session.lock:
+                session.close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, _type, value, traceback):
+        self.close()
@@ -0,0 +1,328 @@
+import threading
+import time
+import tracemalloc
+from . import models
+from .network_utils import packet, DataBuffer, BufferHash, RecordStream
+
+# phases of a device operation, time is attributed to the innermost active phase
+PHASES = ("connect", "disable_enable", "send", "wait", "checksum", "hash", "accumulate", "decode", "save_data",
+          "other")
+# device commands measured as a whole, their own sends and waits are not split out
+_COMMAND_PHASES = ("connect", "disable_enable", "save_data")
+# methods that are timed while a profile runs on the calling thread
+_CLASS_PHASES = (
+    (packet, "is_valid", "checksum"),
+    (BufferHash, "update", "hash"),
+    (DataBuffer, "append", "accumulate"),
+    (DataBuffer, "reserve", "accumulate"),
+    (RecordStream, "feed", "accumulate"),
+    # single records are decoded by every path: from_buffer lists, RecordSequence access and iter_* streams
+    (models.UserInfo, "from_bytes", "decode"),
+    (models.AttLog, "from_bytes", "decode"),
+    (models.OpLog, "from_bytes", "decode"),
+    (models.FPInfo, "from_bytes", "decode"),
+    (models.AttLogBatch, "from_bytes", "decode"),
+)
+_DEVICE_PHASES = (
+    ("connect", "connect"),
+    ("disable_device", "disable_enable"),
+    ("enable_device", "disable_enable"),
+    ("save_data", "save_data"),
+)
+
+_local = threading.local()
+_patch_lock = threading.Lock()
+_patch_count = 0
+_originals = []
+
+
+def _timed(phase: str, function):
+    def wrapper(*args, **kwargs):
+        timer = getattr(_local, "timer", None)
+        if timer is None:
+            return function(*args, **kwargs)
+        timer.enter(phase)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            timer.exit()
+    return wrapper
+
+
+def _patch_classes():
+    """
+    time the codec methods while any profile runs, calls from threads without a profile only pay the
+    thread local lookup
+    """
+    global _patch_count
+    with _patch_lock:
+        _patch_count += 1
+        if _patch_count > 1:
+            return
+        for cls, name, phase in _CLASS_PHASES:
+            original = cls.__dict__[name]
+            if isinstance(original, (classmethod, staticmethod)):
+                patched = type(original)(_timed(phase, original.__func__))
+            else:
+                patched = _timed(phase, original)
+            _originals.append((cls, name, original))
+            setattr(cls, name, patched)
+
+
+def _unpatch_classes():
+    global _patch_count
+    with _patch_lock:
+        _patch_count -= 1
+        if _patch_count > 0:
+            return
+        while _originals:
+            cls, name, original = _originals.pop()
+            setattr(cls, name, original)
+
+
+class _ProfiledSocket(object):
+    def __init__(self, sock):
+        """
+        socket of a profiled device, writes count as send and reads as wait
+        """
+        self.socket = sock
+        self.sendall = _timed("send", sock.sendall)
+        self.recv_into = _timed("wait", sock.recv_into)
+        self.recv = _timed("wait", sock.recv)
+        if hasattr(sock, "sendmsg"):
+            self.sendmsg = _timed("send", sock.sendmsg)
+
+    def __getattr__(self, name):
+        return getattr(self.socket, name)
+
+
+class PhaseStats(object):
+    __slots__ = ("seconds", "calls", "net_bytes")
+
+    def __init__(self, seconds=0.0, calls=0, net_bytes=0):
+        """
+        :param seconds: wall time spent in the phase itself
+        :param calls: times the phase was entered
+        :param net_bytes: memory allocated minus memory freed in the phase, only with trace_allocations
+        """
+        self.seconds = seconds
+        self.calls = calls
+        self.net_bytes = net_bytes
+
+    def __repr__(self):
+        return "PhaseStats(seconds={:.6f}, calls={}, net_bytes={})".format(self.seconds, self.calls, self.net_bytes)
+
+
+class ProfileReport(object):
+    def __init__(self):
+        """
+        wall time and allocations of device operations split into PHASES. reports of many calls and
+        many devices are combined with merge, and travel between processes as to_dict/from_dict
+        """
+        self.operations = {}  # operation name -> calls
+        self.devices = set()
+        self.seconds = 0.0
+        self.peak_bytes = None
+        self.phases = {phase: PhaseStats() for phase in PHASES}
+
+    def merge(self, other):
+        """
+        add other report to this one
+        :return: this report
+        """
+        for name, calls in other.operations.items():
+            self.operations[name] = self.operations.get(name, 0) + calls
+        self.devices |= other.devices
+        self.seconds += other.seconds
+        if other.peak_bytes is not None:
+            self.peak_bytes = max(self.peak_bytes or 0, other.peak_bytes)
+        for phase, stats in other.phases.items():
+            own = self.phases.setdefault(phase, PhaseStats())
+            own.seconds += stats.seconds
+            own.calls += stats.calls
+            own.net_bytes += stats.net_bytes
+        return self
+
+    @classmethod
+    def merged(cls, reports):
+        """
+        :param reports: iterable of ProfileReport
+        :return: new report with the sum of reports
+        """
+        result = cls()
+        for report in reports:
+            result.merge(report)
+        return result
+
+    def to_dict(self):
+        return {
+            "operations": dict(self.operations),
+            "devices": sorted(self.devices),
+            "seconds": self.seconds,
+            "peak_bytes": self.peak_bytes,
+            "phases": {phase: {"seconds": stats.seconds, "calls": stats.calls, "net_bytes": stats.net_bytes}
+                       for phase, stats in self.phases.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        report = cls()
+        report.operations = dict(data["operations"])
+        report.devices = set(data["devices"])
+        report.seconds = data["seconds"]
+        report.peak_bytes = data["peak_bytes"]
+        for phase, stats in data["phases"].items():
+            report.phases[phase] = PhaseStats(stats["seconds"], stats["calls"], stats["net_bytes"])
+        return report
+
+    def format(self):
+        """
+        :return: the phases as text table
+        """
+        lines = ["{} on {} device(s), {:.3f} s".format(
+            ", ".join("{} x{}".format(name, calls) for name, calls in sorted(self.operations.items())),
+            len(self.devices), self.seconds)]
+        lines.append("{:<16} {:>10} {:>7} {:>8} {:>12}".format("phase", "seconds", "%", "calls", "net KB"))
+        for phase, stats in sorted(self.phases.items(), key=lambda item: -item[1].seconds):
+            if not stats.calls and not stats.seconds:
+                continue
+            lines.append("{:<16} {:>10.4f} {:>6.1f}% {:>8} {:>12.1f}".format(
+                phase, stats.seconds, 100 * stats.seconds / self.seconds if self.seconds else 0.0, stats.calls,
+                stats.net_bytes / 1024))
+        if self.peak_bytes is not None:
+            lines.append("peak traced memory {:.1f} KB".format(self.peak_bytes / 1024))
+        return "\n".join(lines)
+
+    def __repr__(self):
+        return "ProfileReport(operations={}, seconds={:.6f})".format(self.operations, self.seconds)
+
+
+class _PhaseTimer(object):
+    def __init__(self, report: ProfileReport, trace_allocations: bool):
+        self._report = report
+        self._trace = trace_allocations
+        self._stack = ["other"]
+        self._last_time = time.perf_counter()
+        self._last_memory = tracemalloc.get_traced_memory()[0] if trace_allocations else 0
+
+    def _switch(self):
+        now = time.perf_counter()
+        stats = self._report.phases[self._stack[-1]]
+        stats.seconds += now - self._last_time
+        self._last_time = now
+        if self._trace:
+            memory = tracemalloc.get_traced_memory()[0]
+            stats.net_bytes += memory - self._last_memory
+            self._last_memory = memory
+
+    def enter(self, phase: str):
+        current = self._stack[-1]
+        if current in _COMMAND_PHASES or phase == current:
+            self._stack.append(current)
+            return
+        self._switch()
+        self._report.phases[phase].calls += 1
+        self._stack.append(phase)
+
+    def exit(self):
+        if self._stack[-1] != self._stack[-2]:
+            self._switch()
+        self._stack.pop()
+
+    def finish(self):
+        self._switch()
+
+
+class Profiler(object):
+    def __init__(self, trace_allocations: bool = False):
+        """
+        opt-in profiler of ZMM100_TFT/ZMM220_TFT operations, nothing is patched or timed outside run.
+        records are timed as decode where they are decoded, the lazy sequences of get_users, get_att_logs, ...
+        decode on access so profile e.g. lambda dev: list(dev.get_users()) to include their decode
+        :param trace_allocations: attribute allocated memory to phases with tracemalloc, slows the call
+                                  down several times so compare seconds only between runs with the same setting.
+                                  tracemalloc is process wide, allocations of other threads count too
+        """
+        self._trace_allocations = trace_allocations
+
+    def run(self, device, operation, *args, **kwargs):
+        """
+        run operation on device and measure its phases
+        :param device: ZMM100_TFT or ZMM220_TFT, connected unless the operation connects
+        :param operation: name of device method or function that takes the device as first argument
+        :param args: extra arguments of the operation
+        :param kwargs: extra keyword arguments of the operation
+        :return: tuple of result and ProfileReport
+        """
+        if getattr(_local, "timer", None) is not None:
+            raise Exception("profiler is already running on this thread")
+        name = operation if isinstance(operation, str) else getattr(operation, "__name__", "operation")
+        report = ProfileReport()
+        report.operations[name] = 1
+        report.devices.add(device.address)
+        started_tracing = self._trace_allocations and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        if self._trace_allocations and hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+        _patch_classes()
+        overrides = self._wrap_device(device)
+        timer = _local.timer = _PhaseTimer(report, self._trace_allocations)
+        start = time.perf_counter()
+        try:
+            if isinstance(operation, str):
+                result = getattr(device, operation)(*args, **kwargs)
+            else:
+                result = operation(device, *args, **kwargs)
+        finally:
+            timer.finish()
+            report.seconds = time.perf_counter() - start
+            _local.timer = None
+            self._unwrap_device(device, overrides)
+            _unpatch_classes()
+            if self._trace_allocations:
+                report.peak_bytes = tracemalloc.get_traced_memory()[1]
+            if started_tracing:
+                tracemalloc.stop()
+        return result, report
+
+    @staticmethod
+    def _wrap_device(device):
+        overrides = []
+        for name, phase in _DEVICE_PHASES:
+            overrides.append((name, vars(device).get(name)))
+            setattr(device, name, _timed(phase, getattr(device, name)))
+        connect = device.connect
+
+        def wrapped_connect(*args, **kwargs):
+            try:
+                return connect(*args, **kwargs)
+            finally:
+                # connect opens a new socket
+                Profiler._wrap_socket(device)
+        device.connect = wrapped_connect
+        Profiler._wrap_socket(device)
+        return overrides
+
+    @staticmethod
+    def _wrap_socket(device):
+        if device._socket is not None and not isinstance(device._socket, _ProfiledSocket):
+            device._socket = _ProfiledSocket(device._socket)
+
+    @staticmethod
+    def _unwrap_device(device, overrides):
+        for name, original in overrides:
+            if original is None:
+                vars(device).pop(name, None)
+            else:
+                setattr(device, name, original)
+        if isinstance(device._socket, _ProfiledSocket):
+            device._socket = device._socket.socket
+
+
+def profile(device, operation, *args, trace_allocations: bool = False, **kwargs):
+    """
+    shortcut of Profiler(trace_allocations).run(device, operation, *args, **kwargs)
+    :return: tuple of result and ProfileReport
+    """
+    return Profiler(trace_allocations).run(device, operation, *args, **kwargs)
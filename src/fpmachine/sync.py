@@ -0,0 +1,68 @@
+import json
+import os
+import threading
+from .models import AttLogWatermark
+
+
+class WatermarkStore(object):
+    def __init__(self, path: str):
+        """
+        attendance watermarks of many devices kept in one json file
+        :param path: file name, created on first save
+        """
+        self._path = path
+        self._lock = threading.Lock()
+        self._watermarks = {}
+        if os.path.exists(path):
+            with open(path, "r") as file:
+                self._watermarks = {key: AttLogWatermark.from_dict(value) for key, value in json.load(file).items()}
+
+    def get(self, key: str):
+        """
+        :param key: device key, e.g. "host:port" or serial number
+        :return: AttLogWatermark or None when the device was never synced
+        """
+        with self._lock:
+            return self._watermarks.get(key)
+
+    def set(self, key: str, watermark: AttLogWatermark):
+        """
+        store watermark of the device and write the file, the old file is replaced only after
+        the new one is written completely
+        """
+        with self._lock:
+            self._watermarks[key] = watermark
+            data = {key: value.to_dict() for key, value in self._watermarks.items()}
+            temp_path = self._path + ".tmp"
+            with open(temp_path, "w") as file:
+                json.dump(data, file)
+            os.replace(temp_path, self._path)
+
+
+def sync_att_logs(device, store: WatermarkStore, key: str, disable_device=True):
+    """
+    get attendance logs recorded since the previous sync of the device and advance its watermark.
+    the watermark is saved before the logs are returned, use device.get_new_att_logs and store.set
+    directly to save it after the logs are processed
+    :param device: connected device
+    :param store: WatermarkStore
+    :param key: device key in the store
+    :param disable_device: disable device during the table transfer
+    :return: list of new AttLog
+    """
+    watermark = store.get(key)
+    logs, new_watermark = device.get_new_att_logs(watermark, disable_device)
+    if new_watermark != watermark:
+        store.set(key, new_watermark)
+    return logs
+
+
+async def async_sync_att_logs(device, store: WatermarkStore, key: str, disable_device=True):
+    """
+    asyncio version of sync_att_logs
+    """
+    watermark = store.get(key)
+    logs, new_watermark = await device.get_new_att_logs(watermark, disable_device)
+    if new_watermark != watermark:
+        store.set(key, new_watermark)
+    return logs
@@ -1,5 +1,11 @@
 from datetime import datetime
+from random import randint
 import struct
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 # if segment size > 0x2000 shift to stream
 device_cmd = {
     'read_db': 0x0007,
@@ -110,6 +116,50 @@ device_cmd = {
     'not_support': 0xFFFF
 }
 
+# event flags of reg_event, the device sends the flag of a pushed event in the session key field
+device_event = {
+    'att_log': 0x0001,
+    'finger': 0x0002,
+    'enroll_user': 0x0004,
+    'enroll_finger': 0x0008,
+    'button': 0x0010,
+    'unlock': 0x0020,
+    'verify': 0x0080,
+    'fp_feature': 0x0100,
+    'alarm': 0x0200,
+}
+
+
+def hash_commkey(comm_key: int, secret_key: int):
+    """
+    hash the comm_key with session key and return 4 bytes
+    :param comm_key: connection password
+    :param secret_key: session key received in connect response
+    :return: 4 bytes represent the comm_Key hash
+    """
+    index = 1
+    num = 0
+    for _ in range(0x20):
+        num *= 2
+        num = num & 0xFFFFFFFF
+        if comm_key & index > 0:
+            num = num | 1
+        index = index << 1
+        if index > 0xFFFFFFFF:
+            index = 1
+    num += secret_key
+    # y1 = (num & 0xFF) ^ 0x5A
+    y2 = (num >> 8 & 0xFF) ^ 0x4B
+    y3 = (num >> 16 & 0xFF) ^ 0x53
+    y4 = (num >> 24 & 0xFF) ^ 0x4F
+    y5 = randint(1, 0x100)
+    y2 = y2 ^ y5
+    y3 = y3 ^ y5
+    y4 = y4 ^ y5
+    ret = [y2, y5, y4, y3]
+    ret.reverse()
+    return bytes(ret)
+
 
 def dump(data):
     return [hex(x) for x in data]
@@ -129,27 +179,16 @@ def split_list(alist: bytes, wanted_parts=1):
 def datetime_to_number(dt: datetime):
     """
     convert datetime to number
+    the device counts seconds in a calendar where every month has 31 days starting from 2000-01-01
     :param dt: datetime
     :return: 4 byte number
     """
-    year = dt.year - 2000
-    month = dt.month - 1
-    day = dt.day - 1
-    hour = dt.hour
-    minute = dt.minute
-    second = dt.second
-    temp = year * 12
-    temp = temp + month
-    temp = (temp << 5) - temp
-
-    temp = ((temp + day) * 24) + hour
-    temp = (temp << 4) - temp
+    months = (dt.year - 2000) * 12 + dt.month - 1
+    return ((months * 31 + dt.day - 1) * 86400) + dt.hour * 3600 + dt.minute * 60 + dt.second
 
-    temp = (temp * 4) + minute
-    temp = (temp << 4) - temp
 
-    temp = (temp * 4) + second
-    return temp
+# (year, month, day) of every day number already seen, at most 0xFFFFFFFF // 86400 entries
+_day_table = {}
 
 
 def number_to_datetime(dword_time: int):
@@ -158,36 +197,49 @@ def number_to_datetime(dword_time: int):
     :param dword_time: 4 byte number
     :return: datetime object
     """
-    base_number = dword_time
-    temp1 = ((base_number * 0x88888889) >> 32) & 0xFFFFFFFF
-    temp2 = temp1 >> 5
-    temp3 = temp2 << 4
-    second = base_number - ((temp3 - temp2) * 4)
-    base_number = temp2
-    temp1 = ((base_number * 0x88888889) >> 32) & 0xFFFFFFFF
-    temp2 = temp1 >> 5
-    temp3 = temp2 << 4
-    minute = base_number - ((temp3 - temp2) * 4)
-
-    base_number = temp2
-    temp1 = ((base_number * 0xAAAAAAAB) >> 32) & 0xFFFFFFFF
-    temp2 = temp1 >> 4
-    temp3 = temp2 * 3
-    hour = base_number - (temp3 * 8)
-
-    base_number = temp2
-    temp1 = ((base_number * 0x8421085) >> 32) & 0xFFFFFFFF
-    temp2 = (((base_number - temp1) >> 1) + temp1) >> 4
-    temp3 = temp2 << 5
-    day = base_number - (temp3 - temp2) + 1
-
-    base_number = temp1
-    temp1 = ((base_number * 0xAAAAAAAB) >> 32) & 0xFFFFFFFF
-    temp2 = (temp1 >> 3)
-    temp3 = temp2 * 12
-    month = (base_number - temp3) + 1
-    year = temp2 + 0x7D0
-    return datetime(year, month, day, hour, minute, second)
+    days, seconds = divmod(dword_time, 86400)
+    date = _day_table.get(days)
+    if date is None:
+        months, day = divmod(days, 31)
+        year, month = divmod(months, 12)
+        date = _day_table[days] = (year + 2000, month + 1, day + 1)
+    hour, seconds = divmod(seconds, 3600)
+    minute, second = divmod(seconds, 60)
+    return datetime(date[0], date[1], date[2], hour, minute, second)
+
+
+def numbers_to_datetime64(numbers):
+    """
+    convert array of 4 byte numbers to datetime (vectorized number_to_datetime)
+    invalid dates (like 31 Feb) roll over into the next month instead of raising
+    :param numbers: numpy array (or sequence) of 4 byte numbers
+    :return: numpy array of datetime64[s]
+    """
+    if numpy is None:
+        raise ImportError("numpy is required for array time conversion")
+    numbers = numpy.asarray(numbers, dtype=numpy.uint32).astype(numpy.int64)
+    rest, seconds = numpy.divmod(numbers, 86400)
+    months, day = numpy.divmod(rest, 31)
+    # months are counted from 2000-01 and datetime64 months from 1970-01
+    months = (months + 360).astype("datetime64[M]").astype("datetime64[s]")
+    return months + (day * 86400 + seconds).astype("timedelta64[s]")
+
+
+def datetime64_to_numbers(values):
+    """
+    convert array of datetime to 4 byte numbers (vectorized datetime_to_number)
+    :param values: numpy array (or sequence) of datetime64 or datetime
+    :return: numpy array of uint32
+    """
+    if numpy is None:
+        raise ImportError("numpy is required for array time conversion")
+    values = numpy.asarray(values, dtype="datetime64[s]")
+    days = values.astype("datetime64[D]")
+    months = days.astype("datetime64[M]")
+    seconds = (values - days).astype(numpy.int64)
+    day = (days - months).astype(numpy.int64)
+    months = months.astype(numpy.int64) - 360
+    return ((months * 31 + day) * 86400 + seconds).astype(numpy.uint32)
 
 
 def datetime_to_bytes(dt: datetime):
@@ -208,6 +260,15 @@ def datetime_from_bytes(data: bytes):
     return number_to_datetime(struct.unpack("<I", data)[0])
 
 
+def datetime_from_event_bytes(data: bytes):
+    """
+    convert 6 bytes time of real time events (year - 2000, month, day, hour, minute, second) to datetime
+    :param data: data bytes
+    :return: datetime object
+    """
+    return datetime(2000 + data[0], data[1], data[2], data[3], data[4], data[5])
+
+
 def get_null_term_str(data, encoding):
     """
     extract null terminated string from data
@@ -216,8 +277,55 @@ def get_null_term_str(data, encoding):
     :return: string
     """
     # temp = data[:]
-    if 0 in data:
-        temp = bytes(data[:data.index(0)])
-    else:
-        temp = bytes(data)
+    temp = bytes(data)
+    index = temp.find(0)
+    if index >= 0:
+        temp = temp[:index]
     return temp.decode(encoding)
+
+
+class BatchState(object):
+    def __init__(self):
+        """
+        nesting depth of batch() and the save_data deferred to its end, shared by the blocking and asyncio devices
+        """
+        self.depth = 0
+        self.save_pending = False
+
+    @property
+    def active(self):
+        return self.depth > 0
+
+    def defer_save(self):
+        """
+        :return: True when save_data is deferred to the end of the batch
+        """
+        if self.depth > 0:
+            self.save_pending = True
+        return self.depth > 0
+
+    def enter(self):
+        self.depth += 1
+
+    def leave(self):
+        """
+        :return: None inside a nested batch, else whether save_data is due at the end of the outermost batch
+        """
+        self.depth -= 1
+        if self.depth > 0:
+            return None
+        save, self.save_pending = self.save_pending, False
+        return save
+
+    @staticmethod
+    def cleanup_failed(error, cleanup_error, logger):
+        """
+        handle enable_device/save_data failing at the end of the batch, the error of the batch body wins
+        :param error: exception raised in the batch body, None when it succeeded
+        :param cleanup_error: exception of the cleanup, raised again when the body succeeded
+        :param logger: logger of the device or None
+        """
+        if error is None:
+            raise cleanup_error
+        if logger:
+            logger.error("ending batch after {!r} failed: {}".format(error, cleanup_error))
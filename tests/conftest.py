@@ -0,0 +1,23 @@
+import pytest
+from fpmachine.emulator import Emulator, EmulatedDevice
+from fpmachine.devices import ZMM220_TFT
+
+
+@pytest.fixture
+def emulator():
+    """
+    emulator of a device with a few users and attendance logs
+    """
+    with Emulator(EmulatedDevice.populate(users=5, att_logs=20)) as emu:
+        yield emu
+
+
+@pytest.fixture
+def device(emulator):
+    """
+    client connected to the emulator
+    """
+    dev = ZMM220_TFT("127.0.0.1", emulator.port, "latin-1", timeout=5)
+    dev.connect()
+    yield dev
+    dev.disconnect()
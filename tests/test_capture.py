@@ -0,0 +1,26 @@
+import os
+import time
+from fpmachine.capture import WireCapture, read_capture, SENT, OPENED
+
+
+def test_capture_of_device_session(tmp_path, device):
+    path = str(tmp_path / "wire.fpcap")
+    with WireCapture(path) as capture:
+        device.capture = capture
+        device.get_state(disable_device=False)
+        device.capture = None
+    records = list(read_capture(path))
+    assert records[0].direction == OPENED
+    assert [record.command for record in records if record.direction == SENT] == ["logs_count"]
+
+
+def test_failed_writer_does_not_block_close(tmp_path):
+    capture = WireCapture(os.path.join(str(tmp_path), "missing", "wire.fpcap"), queue_size=2)
+    capture._thread.join(5)
+    for _ in range(5):
+        capture.record(SENT, 1, b"header", b"payload")
+    start = time.monotonic()
+    capture.close()
+    assert time.monotonic() - start < 1
+    assert isinstance(capture.error, OSError)
+    assert capture.dropped == 5
@@ -0,0 +1,110 @@
+import asyncio
+import pytest
+from fpmachine.async_devices import AsyncZMM220_TFT
+from fpmachine.emulator import _EmulatorSession
+from fpmachine.instrumentation import InMemoryCollector
+from fpmachine.devices import TABLE_UPLOAD_SIZE
+from fpmachine.models import FPInfo, UserInfo
+
+
+def _count(collector, device, command):
+    stats = collector.commands(device.address).get((device.address, command))
+    return stats.count if stats is not None else 0
+
+
+def test_batch_saves_when_an_operation_fails(device):
+    collector = device.collector = InMemoryCollector()
+    with pytest.raises(ValueError):
+        with device.batch():
+            device.save_data()
+            raise ValueError("operation")
+    assert _count(collector, device, "save_data") == 1
+    assert _count(collector, device, "enable") == 1
+
+
+def test_batch_keeps_error_of_the_operation(device):
+    def enable_device():
+        raise OSError("enable")
+    device.enable_device = enable_device
+    with pytest.raises(ValueError):
+        with device.batch():
+            raise ValueError("operation")
+    with pytest.raises(OSError):
+        with device.batch():
+            pass
+
+
+def test_async_batch_keeps_error_of_the_operation(emulator):
+    async def run():
+        device = AsyncZMM220_TFT("127.0.0.1", emulator.port, "latin-1", timeout=5)
+        await device.connect()
+
+        async def enable_device():
+            raise OSError("enable")
+        try:
+            with pytest.raises(ValueError):
+                async with device.batch():
+                    device.enable_device = enable_device
+                    raise ValueError("operation")
+        finally:
+            device.abort()
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize("table_upload", [True, False])
+def test_set_fps_keeps_enabled_flags(emulator, device, table_upload):
+    emulator.table_upload = table_upload
+    fp_infos = [FPInfo(user_id, 1, 3 if user_id % 2 else 1, bytes([user_id]) * 300) for user_id in range(1, 6)]
+    device.set_fps(iter(fp_infos))
+    stored = emulator.device.fps
+    assert {(fp_info.user_id, stored[(fp_info.user_id, 1)].enabled) for fp_info in fp_infos} == \
+        {(fp_info.user_id, fp_info.enabled) for fp_info in fp_infos}
+    assert all(stored[(fp_info.user_id, 1)].data == fp_info.data for fp_info in fp_infos)
+
+
+def test_set_fps_writes_nothing_after_a_hash_mismatch(emulator, device, monkeypatch):
+    monkeypatch.setattr(_EmulatorSession, "_on_check_hash", lambda self, request: self._reply(request, payload=b"\0" * 4))
+    emulator.device.fps.clear()
+    with pytest.raises(Exception, match="problem in data sending"):
+        device.set_fps([FPInfo(1, 1, 1, b"a" * 300), FPInfo(2, 1, 1, b"b" * 300)], table_upload=False)
+    assert emulator.device.fps == {}
+
+
+def test_new_att_logs_of_the_same_second(emulator, device):
+    logs, watermark = device.get_new_att_logs()
+    assert len(logs) == 20
+    emulator.device.punch("1001")
+    logs, watermark = device.get_new_att_logs(watermark)
+    assert [log.person_id for log in logs] == ["1001"]
+    assert device.get_new_att_logs(watermark)[0] == []
+
+
+def test_async_with_connects(emulator):
+    async def run():
+        async with AsyncZMM220_TFT("127.0.0.1", emulator.port, "latin-1", timeout=5) as device:
+            assert (await device.get_state()).user_count == 5
+        assert not device._connected
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize("table_upload", [True, False])
+def test_set_users_uploads_tables_of_stream_size(emulator, device, monkeypatch, table_upload):
+    emulator.table_upload = table_upload
+    sizes = []
+    on_content = _EmulatorSession._on_recv_buff_content
+
+    def recv_buff_content(self, request):
+        sizes.append(len(request.payload))
+        return on_content(self, request)
+    monkeypatch.setattr(_EmulatorSession, "_on_recv_buff_content", recv_buff_content)
+    new_users = []
+    for serial in range(1, 2001):
+        user = UserInfo("latin-1")
+        user.id = serial
+        user.name = "user {}".format(serial)
+        user.person_id = str(5000 + serial)
+        new_users.append(user)
+    device.set_users(iter(new_users))
+    assert max(sizes) <= TABLE_UPLOAD_SIZE
+    assert len(emulator.device.users) == 2000
+    assert emulator.device.users[2000].person_id == "7000"
@@ -0,0 +1,15 @@
+from fpmachine.utils import device_cmd
+
+
+def test_malformed_request_gets_nak(device):
+    device.send_cmd("get_face", b"", ["nak"])
+    assert device._response.cmd == device_cmd["nak"]
+    # the session survives the malformed request
+    assert device.get_state().user_count == 5
+
+
+def test_round_trips_of_pipelined_batch(emulator, device):
+    emulator.reset_stats()
+    device.send_cmds([("get_time", b"")] * 10)
+    assert emulator.stats["requests"] == 10
+    assert emulator.stats["round_trips"] == 1
@@ -0,0 +1,24 @@
+import socket
+import time
+from fpmachine.fleet import DeviceSpec, poll
+
+
+def test_poll_close_does_not_wait_for_running_devices(emulator):
+    # accepts connections and never replies
+    silent = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    silent.bind(("127.0.0.1", 0))
+    silent.listen(8)
+    try:
+        specs = [DeviceSpec("127.0.0.1", emulator.port)] + [DeviceSpec("127.0.0.1", silent.getsockname()[1])] * 3
+        results = poll(specs, "get_state", max_workers=2, timeout=2)
+        assert next(results).ok
+        start = time.monotonic()
+        results.close()
+        assert time.monotonic() - start < 1
+    finally:
+        silent.close()
+
+
+def test_poll_returns_every_device(emulator):
+    specs = [DeviceSpec("127.0.0.1", emulator.port)] * 3
+    assert [result.result.user_count for result in poll(specs, "get_state")] == [5, 5, 5]
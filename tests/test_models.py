@@ -0,0 +1,49 @@
+import struct
+from fpmachine.models import AttLog, AttLogWatermark, RealTimeEvent
+from fpmachine.utils import device_event
+
+
+def _log(person_id, time, serial):
+    log = AttLog()
+    log.person_id = person_id
+    log._time = time
+    log.serial = serial
+    return log
+
+
+def test_watermark_keeps_record_of_the_same_second():
+    watermark = AttLogWatermark.from_logs([_log("1", 10, 1), _log("2", 20, 2)])
+    # table was cleared and refilled past the old count, one new record shares the last second
+    logs = [_log("9", 5, 9), _log("2", 20, 2), _log("3", 20, 3), _log("4", 30, 4)]
+    assert [log.person_id for log in watermark.new_logs(logs)] == ["3", "4"]
+
+
+def test_watermark_tail_of_grown_table():
+    logs = [_log("1", 10, 1), _log("2", 20, 2)]
+    watermark = AttLogWatermark.from_logs(logs)
+    assert [log.person_id for log in watermark.new_logs(logs + [_log("3", 30, 3)])] == ["3"]
+
+
+def test_watermark_reset_when_table_shrinks():
+    watermark = AttLogWatermark.from_logs([_log("1", 10, 1), _log("2", 20, 2), _log("3", 30, 3)])
+    logs = [_log("7", 1, 7)]
+    assert [log.person_id for log in watermark.new_logs(logs)] == ["7"]
+
+
+def test_watermark_dict_round_trip():
+    watermark = AttLogWatermark.from_logs([_log("1", 20, 1), _log("2", 20, 2)])
+    assert AttLogWatermark.from_dict(watermark.to_dict()) == watermark
+    assert AttLogWatermark.from_dict({"count": 1, "last_time": 3, "last_person_id": "x"}).last_keys == frozenset()
+
+
+def test_watermark_is_hashable():
+    logs = [_log("1", 20, 1), _log("2", 20, 2)]
+    assert len({AttLogWatermark.from_logs(logs), AttLogWatermark.from_logs(logs)}) == 1
+
+
+def test_real_time_event_with_impossible_date():
+    data = struct.pack("<24sBB6s", b"1001", 1, 0, bytes((20, 13, 40, 25, 0, 0)))
+    events = RealTimeEvent.from_bytes(device_event["att_log"], data, "latin-1")
+    assert len(events) == 1
+    assert events[0].att_log.person_id == "1001"
+    assert events[0].att_log.att_time is None
@@ -0,0 +1,38 @@
+import pytest
+from fpmachine.emulator import Emulator, EmulatedDevice
+from fpmachine.fleet import DeviceSpec
+from fpmachine.pool import SessionPool
+
+
+@pytest.fixture
+def locked_emulator():
+    with Emulator(EmulatedDevice.populate(users=3, comm_key=5)) as emu:
+        yield emu
+
+
+def test_failed_connect_drops_session(locked_emulator):
+    spec = DeviceSpec("127.0.0.1", locked_emulator.port, comm_key=4)
+    with SessionPool(timeout=5) as pool:
+        with pytest.raises(Exception):
+            pool.run(spec, "get_state")
+        session = pool._session(spec)
+        assert not session.connected
+        assert session.device._socket is None
+
+
+def test_run_retries_only_connection_errors(locked_emulator):
+    spec = DeviceSpec("127.0.0.1", locked_emulator.port, comm_key=5)
+    calls = []
+
+    def fail_once(device, error):
+        calls.append(error)
+        if len(calls) == 1:
+            raise error
+        return device.get_state().user_count
+    with SessionPool(timeout=5) as pool:
+        assert pool.run(spec, fail_once, ConnectionError("closed")) == 3
+        del calls[:]
+        with pytest.raises(ValueError):
+            pool.run(spec, fail_once, ValueError("device"))
+        assert len(calls) == 1
+        assert not pool._session(spec).connected
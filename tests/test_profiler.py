@@ -0,0 +1,16 @@
+from fpmachine.profiler import Profiler
+
+
+def test_decode_of_streamed_records(device):
+    logs, report = Profiler().run(device, lambda dev: list(dev.iter_att_logs()))
+    assert len(logs) == 20
+    assert report.phases["decode"].calls == 20
+
+
+def test_decode_of_lazy_sequence(device):
+    users, report = Profiler().run(device, lambda dev: list(dev.get_users()))
+    assert len(users) == 5
+    assert report.phases["decode"].calls == 5
+    # not accessed inside the call, nothing decoded
+    _, report = Profiler().run(device, "get_users")
+    assert report.phases["decode"].calls == 0